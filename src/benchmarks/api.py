@@ -0,0 +1,338 @@
+"""
+Benchmarks the hot REST API endpoints against a local database.
+
+Seeds a dataset with 'flask db seed' and 'flask db seed-scale', then sends a fixed number of
+requests to each endpoint and reports the p50/p95/p99 latency, the requests per second and
+the SQL queries per request. Requests go through the Flask test client, or with --server
+through a local WSGI server with --concurrency client threads. Query counts are always
+taken from the warm-up requests sent through the test client.
+
+The results can be written to a JSON file and compared with an earlier run: any endpoint
+whose p95 latency or throughput is worse by more than the threshold, or which runs more
+queries per request, is reported as a regression and the exit status is 1.
+
+Seeding drops every table of the database first. The default database is a SQLite file in
+the temporary directory; pass --skip-seed to benchmark an existing dataset instead.
+
+Usage (from the src directory):
+    python -m benchmarks.api --blogs 20000 --likes 200000 --output before.json
+    python -m benchmarks.api --compare before.json --threshold 0.1
+    python -m benchmarks.api --database postgresql+psycopg2://... --server --concurrency 8
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# User the benchmark logs in as, created by 'flask db seed'
+EMAIL = "john@email.com"
+PASSWORD = "abc123"
+
+
+class Endpoint:
+    """
+    One benchmarked request.
+
+    Args:
+        name (str): The name the results are reported under.
+        method (str): The HTTP method.
+        path (callable): Called with the request number, returns the URL.
+        body (callable): Called with the request number, returns the JSON body, if any.
+        statuses (tuple): The status codes that count as a success.
+        auth (bool): Send the access token.
+    """
+    def __init__(self, name, method, path, body=None, statuses=(200,), auth=True):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.statuses = statuses
+        self.auth = auth
+
+
+def make_endpoints(context):
+    hot_blog = context["hot_blog"]
+    blog_ids = context["blog_ids"]
+    return [
+        Endpoint("blogs_status", "GET", lambda i: "/blogs/status/published?limit=20"),
+        Endpoint("comments_blog", "GET", lambda i: f"/comments/blogs/{hot_blog}?limit=20"),
+        # Every like is removed again by likes_remove, so the dataset is left as it was
+        Endpoint("likes_add", "POST", lambda i: "/likes/", lambda i: {"blog_id": blog_ids[i % len(blog_ids)]}, (201, 202)),
+        Endpoint("likes_remove", "DELETE", lambda i: "/likes/", lambda i: {"blog_id": blog_ids[i % len(blog_ids)]}, (200, 202)),
+        Endpoint("auth_login", "POST", lambda i: "/auth/login", lambda i: {"email": EMAIL, "password": PASSWORD}, auth=False),
+        Endpoint("categories", "GET", lambda i: "/categories/?summary=false"),
+        Endpoint("categories_summary", "GET", lambda i: "/categories/"),
+    ]
+
+
+def percentile(values, share):
+    # Nearest-rank percentile of sorted values
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def summarise(latencies, elapsed, errors, queries):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "max_queries": max(queries) if queries else None,
+    }
+
+
+class TestClientTransport:
+    def __init__(self, app, token):
+        self.client = app.test_client()
+        self.token = token
+
+    def send(self, endpoint, i):
+        headers = {"Authorization": f"Bearer {self.token}"} if endpoint.auth else {}
+        response = self.client.open(endpoint.path(i), method=endpoint.method, headers=headers,
+                                    json=endpoint.body(i) if endpoint.body else None)
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class ServerTransport:
+    def __init__(self, app, token):
+        from werkzeug.serving import make_server
+
+        # The server's access log would drown out the results
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self.token = token
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def send(self, endpoint, i):
+        headers = {"Content-Type": "application/json"}
+        if endpoint.auth:
+            headers["Authorization"] = f"Bearer {self.token}"
+        data = json.dumps(endpoint.body(i)).encode("utf-8") if endpoint.body else None
+        request = urllib.request.Request(self.base + endpoint.path(i), data=data, headers=headers, method=endpoint.method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as err:
+            return err.code
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_endpoint(endpoint, warmup, transport, requests, concurrency, counter):
+    # Warm-up requests go through the test client, one at a time, so queries can be counted
+    queries = []
+    for i in range(requests["warmup"]):
+        before = counter["queries"]
+        warmup.send(endpoint, i)
+        queries.append(counter["queries"] - before)
+
+    offset = requests["warmup"]
+    errors = 0
+    latencies = []
+
+    def timed(i):
+        started = time.perf_counter()
+        status = transport.send(endpoint, offset + i)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(timed, range(requests["count"])))
+    else:
+        outcomes = [timed(i) for i in range(requests["count"])]
+    elapsed = time.perf_counter() - started
+
+    for latency, status in outcomes:
+        latencies.append(latency)
+        if status not in endpoint.statuses:
+            errors += 1
+    return summarise(latencies, elapsed, errors, queries)
+
+
+def seed(app, args):
+    runner = app.test_cli_runner()
+    commands = [
+        ["db", "drop"],
+        ["db", "create"],
+        ["db", "seed"],
+        ["db", "seed-scale", "--users", str(args.users), "--blogs", str(args.blogs), "--likes", str(args.likes),
+         "--comments", str(args.comments), "--seed", str(args.seed)],
+    ]
+    for command in commands:
+        result = runner.invoke(args=command)
+        if result.exception:
+            raise SystemExit(f"'flask {' '.join(command)}' failed: {result.exception}")
+        print(result.output.strip(), file=sys.stderr)
+
+
+def load_context(app, count):
+    from sqlalchemy import select
+    from init import db
+    from models.blog import Blogs
+
+    with app.app_context():
+        hot_blog = db.session.execute(select(Blogs.blog_id).order_by(Blogs.like_count.desc()).limit(1)).scalar()
+        # Blogs the benchmark user has not liked, for likes_add and likes_remove
+        blog_ids = list(db.session.execute(select(Blogs.blog_id).order_by(Blogs.blog_id.desc()).limit(count)).scalars())
+    if hot_blog is None:
+        raise SystemExit("The database has no blogs, run without --skip-seed")
+    return {"hot_blog": hot_blog, "blog_ids": blog_ids}
+
+
+def git_commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, threshold):
+    """
+    Compares two benchmark results.
+
+    Args:
+        baseline (dict): The earlier results.
+        results (dict): The new results.
+        threshold (float): The relative slowdown tolerated, e.g. 0.1 for 10%.
+
+    Returns:
+        list: A description of each regression, empty if there are none.
+    """
+    regressions = []
+    for key in ("database", "mode", "dataset"):
+        if baseline["meta"].get(key) != results["meta"].get(key):
+            print(f"Warning: the runs differ in {key}, {baseline['meta'].get(key)} -> {results['meta'].get(key)}")
+    print(f"{'endpoint':<20} {'p95 ms':>18} {'req/s':>18} {'queries':>12}")
+    for name, new in results["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+        print(f"{name:<20} {old['p95_ms']:>8} -> {new['p95_ms']:<8} {old['rps']:>8} -> {new['rps']:<8} "
+              f"{old['queries_per_request']!s:>5} -> {new['queries_per_request']!s:<5}")
+        if new["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {old['p95_ms']}ms -> {new['p95_ms']}ms")
+        if new["rps"] < old["rps"] * (1 - threshold):
+            regressions.append(f"{name}: {old['rps']} -> {new['rps']} req/s")
+        if old["queries_per_request"] is not None and (new["queries_per_request"] or 0) > old["queries_per_request"]:
+            regressions.append(f"{name}: {old['queries_per_request']} -> {new['queries_per_request']} queries per request")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=os.environ.get("BENCHMARK_DATABASE_URI"),
+                        help="Database URI. Defaults to a SQLite file in the temporary directory.")
+    parser.add_argument("--skip-seed", action="store_true", help="Benchmark the existing data instead of seeding.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--blogs", type=int, default=10000)
+    parser.add_argument("--likes", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=30000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint.")
+    parser.add_argument("--login-requests", type=int, default=20, help="Timed requests for auth_login, which runs bcrypt.")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per endpoint, used to count queries.")
+    parser.add_argument("--endpoints", nargs="*", help="Only run these endpoints.")
+    parser.add_argument("--server", action="store_true", help="Send the timed requests to a local WSGI server.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Client threads, with --server.")
+    parser.add_argument("--output", help="File to write the JSON results to.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression.")
+    args = parser.parse_args()
+
+    database = args.database or "sqlite:///" + os.path.join(tempfile.gettempdir(), "blogger-benchmark.db")
+    os.environ["DATABASE_URI"] = database
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-of-32-bytes!")
+
+    from sqlalchemy import event
+    from init import db
+    from main import create_app
+
+    app = create_app()
+    if not args.skip_seed:
+        seed(app, args)
+
+    counter = {"queries": 0}
+
+    def count_query(*args):
+        counter["queries"] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count_query)
+
+    context = load_context(app, args.warmup + max(args.requests, args.login_requests))
+    login = app.test_client().post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+    if login.status_code != 200:
+        raise SystemExit(f"Could not log in as {EMAIL}: {login.get_data(as_text=True)}")
+    token = login.json["access_token"]
+
+    warmup = TestClientTransport(app, token)
+    transport = ServerTransport(app, token) if args.server else warmup
+    concurrency = args.concurrency if args.server else 1
+
+    endpoints = {}
+    try:
+        for endpoint in make_endpoints(context):
+            if args.endpoints and endpoint.name not in args.endpoints:
+                continue
+            count = args.login_requests if endpoint.name == "auth_login" else args.requests
+            requests = {"warmup": args.warmup, "count": count}
+            endpoints[endpoint.name] = run_endpoint(endpoint, warmup, transport, requests, concurrency, counter)
+            result = endpoints[endpoint.name]
+            print(f"{endpoint.name:<20} p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  "
+                  f"p99 {result['p99_ms']:>8}ms  {result['rps']:>8} req/s  {result['queries_per_request']} queries  "
+                  f"{result['errors']} errors")
+    finally:
+        transport.close()
+
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "database": database.split(":", 1)[0],
+            "mode": f"server x{concurrency}" if args.server else "test client",
+            "dataset": None if args.skip_seed else {
+                "users": args.users, "blogs": args.blogs, "likes": args.likes, "comments": args.comments, "seed": args.seed,
+            },
+            "python": platform.python_version(),
+        },
+        "endpoints": endpoints,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, results, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
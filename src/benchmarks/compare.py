@@ -0,0 +1,37 @@
+"""
+Compares two JSON result files written by benchmarks.api.
+
+Reports the p95 latency, throughput and queries per request of each endpoint in both runs,
+and exits with status 1 if any endpoint regressed by more than the threshold.
+
+Usage (from the src directory):
+    python -m benchmarks.compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.api import compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.results) as file:
+        results = json.load(file)
+
+    regressions = compare(baseline, results, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
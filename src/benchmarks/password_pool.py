@@ -0,0 +1,70 @@
+"""
+Measures password verification throughput for different password hasher pool sizes.
+
+Simulates a burst of logins: a fixed number of request threads each verify passwords
+as fast as they can for a few seconds. For every pool size the number of successful
+verifications per second and the number of requests shed with PasswordHasherBusy
+are reported.
+
+Usage (from the src directory):
+    python -m benchmarks.password_pool --sizes 0 1 2 4 8 --threads 32 --seconds 5
+"""
+import argparse
+import os
+import threading
+import time
+
+from password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+def run(pool_size, threads, seconds, rounds, queue_limit):
+    hasher = PasswordHasher(pool_size, queue_limit, rounds)
+    password_hash = hasher.hash("password123")
+    # Warm up the worker processes before measuring
+    for _ in range(max(pool_size, 1)):
+        hasher.check(password_hash, "password123")
+
+    counts = {"ok": 0, "shed": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        while time.perf_counter() < deadline:
+            try:
+                hasher.check(password_hash, "password123")
+                result = "ok"
+            except PasswordHasherBusy:
+                result = "shed"
+                time.sleep(0.001)
+            with lock:
+                counts[result] += 1
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+
+    return counts["ok"] / elapsed, counts["shed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--queue-limit", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'pool size':>10} {'logins/s':>10} {'shed':>8}")
+    for size in args.sizes:
+        throughput, shed = run(size, args.threads, args.seconds, args.rounds, args.queue_limit)
+        print(f"{size:>10} {throughput:>10.1f} {shed:>8}")
+
+
+if __name__ == "__main__":
+    main()
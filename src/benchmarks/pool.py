@@ -0,0 +1,106 @@
+"""
+Load tests an endpoint with different connection pool sizes.
+
+For every pool size a fresh app is created with DB_POOL_SIZE set to it (and no overflow),
+served by a local threaded WSGI server, and loaded by a fixed number of client threads for a
+few seconds. The throughput, latency, pool timeouts and mean wait for a connection are
+reported for each size, which shows where adding connections stops paying off.
+
+The database must already hold data, e.g. from a run of benchmarks.api, 'flask db seed' or
+'flask db seed-scale'.
+
+Usage (from the src directory):
+    python -m benchmarks.pool --sizes 1 2 5 10 20 --threads 32 --seconds 10
+    python -m benchmarks.pool --database postgresql+psycopg2://... --endpoint comments_blog
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.api import EMAIL, PASSWORD, ServerTransport, load_context, make_endpoints, summarise
+
+
+def pool_wait(metrics):
+    # Total wait and number of checkouts of the default pool so far
+    entry = metrics.collect().get(("db_pool_wait_seconds", ("default",)))
+    return (entry[1], entry[2]) if entry else (0.0, 0)
+
+
+def run(size, args):
+    os.environ["DB_POOL_SIZE"] = str(size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+
+    from db_pool import InstrumentedQueuePool
+    from main import create_app
+    from metrics import metrics
+
+    app = create_app()
+    context = load_context(app, 1)
+    endpoint = next(endpoint for endpoint in make_endpoints(context) if endpoint.name == args.endpoint)
+    login = app.test_client().post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+    transport = ServerTransport(app, login.json["access_token"])
+
+    timeouts_before = InstrumentedQueuePool.timeouts.get("default", 0)
+    wait_before, checkouts_before = pool_wait(metrics)
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = transport.send(endpoint, 0)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if status not in endpoint.statuses:
+                    errors.append(status)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    transport.close()
+
+    wait, checkouts = pool_wait(metrics)
+    result = summarise(latencies, elapsed, len(errors), [])
+    result["pool_timeouts"] = InstrumentedQueuePool.timeouts.get("default", 0) - timeouts_before
+    checkouts -= checkouts_before
+    result["mean_wait_ms"] = round((wait - wait_before) / checkouts * 1000, 3) if checkouts else 0.0
+
+    with app.app_context():
+        from init import db
+        db.engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=os.environ.get("BENCHMARK_DATABASE_URI"),
+                        help="Database URI. Defaults to the SQLite file used by benchmarks.api.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--threads", type=int, default=32, help="Concurrent client threads.")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--pool-timeout", type=int, default=5, help="Seconds a request waits for a connection.")
+    parser.add_argument("--endpoint", default="blogs_status", help="Endpoint name from benchmarks.api.")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URI"] = args.database or "sqlite:///" + os.path.join(tempfile.gettempdir(), "blogger-benchmark.db")
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-of-32-bytes!")
+    # Query logging and budgets would only add noise under load
+    os.environ.setdefault("SQL_STATS_ENABLED", "false")
+
+    print(f"{'pool':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'wait ms':>9} {'timeouts':>9} {'errors':>7}")
+    for size in args.sizes:
+        result = run(size, args)
+        print(f"{size:>5} {result['rps']:>9} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+              f"{result['mean_wait_ms']:>9} {result['pool_timeouts']:>9} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by LRUCache.get when a key is missing or expired
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, in-process cache with a size limit and an expiry time per entry.
+
+    When the cache is full the least recently used entry is evicted. Hits and misses
+    are counted so the effectiveness of the cache can be monitored.
+
+    Args:
+        maxsize (int): The maximum number of entries to keep.
+        ttl (float): The number of seconds an entry stays valid.
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize=None, ttl=None):
+        """
+        Changes the size limit and/or expiry time, e.g. from the app config.
+        """
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, key, default=MISSING):
+        """
+        Returns the cached value for a key, or the default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes a key from the cache if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the size and hit/miss counters of the cache.
+
+        Returns:
+            dict: The number of entries, size limit, hits, misses and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Role names of each user, as user_id: frozenset of role names
+role_cache = LRUCache(maxsize=10000, ttl=60)
+# Role version of each user, checked against the version in their JWT
+role_version_cache = LRUCache(maxsize=10000, ttl=30)
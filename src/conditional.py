@@ -0,0 +1,92 @@
+import hashlib
+import json
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+def make_etag(*values):
+    """
+    Builds an ETag from the values that identify a version of a resource.
+
+    Args:
+        *values: Values that change whenever the representation changes, e.g. a row's
+            primary key and updated_at timestamp.
+
+    Returns:
+        str: A hex digest of the values.
+    """
+    payload = json.dumps(values, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _as_utc(value):
+    # Timestamps are stored as naive UTC datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Checks the request's conditional headers against the current version of a resource.
+
+    If-None-Match takes precedence; If-Modified-Since is only used when it is absent.
+
+    Args:
+        etag (str): The current ETag of the resource.
+        last_modified (datetime): When the resource last changed, if known.
+
+    Returns:
+        bool: True if the client's copy is still current.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        return _as_utc(last_modified).replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(version):
+    """
+    Decorator adding ETag/Last-Modified headers and 304 responses to a GET route.
+
+    The version function is called with the route's URL arguments and runs a cheap query
+    for the values that change whenever the response would change. If the client already
+    has that version, a 304 is returned without calling the route, so the rows are not
+    loaded or serialised. Place it below @jwt_required() and above any response cache.
+
+    Args:
+        version (callable): Returns a (values, last_modified) tuple for the resource, or None
+            if it does not exist, in which case the route is called to produce its 404.
+            last_modified is None unless some timestamp moves with every change to the
+            response; no Last-Modified header is sent then.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            current = version(**kwargs)
+            if current is None:
+                return fn(*args, **kwargs)
+
+            values, last_modified = current
+            # The query string is part of the ETag since it selects a page of a collection
+            etag = make_etag(request.endpoint, *values, request.query_string.decode("utf-8"))
+
+            if is_not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = _as_utc(last_modified)
+            # Clients may keep the response but must revalidate it before reuse
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
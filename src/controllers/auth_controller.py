@@ -4,8 +4,12 @@ from flask import Blueprint, request, jsonify
 
 from models.user import User, user_schema, users_schema,  UserSchema
 from models.roles import Role
-from init import bcrypt, db
-from utils import admin_required
+from models.comments import Comments
+from init import db
+from password_hasher import PasswordHasherBusy
+from utils import admin_required, role_claims, current_user_has_role, invalidate_role_caches, bump_comments_version
+from loaders import FieldsetError, get_fieldset, sparse_schema, project
+from response_cache import response_cache
 
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
@@ -25,11 +29,13 @@ def register_user():
     Expects a JSON request body with 'username', 'email', and 'password'.
     Automatically assigns the user 'Author' and 'Reader' roles.
     Returns a success message, the registered user's data, and a JWT token on successful registration.
+    The token carries the user's roles as claims.
     
     Returns:
         - 201 on success with user data and token.
         - 409 if the email is already registered.
         - 400 if there are database constraint violations (e.g., unique or not-null violations).
+        - 503 if the server is too busy hashing passwords.
         - 500 for any other server errors.
     """
     try:
@@ -61,7 +67,11 @@ def register_user():
         result = user_schema.dump(new_user)
 
         # Generate a JWT token for the new user
-        access_token = create_access_token(identity=new_user.user_id, expires_delta=timedelta(days=1))
+        access_token = create_access_token(
+            identity=new_user.user_id,
+            additional_claims=role_claims(new_user),
+            expires_delta=timedelta(days=1)
+        )
 
         return jsonify({'message': 'User registered successfully!', 'user': result, 'access_token': access_token}), 201
     
@@ -73,6 +83,8 @@ def register_user():
             # unique violation
             return {"error": "Email address must be unique"}, 400
         
+    except PasswordHasherBusy:
+        return {"error": "Server is busy, please try again"}, 503
     except Exception as e:
         return {"error": str(e)}, 500
     
@@ -83,12 +95,13 @@ def login_user():
     Authenticates a user and provides a JWT token if the credentials are valid.
 
     Expects a JSON request body with 'email' and 'password'.
-    Returns a JWT token on successful login.
+    Returns a JWT token on successful login, carrying the user's roles as claims.
 
     Returns:
         - 200 on successful login with JWT token.
         - 400 if the email or password is not provided.
         - 401 if the credentials are incorrect.
+        - 503 if the server is too busy checking passwords.
         - 500 for any other server errors.
     """
     try:
@@ -104,9 +117,13 @@ def login_user():
         user = db.session.scalar(stmt)
 
         # If the user exists and the password is correct
-        if user and bcrypt.check_password_hash(user.password_hash, body_data.get("password")):
+        if user and user.check_password(body_data.get("password")):
             # Create the JWT
-            access_token = create_access_token(identity=user.user_id, expires_delta=timedelta(days=1))
+            access_token = create_access_token(
+                identity=user.user_id,
+                additional_claims=role_claims(user),
+                expires_delta=timedelta(days=1)
+            )
             # Responce
             return jsonify({
                 'message': 'User login successfully!', 
@@ -116,6 +133,8 @@ def login_user():
         else:
             return jsonify({'message': 'Invalid email or password'}), 401
 
+    except PasswordHasherBusy:
+        return jsonify({"error": "Server is busy, please try again"}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -126,22 +145,27 @@ def get_users():
     """
     Retrieves a list of all registered users.
 
-    Requires admin privileges and a valid JWT token.
+    Requires admin privileges and a valid JWT token. A comma separated 'fields' query
+    parameter returns (and loads) only those fields.
 
     Returns:
         - 200 on success with a list of all users.
+        - 400 if the fields are invalid.
     """
     try:
-        # Use session.execute with the select() construct
-        stmt = select(User)
+        # Use session.execute with the select() construct, loading only the requested fields
+        fieldset = get_fieldset(users_schema)
+        stmt = project(select(User), User, users_schema, fieldset)
         users = db.session.execute(stmt).scalars().all()
         
         # Serialise the list of users
-        result = users_schema.dump(users)
+        result = sparse_schema(users_schema, fieldset).dump(users)
         return jsonify(result), 200
     
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
+    except FieldsetError as err:
+        return jsonify({"error": str(err)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -163,6 +187,7 @@ def update_user():
         - 403 if the old password is incorrect.
         - 404 if the user is not found.
         - 409 if the new email is already in use by another user.
+        - 503 if the server is too busy hashing passwords.
         - 500 for any other server errors.
     """
     try:
@@ -181,6 +206,8 @@ def update_user():
         # Update the users fields if provided
         if "username" in body_data:
             user.username = body_data["username"]
+            # The comment lists the user has commented on show the new username
+            bump_comments_version(select(Comments.blog_id).where(Comments.user_id == user_id))
 
         # Check and update the user's email if provided
         if "email" in body_data:
@@ -204,6 +231,10 @@ def update_user():
         # Save updates to the db
         db.session.commit()
 
+        # Cached blogs and comments show the author's username
+        if "username" in body_data:
+            response_cache.clear()
+
         # Return the updated user data
         result = UserSchema().dump(user)
         return jsonify({"message": "User updated successfully", "user": result}), 200
@@ -211,6 +242,10 @@ def update_user():
     except ValidationError as err:
         return jsonify({"error": err.messages}), 400
 
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return jsonify({"error": "Server is busy, please try again"}), 503
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -235,18 +270,12 @@ def delete_user(user_id):
     Returns:
         - 200 on successful deletion with a relevant message.
         - 403 if the user does not have permission to delete the specified user.
-        - 404 if the current user or the target user does not exist.
+        - 404 if the target user does not exist.
         - 500 for any other server errors.
     """
     try:
         # Get the user from the JWT token
         current_user_id = get_jwt_identity()
-        # Get the user from the DB
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        if not current_user:
-            return jsonify({"error": "Current user not found"}), 404
         
         # Get the user to be deleted from the DB
         stmt = select(User).where(User.user_id == user_id)
@@ -260,15 +289,19 @@ def delete_user(user_id):
             # User can delete thier own account
             db.session.delete(user_to_be_deleted)
             db.session.commit()
+            invalidate_role_caches(user_id)
+            response_cache.clear()
             return jsonify({"message": "Your account has been deleted"}), 200
         
         # Role checks
         # If the user to be deleted is admin
         if user_to_be_deleted.has_role("Admin"):
-            if current_user.has_role("Super Admin"):
+            if current_user_has_role("Super Admin"):
                 # A super admin can delete an admin
                 db.session.delete(user_to_be_deleted)
                 db.session.commit()
+                invalidate_role_caches(user_id)
+                response_cache.clear()
                 return jsonify({"message": f"Admin {user_to_be_deleted.username} has been deleted"}), 200
             else:
                 # If they are not a super admin do not allow
@@ -276,20 +309,24 @@ def delete_user(user_id):
             
         # If the user to be deleted is super admin
         if user_to_be_deleted.has_role("Super Admin"):
-            if current_user.has_role("Super Admin"):
+            if current_user_has_role("Super Admin"):
                 # A super admin can delete a super admin
                 db.session.delete(user_to_be_deleted)
                 db.session.commit()
+                invalidate_role_caches(user_id)
+                response_cache.clear()
                 return jsonify({"message": f"Super Admin {user_to_be_deleted.username} has been deleted"}), 200
             else:
                 # If they are not a super admin do not allow
                 return jsonify({"error": "Only a Super Admin can delete another Super Admin"}), 403
             
         # General user deletion
-        if current_user.has_role("Admin") or current_user.has_role("Super Admin"):
+        if current_user_has_role("Admin", "Super Admin"):
             # Admin or super admin can delete regular users
             db.session.delete(user_to_be_deleted)
             db.session.commit()
+            invalidate_role_caches(user_id)
+            response_cache.clear()
             return jsonify({"message": f"User {user_to_be_deleted.username} has been deleted"}, 200)
         
         # If none of these conditions are met 
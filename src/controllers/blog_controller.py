@@ -3,8 +3,16 @@ from flask import Blueprint, request, jsonify
 from init import db
 from models.blog import Blogs, blog_schema, blogs_schema
 from models.user import User
+from utils import current_user_has_role
+from loaders import FieldsetError, get_fieldset, sparse_schema, project
+from response_cache import response_cache
+from conditional import conditional
+from serializers import dump, json_response
+from pagination import PaginationError, pagination_requested, get_page_args, paginate, encode_cursor
 
-from sqlalchemy import select
+from sqlalchemy import select, func, cast, or_, and_
+from sqlalchemy.orm import undefer
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
 from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
@@ -12,6 +20,42 @@ from marshmallow import ValidationError
 # Blueprint for blogs
 blog_bp = Blueprint('blogs', __name__, url_prefix='/blogs')
 
+def blog_cache_tags(blog):
+    """
+    Lists the response cache tags of a blog, its comments and its media.
+
+    Args:
+        blog (Blogs): The blog.
+
+    Returns:
+        list: The tags to invalidate when the blog is deleted.
+    """
+    media_tags = [f"media:{media.media_id}" for media in blog.media]
+    return [f"blog:{blog.blog_id}", f"comments:{blog.blog_id}", f"media_blog:{blog.blog_id}", *media_tags]
+
+def blog_version(blog_id):
+    """
+    Reads the values that change whenever a blog's response changes, for its ETag.
+
+    No Last-Modified time is given, since renaming the author changes the response
+    without moving the blog's updated_at.
+
+    Args:
+        blog_id (int): The ID of the blog.
+
+    Returns:
+        tuple: The version values and no last modified time, or None if the blog is not found.
+    """
+    stmt = (
+        select(Blogs.blog_id, Blogs.created_at, Blogs.updated_at, User.username)
+        .join(Blogs.user)
+        .where(Blogs.blog_id == blog_id)
+    )
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    return tuple(row), None
+
 # To create a new blog(only Authors, Admin, Super Admin)
 @blog_bp.route("/", methods=["POST"])
 @jwt_required()
@@ -24,21 +68,15 @@ def create_blog():
     Returns:
         - 201: Blog created successfully.
         - 403: If the user does not have permission to create a blog.
-        - 404: If the current user is not found.
         - 400: If validation errors occur with the request data.
         - 500: If an integrity error or other server error occurs.
     """
     try:
         # Get the current user from JWT
         current_user_id = get_jwt_identity()
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
         
         # Check if the user has the right role
-        if not (current_user.has_role('Author') or current_user.has_role('Admin') or current_user.has_role('Super Admin')):
+        if not current_user_has_role('Author', 'Admin', 'Super Admin'):
             return jsonify({"message": "you do not have permission to create a blog"}), 403
         
         # Parse and validate request data
@@ -49,7 +87,7 @@ def create_blog():
             title = blog_data["title"],
             content = blog_data["content"],
             status = blog_data["status"],
-            user_id = current_user.user_id
+            user_id = current_user_id
         )
 
         # Save to DB
@@ -71,26 +109,42 @@ def create_blog():
 def get_blogs_by_status(status):
     """
     Retrieves blogs filtered by their status.
+
+    Passing a 'limit' and/or 'cursor' query parameter returns one page of blogs,
+    ordered by creation time, together with the 'next_cursor' for the following page.
+    A comma separated 'fields' query parameter returns (and loads) only those fields.
     
     Args:
         status (str): The status of the blogs to retrieve (e.g., 'published', 'draft').
     
     Returns:
         - 200: Blogs retrieved successfully.
+        - 400: If the cursor, limit or fields are invalid.
         - 404: If no blogs with the given status are found.
         - 500: For any other server errors.
     """
     try:
-        # select blogs by status
-        stmt = select(Blogs).where(Blogs.status == status)
+        # select blogs by status, loading only the requested fields
+        fieldset = get_fieldset(blogs_schema)
+        schema = sparse_schema(blogs_schema, fieldset)
+        stmt = project(select(Blogs).where(Blogs.status == status), Blogs, blogs_schema, fieldset, always=(Blogs.created_at,))
+
+        # Return a single page if pagination was requested
+        if pagination_requested():
+            position, limit = get_page_args()
+            blogs, next_cursor = paginate(stmt, Blogs.created_at, Blogs.blog_id, position, limit)
+            return json_response({"blogs": dump(schema, blogs), "next_cursor": next_cursor}), 200
+
         result = db.session.execute(stmt).scalars().all()
 
         # If no blogs are found
         if not result:
             return jsonify({"message": f"No blogs found with status '{status}'"}), 404
         
-        return jsonify(blogs_schema.dump(result)), 200
+        return json_response(dump(schema, result)), 200
     
+    except (PaginationError, FieldsetError) as err:
+        return jsonify({"error": str(err)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -101,12 +155,17 @@ def get_blogs_by_user(user_id):
     try:
         """
     Retrieves all blogs created by a specific user.
+
+    Passing a 'limit' and/or 'cursor' query parameter returns one page of blogs,
+    ordered by creation time, together with the 'next_cursor' for the following page.
+    A comma separated 'fields' query parameter returns (and loads) only those fields.
     
     Args:
         user_id (int): The ID of the user whose blogs are to be retrieved.
     
     Returns:
         - 200: Blogs retrieved successfully.
+        - 400: If the cursor, limit or fields are invalid.
         - 404: If the user or their blogs are not found.
         - 500: For any other server errors.
     """
@@ -117,21 +176,108 @@ def get_blogs_by_user(user_id):
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Select all the blogs of the user
-        stmt = select(Blogs).where(Blogs.user_id == user_id)
+        # Select all the blogs of the user, loading only the requested fields
+        fieldset = get_fieldset(blogs_schema)
+        schema = sparse_schema(blogs_schema, fieldset)
+        stmt = project(select(Blogs).where(Blogs.user_id == user_id), Blogs, blogs_schema, fieldset, always=(Blogs.created_at,))
+
+        # Return a single page if pagination was requested
+        if pagination_requested():
+            position, limit = get_page_args()
+            blogs, next_cursor = paginate(stmt, Blogs.created_at, Blogs.blog_id, position, limit)
+            return json_response({"blogs": dump(schema, blogs), "next_cursor": next_cursor}), 200
+
         blogs = db.session.execute(stmt).scalars().all()
 
         if not blogs:
             return jsonify({"message": "No blogs where found for this user"}), 404
         
-        return jsonify(blogs_schema.dump(blogs)), 200
+        return json_response(dump(schema, blogs)), 200
     
+    except (PaginationError, FieldsetError) as err:
+        return jsonify({"error": str(err)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Route to search published blogs
+@blog_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_blogs():
+    """
+    Searches the titles and content of published blogs.
+
+    Uses PostgreSQL full-text search, so it is not available on other databases.
+    Matches in the title rank above matches in the content.
+    Results are returned best match first, one page at a time, each with a highlighted
+    snippet of the content. Pass the returned 'next_cursor' to get the following page.
+
+    Query parameters:
+        q (str): The search terms. Supports quoted phrases, 'or' and '-' to exclude words.
+        limit (int): The number of results per page.
+        cursor (str): The cursor of the page to retrieve.
+        fields (str): Comma separated blog fields to return, all by default.
+
+    Returns:
+        - 200: The matching blogs and the cursor of the next page.
+        - 400: If the search terms are missing or the cursor, limit or fields are invalid.
+        - 501: If the database is not PostgreSQL.
+        - 500: For any other server errors.
+    """
+    try:
+        if db.session.get_bind().dialect.name != "postgresql":
+            return jsonify({"error": "Full-text search is only supported on PostgreSQL"}), 501
+
+        terms = request.args.get("q", "").strip()
+        if not terms:
+            return jsonify({"error": "Search terms are required"}), 400
+
+        position, limit = get_page_args(cursor_types=(float, int))
+        fieldset = get_fieldset(blog_schema)
+        schema = sparse_schema(blog_schema, fieldset)
+
+        query = func.websearch_to_tsquery("english", terms)
+        # Cast to double precision so the rank survives the round trip through the cursor
+        rank = cast(func.ts_rank(Blogs.search_vector, query), DOUBLE_PRECISION)
+        snippet = func.ts_headline("english", Blogs.content, query, "MaxFragments=2, MaxWords=30, MinWords=10")
+
+        stmt = (
+            select(Blogs, rank.label("rank"), snippet.label("snippet"))
+            .where(Blogs.status == "published", Blogs.search_vector.op("@@")(query))
+        )
+        # Continue after the last result of the previous page
+        if position is not None:
+            last_rank, last_id = position
+            stmt = stmt.where(or_(rank < last_rank, and_(rank == last_rank, Blogs.blog_id > last_id)))
+
+        stmt = project(stmt, Blogs, blog_schema, fieldset)
+        stmt = stmt.order_by(rank.desc(), Blogs.blog_id).limit(limit + 1)
+        rows = db.session.execute(stmt).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].rank, rows[-1].Blogs.blog_id)
+
+        results = []
+        for row in rows:
+            result = dump(schema, row.Blogs)
+            # Rounded so the rank is formatted the same by every JSON encoder json_response uses
+            result["rank"] = round(row.rank, 4)
+            result["snippet"] = row.snippet
+            results.append(result)
+
+        return json_response({"blogs": results, "next_cursor": next_cursor}), 200
+
+    except (PaginationError, FieldsetError) as err:
+        return jsonify({"error": str(err)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Route to get a single blog
 @blog_bp.route('/<int:blog_id>', methods=['GET'])
 @jwt_required()
+@conditional(blog_version)
+@response_cache.cached("blog", ttl=60, tags=lambda blog_id: [f"blog:{blog_id}"])
 def get_blog(blog_id):
     try:
         """
@@ -146,14 +292,14 @@ def get_blog(blog_id):
         - 500: For any other server errors.
     """
         # create the select statement 
-        stmt = select(Blogs).where(Blogs.blog_id == blog_id)
+        stmt = select(Blogs).where(Blogs.blog_id == blog_id).options(undefer(Blogs.content))
         result = db.session.execute(stmt).scalar()
 
         # if no blog is found
         if result is None:
             return jsonify({"message": "Blog not found"}), 404
         
-        return jsonify(blog_schema.dump(result)), 200
+        return json_response(dump(blog_schema, result)), 200
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -173,18 +319,13 @@ def update_blog(blog_id):
     Returns:
         - 200: Blog updated successfully.
         - 403: If the user does not have permission to update the blog.
-        - 404: If the blog or current user is not found.
+        - 404: If the blog is not found.
         - 400: If validation errors occur with the request data.
         - 500: For any other server errors.
     """
     try:
         # Get the user from JWT
         current_user_id = get_jwt_identity()
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
         
         # Get the blog to be updated
         stmt = select(Blogs).where(Blogs.blog_id == blog_id)
@@ -194,7 +335,7 @@ def update_blog(blog_id):
             return jsonify({"error": "Blog not found"}), 404
         
         # Check the user is the author or an Admin or Super Admin
-        if blog.user_id != current_user.user_id and not (current_user.has_role("Admin") or current_user.has_role("Super Admin")):
+        if blog.user_id != current_user_id and not current_user_has_role("Admin", "Super Admin"):
             return jsonify({"error": "You can only update your own blog or must be an Admin or Super Admin"}), 403
         
         # Parse and validate the request data
@@ -207,6 +348,7 @@ def update_blog(blog_id):
 
         # Save the update
         db.session.commit()
+        response_cache.invalidate(f"blog:{blog_id}")
         result = blog_schema.dump(blog)
 
         return jsonify({"message": "Blog updated successfully", "blog": result}), 200
@@ -232,17 +374,12 @@ def delete_blog(blog_id):
     Returns:
         - 200: Blog deleted successfully.
         - 403: If the user does not have permission to delete the blog.
-        - 404: If the blog or current user is not found.
+        - 404: If the blog is not found.
         - 500: For any other server errors.
     """
     try:
         # Get the user from JWT
         current_user_id = get_jwt_identity()
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
         
         # Get the blog to be deleted
         stmt = select(Blogs).where(Blogs.blog_id == blog_id)
@@ -251,24 +388,24 @@ def delete_blog(blog_id):
         if not blog:
             return jsonify({"error": "Blog not found"}), 404
         
-        # get the Author of the blog
-        stmt = select(User).where(User.user_id == blog.user_id)
-        blog_author = db.session.execute(stmt).scalar_one_or_none()
-
         # Check the user is the author 
-        if blog.user_id == current_user.user_id:
+        if blog.user_id == current_user_id:
             # Author can only delete thier own blog, not if is from an admin or super admin
-            if blog_author.has_role("Admin") or blog_author.has_role("Super Admin"):
+            if current_user_has_role("Admin", "Super Admin"):
                 return jsonify({"error": "You cannot delete a blog created by an Admin or Super Admin"}), 403
             else:
+                cache_tags = blog_cache_tags(blog)
                 db.session.delete(blog)
                 db.session.commit()
+                response_cache.invalidate(*cache_tags)
                 return jsonify({"message": "Blog deleted successfully"}), 200
             
         # Admins and super admins can delete any blog
-        elif current_user.has_role("Admin") or current_user.has_role("Super Admin"):
+        elif current_user_has_role("Admin", "Super Admin"):
+            cache_tags = blog_cache_tags(blog)
             db.session.delete(blog)
             db.session.commit()
+            response_cache.invalidate(*cache_tags)
             return jsonify({"message": "Blog deleted successfully"}), 200
         else:
             return jsonify({"error": "You can only delete your own blog or must be an Admin or Super Admin"}), 403
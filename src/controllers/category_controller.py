@@ -2,17 +2,25 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from init import db
-from utils import admin_required
-from models.category import Category, categories_schema, category_schema
-from models.blog import Blogs
-from models.user import User
+from utils import admin_required, current_user_has_role, insert_or_ignore
+from loaders import eager_load, FieldsetError, get_fieldset, sparse_schema, project
+from models.category import (
+    Category, BlogCategory, categories_schema, category_schema, category_schema_relationships,
+    category_summaries_schema, blog_category_schema, blog_categories_schema, blog_category_bulk_schema
+)
+from models.blog import Blogs, blogs_schema
+from pagination import PaginationError, get_page_args, paginate
 
-from sqlalchemy import select
+from sqlalchemy import select, delete, func
 from sqlalchemy.exc import SQLAlchemyError
+from marshmallow import ValidationError
 
 # Blueprint for category-related routes
 category_bp = Blueprint('category_bp', __name__, url_prefix='/categories')
 
+# Maximum number of associations a single bulk request may add or remove
+MAX_BULK_ASSOCIATIONS = 1000
+
 # Get the categories route
 @category_bp.route('/', methods=['GET'])
 @jwt_required()
@@ -20,12 +28,28 @@ def get_categories():
     """
     Retrieves all categories from the database.
 
+    Each category is returned with the number of blogs in it, computed in one grouped
+    query. Use GET /categories/<id>/blogs to page through the blogs of a category. With the
+    'summary' query parameter set to false, every category is returned with all of its
+    blogs instead, which grows with the number of blogs.
+
     Returns:
         - 200: List of categories in JSON format.
         - 500: If an error occurs while fetching categories.
     """
     try:
-        stmt = select(Category)
+        # Lightweight listing with blog counts, unless the full listing is asked for
+        if request.args.get("summary", "true").lower() != "false":
+            stmt = (
+                select(Category.category_id, Category.category_name, func.count(BlogCategory.blog_id).label("blog_count"))
+                .outerjoin(BlogCategory, BlogCategory.category_id == Category.category_id)
+                .group_by(Category.category_id, Category.category_name)
+                .order_by(Category.category_id)
+            )
+            result = db.session.execute(stmt).all()
+            return category_summaries_schema.dump(result), 200
+
+        stmt = eager_load(select(Category), *category_schema_relationships)
         result = db.session.execute(stmt).scalars().all()
         return categories_schema.dump(result), 200
     except SQLAlchemyError as e:
@@ -33,6 +57,49 @@ def get_categories():
     except Exception as e:
         return jsonify({"message": "An error occurred: " + str(e)}), 500
 
+# Get the blogs in a category route
+@category_bp.route('/<int:category_id>/blogs', methods=['GET'])
+@jwt_required()
+def get_category_blogs(category_id):
+    """
+    Retrieves the blogs in a category, one page at a time.
+
+    Blogs are ordered by creation time. Pass the returned 'next_cursor' as the 'cursor'
+    query parameter to get the following page, and 'limit' to change the page size.
+    A comma separated 'fields' query parameter returns (and loads) only those fields.
+
+    Args:
+        category_id (int): The ID of the category.
+
+    Returns:
+        - 200: A page of blogs and the cursor of the next page.
+        - 400: If the cursor, limit or fields are invalid.
+        - 404: If the category is not found.
+        - 500: If an error occurs while fetching the blogs.
+    """
+    try:
+        category = db.session.get(Category, category_id)
+        if not category:
+            return jsonify({"message": "Category not found"}), 404
+
+        position, limit = get_page_args()
+        fieldset = get_fieldset(blogs_schema)
+        stmt = (
+            select(Blogs)
+            .join(BlogCategory, BlogCategory.blog_id == Blogs.blog_id)
+            .where(BlogCategory.category_id == category_id)
+        )
+        stmt = project(stmt, Blogs, blogs_schema, fieldset, always=(Blogs.created_at,))
+        blogs, next_cursor = paginate(stmt, Blogs.created_at, Blogs.blog_id, position, limit)
+
+        return jsonify({"blogs": sparse_schema(blogs_schema, fieldset).dump(blogs), "next_cursor": next_cursor}), 200
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({"message": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"message": str(e)}), 500
+    except Exception as e:
+        return jsonify({"message": "An error occurred: " + str(e)}), 500
+
 # Create a category route (Admin/Super Admin only)
 @category_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -172,50 +239,48 @@ def add_blog_to_category(category_id, blog_id):
     Adds a blog to a specific category.
 
     Only the blog's author, Admins, or Super Admins can add a blog to a category.
+    The association is inserted directly, without loading the category's blogs.
     
     Args:
         category_id (int): The ID of the category.
         blog_id (int): The ID of the blog to add.
     
     Returns:
-        - 200: The updated category with the blog added.
+        - 200: The association, and whether it was added or already existed.
         - 403: If the user does not have permission to add the blog.
         - 404: If the category or blog is not found.
         - 500: If an error occurs while adding the blog to the category.
     """
     try:
-        stmt_category = select(Category).where(Category.category_id == category_id)
-        category = db.session.execute(stmt_category).scalar_one_or_none()
-        
-        if not category:
+        stmt_category = select(Category.category_id).where(Category.category_id == category_id)
+        if db.session.execute(stmt_category).scalar_one_or_none() is None:
             return jsonify({"message": "Category not found"}), 404
         
-        stmt_blog = select(Blogs).where(Blogs.blog_id == blog_id)
-        blog = db.session.execute(stmt_blog).scalar_one_or_none()
+        stmt_blog = select(Blogs.user_id).where(Blogs.blog_id == blog_id)
+        blog_author_id = db.session.execute(stmt_blog).scalar_one_or_none()
         
-        if not blog:
+        if blog_author_id is None:
             return jsonify({"message": "Blog not found"}), 404
         
         # Get the current user ID and roles from the JWT
         current_user_id = get_jwt_identity()
-        stmt_user = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt_user).scalar_one_or_none()
-
-        # If the user does not exist, return an error
-        if not current_user:
-            return jsonify({"message": "User not found"}), 404
 
         # Check if the current user is the blog's author or an Admin/Super Admin
-        if blog.user_id != current_user_id and not current_user.has_role("Admin") and not current_user.has_role("Super Admin"):
+        if blog_author_id != current_user_id and not current_user_has_role("Admin", "Super Admin"):
             return jsonify({"message": "You are not authorized to add this blog to a category"}), 403
         
-        # Add the blog to the category's blogs
-        if blog not in category.blogs:
-            category.blogs.append(blog)
-        
+        # Add the association, skipping it if it already exists
+        stmt = (
+            insert_or_ignore(BlogCategory)
+            .values(category_id=category_id, blog_id=blog_id)
+            .returning(BlogCategory.blog_id)
+        )
+        added = db.session.execute(stmt).first() is not None
         db.session.commit()
 
-        return category_schema.dump(category), 200
+        message = "Blog added to category" if added else "Blog is already in this category"
+        association = blog_category_schema.dump({"category_id": category_id, "blog_id": blog_id})
+        return jsonify({"message": message, **association}), 200
     
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -231,53 +296,125 @@ def remove_blog_from_category(category_id, blog_id):
     Removes a blog from a specific category.
 
     Only the blog's author, Admins, or Super Admins can remove a blog from a category.
+    The association is deleted directly, without loading the category's blogs.
     
     Args:
         category_id (int): The ID of the category.
         blog_id (int): The ID of the blog to remove.
     
     Returns:
-        - 200: The updated category with the blog removed.
+        - 200: The association, and whether it was removed or did not exist.
         - 403: If the user does not have permission to remove the blog.
         - 404: If the category or blog is not found.
         - 500: If an error occurs while removing the blog from the category.
     """
     try:
-        stmt_category = select(Category).where(Category.category_id == category_id)
-        category = db.session.execute(stmt_category).scalar_one_or_none()
-        
-        if not category:
+        stmt_category = select(Category.category_id).where(Category.category_id == category_id)
+        if db.session.execute(stmt_category).scalar_one_or_none() is None:
             return jsonify({"message": "Category not found"}), 404
         
-        stmt_blog = select(Blogs).where(Blogs.blog_id == blog_id)
-        blog = db.session.execute(stmt_blog).scalar_one_or_none()
+        stmt_blog = select(Blogs.user_id).where(Blogs.blog_id == blog_id)
+        blog_author_id = db.session.execute(stmt_blog).scalar_one_or_none()
         
-        if not blog:
+        if blog_author_id is None:
             return jsonify({"message": "Blog not found"}), 404
         
         # Get the current user ID and roles from the JWT
         current_user_id = get_jwt_identity()
-        stmt_user = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt_user).scalar_one_or_none()
-
-        # If the user does not exist, return an error
-        if not current_user:
-            return jsonify({"message": "User not found"}), 404
 
         # Check if the current user is the blog's author or an Admin/Super Admin
-        if blog.user_id != current_user_id and not current_user.has_role("Admin") and not current_user.has_role("Super Admin"):
+        if blog_author_id != current_user_id and not current_user_has_role("Admin", "Super Admin"):
             return jsonify({"message": "You are not authorized to add this blog to a category"}), 403
         
-        # Remove the blog from the category's blogs
-        if blog in category.blogs:
-            category.blogs.remove(blog)
-        
+        # Remove the association if it exists
+        stmt = (
+            delete(BlogCategory)
+            .where(BlogCategory.category_id == category_id, BlogCategory.blog_id == blog_id)
+            .returning(BlogCategory.blog_id)
+        )
+        removed = db.session.execute(stmt).first() is not None
         db.session.commit()
 
-        return category_schema.dump(category), 200
+        message = "Blog removed from category" if removed else "Blog was not in this category"
+        association = blog_category_schema.dump({"category_id": category_id, "blog_id": blog_id})
+        return jsonify({"message": message, **association}), 200
     
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"message": str(e)}), 500
     except Exception as e:
-        return jsonify({"message": "An error occurred: " + str(e)}), 500
\ No newline at end of file
+        return jsonify({"message": "An error occurred: " + str(e)}), 500
+
+# Add or remove many blogs to/from many categories route (Author/Admin/Super Admin only)
+@category_bp.route('/blogs', methods=['POST', 'DELETE'])
+@jwt_required()
+def update_blog_categories():
+    """
+    Adds (POST) or removes (DELETE) every given blog to/from every given category in one transaction.
+
+    Only the blogs' author, Admins, or Super Admins can change the categories of a blog.
+    Associations that already exist (POST) or do not exist (DELETE) are skipped.
+
+    Expects:
+        - JSON request body with "category_ids" and "blog_ids" lists.
+
+    Returns:
+        - 200: The associations that were added or removed.
+        - 400: If the request data is invalid or too many associations are requested.
+        - 403: If the user does not have permission to change any of the blogs.
+        - 404: If any of the categories or blogs are not found.
+        - 500: If an error occurs while updating the associations.
+    """
+    try:
+        data = blog_category_bulk_schema.load(request.get_json())
+        category_ids = set(data["category_ids"])
+        blog_ids = set(data["blog_ids"])
+
+        if len(category_ids) * len(blog_ids) > MAX_BULK_ASSOCIATIONS:
+            return jsonify({"message": f"At most {MAX_BULK_ASSOCIATIONS} associations can be changed at once"}), 400
+
+        # Check every category and blog exists
+        stmt = select(Category.category_id).where(Category.category_id.in_(category_ids))
+        missing_categories = category_ids - set(db.session.execute(stmt).scalars())
+        if missing_categories:
+            return jsonify({"message": "Categories not found", "category_ids": sorted(missing_categories)}), 404
+
+        stmt = select(Blogs.blog_id, Blogs.user_id).where(Blogs.blog_id.in_(blog_ids))
+        blog_authors = dict(db.session.execute(stmt).all())
+        missing_blogs = blog_ids - blog_authors.keys()
+        if missing_blogs:
+            return jsonify({"message": "Blogs not found", "blog_ids": sorted(missing_blogs)}), 404
+
+        # Check the current user is the author of every blog or an Admin/Super Admin
+        current_user_id = get_jwt_identity()
+        if not current_user_has_role("Admin", "Super Admin"):
+            not_owned = sorted(blog_id for blog_id, author_id in blog_authors.items() if author_id != current_user_id)
+            if not_owned:
+                return jsonify({"message": "You are not authorized to change the categories of these blogs", "blog_ids": not_owned}), 403
+
+        if request.method == "POST":
+            rows = [
+                {"category_id": category_id, "blog_id": blog_id}
+                for category_id in sorted(category_ids)
+                for blog_id in sorted(blog_ids)
+            ]
+            stmt = insert_or_ignore(BlogCategory).values(rows).returning(BlogCategory.category_id, BlogCategory.blog_id)
+        else:
+            stmt = (
+                delete(BlogCategory)
+                .where(BlogCategory.category_id.in_(category_ids), BlogCategory.blog_id.in_(blog_ids))
+                .returning(BlogCategory.category_id, BlogCategory.blog_id)
+            )
+        changed = db.session.execute(stmt).all()
+        db.session.commit()
+
+        key = "added" if request.method == "POST" else "removed"
+        return jsonify({key: blog_categories_schema.dump(changed)}), 200
+
+    except ValidationError as err:
+        return jsonify({"message": err.messages}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"message": str(e)}), 500
+    except Exception as e:
+        return jsonify({"message": "An error occurred: " + str(e)}), 500
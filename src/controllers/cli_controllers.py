@@ -1,15 +1,28 @@
+import sys
+import time
+
+import click
 from flask import Blueprint
-from sqlalchemy import select
+from sqlalchemy import select, update, func, text, inspect
+from sqlalchemy.schema import CreateIndex, DropIndex
 
 from init import db, bcrypt
 from models.user import User
 from models.roles import Role
-from models.blog import Blogs
+from models.blog import Blogs, BLOG_SEARCH_VECTOR_SQL, BLOG_SEARCH_DDL
 from models.category import Category
+from models.likes import Likes
+from models.comments import Comments, fill_comment_paths
+from exporter import EXPORTS, EXPORT_FORMATS, DEFAULT_EXPORT_BATCH_SIZE, export_batches, gzip_chunks
+from importer import IMPORTS, IMPORT_FORMATS, DEFAULT_IMPORT_BATCH_SIZE, ImportAborted, import_file
+from synthetic import DISTRIBUTIONS, SCALE_PASSWORD, ScaleDataset
 
 # Define a Blueprint for database commands
 db_commands = Blueprint("db", __name__)
 
+# Number of rejected records listed by the import command
+MAX_REPORTED_ERRORS = 20
+
 # To create tables
 @db_commands.cli.command("create")
 def create_tables():
@@ -116,6 +129,277 @@ def seed_tables():
         db.session.rollback()
         print(f"Error seeding the tables: {e}")
 
+# To rebuild the like counters of the blogs
+@db_commands.cli.command("rebuild-like-counts")
+def rebuild_like_counts():
+    """
+    Recalculates the like counter of every blog from the likes table.
+
+    This is run in a single UPDATE statement and can be used to repair the counters
+    or to populate them on a database created before the counter was added. On
+    PostgreSQL the counter column is added first if missing.
+    """
+    try:
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text("ALTER TABLE blogs ADD COLUMN IF NOT EXISTS like_count integer NOT NULL DEFAULT 0"))
+            db.session.commit()
+
+        like_total = select(func.count()).where(Likes.blog_id == Blogs.blog_id).scalar_subquery()
+        result = db.session.execute(update(Blogs).values(like_count=like_total, updated_at=Blogs.updated_at))
+        db.session.commit()
+        print(f"Like counts rebuilt for {result.rowcount} blogs")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error rebuilding like counts: {e}")
+
+# To set up and backfill full-text search on an existing database
+@db_commands.cli.command("search-backfill")
+@click.option("--batch-size", default=1000, help="Number of blogs to update per transaction.")
+def search_backfill(batch_size):
+    """
+    Adds the blog search column, index and trigger if missing, then fills in the
+    search vector of every blog that does not have one yet.
+
+    Blogs are updated in batches so the command can run against a live database.
+    Only supported on PostgreSQL.
+    """
+    if db.engine.dialect.name != "postgresql":
+        print("Full-text search is only supported on PostgreSQL")
+        return
+
+    try:
+        db.session.execute(text("ALTER TABLE blogs ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_blogs_search_vector ON blogs USING gin (search_vector)"))
+        for statement in BLOG_SEARCH_DDL:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+        stmt = text(
+            f"UPDATE blogs SET search_vector = {BLOG_SEARCH_VECTOR_SQL.format(row='')} "
+            "WHERE blog_id IN (SELECT blog_id FROM blogs WHERE search_vector IS NULL LIMIT :batch_size)"
+        )
+        total = 0
+        while True:
+            result = db.session.execute(stmt, {"batch_size": batch_size})
+            db.session.commit()
+            if result.rowcount == 0:
+                break
+            total += result.rowcount
+            print(f"Backfilled {total} blogs")
+
+        print(f"Search backfill complete, {total} blogs updated")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error backfilling search vectors: {e}")
+
+# To fill in the materialised paths of comments created before threading was added
+@db_commands.cli.command("comment-paths")
+@click.option("--batch-size", default=10000, help="Number of comments to update per transaction.")
+def comment_paths(batch_size):
+    """
+    Fills in the materialised path of every comment that does not have one yet.
+
+    Comments are updated in batches in ID order, so the command can run against a live
+    database. Replies that sort before their parent are filled in by a final pass. On
+    PostgreSQL the threading columns and the blogs' comments version are added first if
+    missing; 'flask db indexes' adds their index.
+    """
+    try:
+        if db.engine.dialect.name == "postgresql":
+            db.session.execute(text(
+                "ALTER TABLE comments ADD COLUMN IF NOT EXISTS parent_comment_id integer "
+                "REFERENCES comments (comment_id) ON DELETE CASCADE"
+            ))
+            db.session.execute(text("ALTER TABLE comments ADD COLUMN IF NOT EXISTS path varchar"))
+            db.session.execute(text("ALTER TABLE blogs ADD COLUMN IF NOT EXISTS comments_version integer NOT NULL DEFAULT 0"))
+            db.session.commit()
+
+        total, last_id = 0, 0
+        while True:
+            stmt = (
+                select(Comments.comment_id)
+                .where(Comments.path.is_(None), Comments.comment_id > last_id)
+                .order_by(Comments.comment_id)
+                .limit(batch_size)
+            )
+            comment_ids = db.session.execute(stmt).scalars().all()
+            if not comment_ids:
+                break
+            total += fill_comment_paths(comment_ids)
+            db.session.commit()
+            last_id = comment_ids[-1]
+            print(f"Filled in {total} comment paths")
+
+        total += fill_comment_paths()
+        db.session.commit()
+        remaining = db.session.execute(select(func.count()).where(Comments.path.is_(None))).scalar()
+        print(f"Comment paths complete, {total} comments updated, {remaining} without a path")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error filling in comment paths: {e}")
+
+# To create any indexes declared on the models that are missing from the database
+@db_commands.cli.command("indexes")
+def create_indexes():
+    """
+    Creates the indexes declared on the models that do not exist in the database yet.
+
+    On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY, so the tables
+    stay writable while the command runs against a live database. A concurrent build
+    that fails leaves an invalid index behind, which is dropped and built again on the
+    next run. Reports which indexes were added, rebuilt and already existed.
+    """
+    concurrently = db.engine.dialect.name == "postgresql"
+    inspector = inspect(db.engine)
+    added, rebuilt, existing, failed = [], [], [], []
+
+    # Concurrent index builds cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        invalid = set()
+        if concurrently:
+            invalid = set(connection.execute(text(
+                "SELECT c.relname FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE NOT i.indisvalid AND n.nspname = current_schema()"
+            )).scalars())
+
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            present = {index["name"] for index in inspector.get_indexes(table.name)}
+
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in present and index.name not in invalid:
+                    existing.append(index.name)
+                    continue
+                if concurrently:
+                    index.dialect_options["postgresql"]["concurrently"] = True
+                try:
+                    if index.name in invalid:
+                        connection.execute(DropIndex(index, if_exists=True))
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+                    if index.name in invalid:
+                        rebuilt.append(index.name)
+                        print(f"Rebuilt invalid index {index.name} on {table.name}")
+                    else:
+                        added.append(index.name)
+                        print(f"Added index {index.name} on {table.name}")
+                except Exception as e:
+                    failed.append(index.name)
+                    print(f"Error creating index {index.name}: {e}")
+
+    print(f"{len(added)} indexes added, {len(rebuilt)} rebuilt, {len(existing)} already present, {len(failed)} failed")
+
+# To export a table as NDJSON or CSV
+@db_commands.cli.command("export")
+@click.argument("name", type=click.Choice(list(EXPORTS)))
+@click.option("--format", "fmt", type=click.Choice(EXPORT_FORMATS), default="ndjson", help="Output format.")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="File to write to. Defaults to stdout.")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+@click.option("--batch-size", default=DEFAULT_EXPORT_BATCH_SIZE, help="Number of rows to read at a time.")
+def export_table(name, fmt, output, compress, batch_size):
+    """
+    Exports every row of the blogs, comments or likes table as NDJSON or CSV.
+
+    Rows are read with a server-side cursor and written one batch at a time, so memory use
+    stays the same however large the table is.
+    """
+    rows = 0
+    started = time.perf_counter()
+
+    def chunks():
+        nonlocal rows
+        for count, chunk in export_batches(name, fmt, batch_size):
+            rows += count
+            yield chunk
+
+    stream = gzip_chunks(chunks()) if compress else chunks()
+    target = open(output, "wb") if output else sys.stdout.buffer
+    try:
+        for chunk in stream:
+            target.write(chunk)
+    finally:
+        if output:
+            target.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Exported {rows} {name} rows in {elapsed:.1f}s", file=sys.stderr)
+
+# To bulk load users, blogs or comments from NDJSON or CSV files
+@db_commands.cli.command("import")
+@click.argument("name", type=click.Choice(list(IMPORTS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS), default=None, help="Input format. Defaults to the file extension.")
+@click.option("--batch-size", default=DEFAULT_IMPORT_BATCH_SIZE, help="Number of records to load per transaction.")
+def import_table(name, path, fmt, batch_size):
+    """
+    Imports users, blogs or comments from an NDJSON or CSV file, which may be gzipped.
+
+    Records are validated with the model schemas and loaded a batch at a time, with COPY on
+    PostgreSQL. Users, roles and categories can be referred to by name, and plaintext
+    passwords are hashed in the password hasher's worker pool. Invalid records are skipped
+    and reported. If a batch fails to load the command exits with an error, reporting how
+    many rows were committed before it.
+    """
+    def progress(totals):
+        rate = totals["imported"] / totals["seconds"] if totals["seconds"] else 0
+        print(f"Imported {totals['imported']} {name} rows, {totals['rejected']} rejected ({rate:.0f} rows/s)", file=sys.stderr)
+
+    try:
+        totals = import_file(name, path, fmt, batch_size, on_batch=progress)
+    except ImportAborted as e:
+        raise click.ClickException(
+            f"Error importing {name}: {e}\n"
+            f"{e.totals['imported']} {name} rows were imported and committed before the error"
+        )
+
+    # Only the first errors are listed, a bad file can reject every line
+    for line, errors in totals["errors"][:MAX_REPORTED_ERRORS]:
+        print(f"Line {line}: {errors}", file=sys.stderr)
+    if totals["rejected"] > MAX_REPORTED_ERRORS:
+        print(f"... and {totals['rejected'] - MAX_REPORTED_ERRORS} more rejected lines", file=sys.stderr)
+
+    print(f"Imported {totals['imported']} {name} rows in {totals['seconds']:.1f}s, {totals['rejected']} rejected", file=sys.stderr)
+
+# To generate a large, skewed dataset for load testing
+@db_commands.cli.command("seed-scale")
+@click.option("--users", default=10000, help="Number of users to create.")
+@click.option("--blogs", default=100000, help="Number of blogs to create.")
+@click.option("--likes", default=1000000, help="Total number of likes.")
+@click.option("--comments", default=300000, help="Total number of comments.")
+@click.option("--likes-per-blog-dist", "likes_dist", type=click.Choice(DISTRIBUTIONS), default="zipf", help="Spread of the likes over the blogs.")
+@click.option("--comments-per-blog-dist", "comments_dist", type=click.Choice(DISTRIBUTIONS), default="zipf", help="Spread of the comments over the blogs.")
+@click.option("--zipf-exponent", "exponent", default=1.1, help="Skew of the Zipf distributions.")
+@click.option("--categories-per-blog", default=3, help="Most categories a blog is linked to.")
+@click.option("--media-per-blog", default=0.5, help="Average number of media rows per blog.")
+@click.option("--days", default=365, help="Number of days the activity is spread over.")
+@click.option("--seed", default=0, help="Random seed. The same seed and options give the same data.")
+@click.option("--prefix", default="scale", help="Prefix of the generated usernames, which must be unused.")
+@click.option("--batch-size", default=1000, help="Number of blogs to load per transaction.")
+def seed_scale(batch_size, **options):
+    """
+    Generates users, blogs, likes, comments, categories links and media in bulk.
+
+    Likes and comments follow a power-law (Zipf) spread over the blogs by default, so a few
+    blogs are very hot and most are cold. The data is deterministic for a given seed and is
+    added after any existing rows. Run 'flask db seed' first for the roles and categories.
+    """
+    def progress(totals):
+        rows = sum(value for key, value in totals.items() if key != "seconds")
+        rate = rows / totals["seconds"] if totals["seconds"] else 0
+        print(f"Generated {totals['blogs']} blogs, {totals['likes']} likes, {totals['comments']} comments ({rate:.0f} rows/s)", file=sys.stderr)
+
+    try:
+        totals = ScaleDataset(**options).generate(batch_size, on_batch=progress)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error generating the dataset: {e}")
+        return
+
+    counts = ", ".join(f"{value} {key}" for key, value in totals.items() if key != "seconds")
+    print(f"Generated {counts} in {totals['seconds']:.1f}s. Users log in with password '{SCALE_PASSWORD}'")
+
 # To drop the tables in the database
 @db_commands.cli.command("drop")
 def drop_tables():
@@ -2,14 +2,41 @@ from flask import Blueprint, request, jsonify
 
 from init import db
 from models.comments import Comments, comments_schema, comment_schema
-
-from sqlalchemy import select
+from models.blog import Blogs
+from utils import bump_comments_version
+from loaders import FieldsetError, get_fieldset, sparse_schema, project
+from response_cache import response_cache
+from conditional import conditional
+from serializers import dump, json_response
+from pagination import PaginationError, pagination_requested, get_page_args, paginate
+
+from sqlalchemy import select, delete
 from sqlalchemy.exc import  SQLAlchemyError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 # Blueprint for comment-related routes
 comments_bp = Blueprint('comments', __name__, url_prefix='/comments')
 
+def blog_comments_version(blog_id):
+    """
+    Reads the version of a blog's comment list, for its ETag.
+
+    The blog's comments version is incremented whenever a comment is added or deleted or a
+    commenter is renamed, so a single primary key lookup identifies the version of the list.
+    No Last-Modified time is given, since deletes and renames do not move any timestamp.
+
+    Args:
+        blog_id (int): The ID of the blog.
+
+    Returns:
+        tuple: The version values and no last modified time, or None if the blog is not found.
+    """
+    stmt = select(Blogs.comments_version).where(Blogs.blog_id == blog_id)
+    version = db.session.execute(stmt).scalar_one_or_none()
+    if version is None:
+        return None
+    return (blog_id, version), None
+
 # Create a comment 
 @comments_bp.route('/blogs/<int:blog_id>', methods=['POST'])
 @jwt_required()
@@ -18,6 +45,7 @@ def create_comment(blog_id):
     Creates a new comment on a blog.
 
     Requires JWT authentication. The current user's ID is extracted from the token.
+    Passing a "parent_comment_id" creates the comment as a reply to that comment.
     
     Args:
         blog_id (int): The ID of the blog the comment is associated with.
@@ -25,6 +53,7 @@ def create_comment(blog_id):
     Returns:
         - 201: Comment created successfully.
         - 400: If validation fails or input data is missing.
+        - 404: If the parent comment is not found on this blog.
         - 500: If a database or unexpected error occurs.
     """
     try:
@@ -40,16 +69,26 @@ def create_comment(blog_id):
         if errors:
             return jsonify(errors), 400
         
+        # Check the comment being replied to is on the same blog
+        parent_comment_id = data.get("parent_comment_id")
+        if parent_comment_id is not None:
+            stmt = select(Comments.comment_id).where(Comments.comment_id == parent_comment_id, Comments.blog_id == blog_id)
+            if db.session.execute(stmt).scalar_one_or_none() is None:
+                return jsonify({"error": "Parent comment not found"}), 404
+        
         # Create the new comment instance
         new_comment = Comments(
             content = data.get("content"),
             user_id = user_id,
-            blog_id = blog_id
+            blog_id = blog_id,
+            parent_comment_id = parent_comment_id
         )
 
         # Add the comment to the database session and commit
         db.session.add(new_comment)
+        bump_comments_version([blog_id])
         db.session.commit()
+        response_cache.invalidate(f"comments:{blog_id}")
 
         # Return the created comment
         return comment_schema.jsonify(new_comment), 201
@@ -63,32 +102,94 @@ def create_comment(blog_id):
 # Get comments from a blog
 @comments_bp.route('/blogs/<int:blog_id>', methods=['GET'])
 @jwt_required()
+@conditional(blog_comments_version)
+@response_cache.cached("blog_comments", ttl=30, tags=lambda blog_id: [f"comments:{blog_id}"])
 def get_blog_comments(blog_id):
     """
-    Retrieves all comments associated with a specific blog.
+    Retrieves all comments associated with a specific blog, in thread order.
 
-    Requires JWT authentication.
+    Requires JWT authentication. Passing a 'limit' and/or 'cursor' query parameter returns
+    one page of top-level comments together with the 'next_cursor' for the following page;
+    the replies to each of them can be fetched from the comment's thread route.
+    A comma separated 'fields' query parameter returns (and loads) only those fields.
 
     Args:
         blog_id (int): The ID of the blog whose comments are to be retrieved.
 
     Returns:
         - 200: List of comments.
+        - 400: If the cursor, limit or fields are invalid.
         - 500: If a database or unexpected error occurs.
     """
     try:
-        # Query to get all comments for the specified blog
-        stmt = select(Comments).where(Comments.blog_id == blog_id)
+        fieldset = get_fieldset(comments_schema)
+        schema = sparse_schema(comments_schema, fieldset)
+
+        # Return a single page of top-level comments if pagination was requested
+        if pagination_requested():
+            position, limit = get_page_args()
+            stmt = select(Comments).where(Comments.blog_id == blog_id, Comments.parent_comment_id.is_(None))
+            stmt = project(stmt, Comments, comments_schema, fieldset, always=(Comments.created_at,))
+            comments, next_cursor = paginate(stmt, Comments.created_at, Comments.comment_id, position, limit)
+            return json_response({"comments": dump(schema, comments), "next_cursor": next_cursor}), 200
+
+        # Query to get all comments for the specified blog, each reply following its parent
+        stmt = select(Comments).where(Comments.blog_id == blog_id).order_by(Comments.path)
+        stmt = project(stmt, Comments, comments_schema, fieldset)
         comments = db.session.execute(stmt).scalars().all()
 
         # Return the list of comments
-        return comments_schema.dump(comments, many=True), 200
+        return json_response(dump(schema, comments)), 200
     
+    except (PaginationError, FieldsetError) as err:
+        return jsonify({"error": str(err)}), 400
     except SQLAlchemyError as e:
         return jsonify({"error": "Database error occurred"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+ 
+# Get a comment and all of its replies
+@comments_bp.route('/<int:comment_id>/thread', methods=['GET'])
+@jwt_required()
+def get_comment_thread(comment_id):
+    """
+    Retrieves a comment and all of its replies, at any depth, in thread order.
+
+    Requires JWT authentication. The thread is read with a single range scan over the
+    comments' materialised paths. A comma separated 'fields' query parameter returns
+    (and loads) only those fields.
+
+    Args:
+        comment_id (int): The ID of the comment at the top of the thread.
+
+    Returns:
+        - 200: List of comments, starting with the requested comment.
+        - 400: If the fields are invalid.
+        - 404: If the comment is not found.
+        - 500: If a database or unexpected error occurs.
+    """
+    try:
+        fieldset = get_fieldset(comments_schema)
+        schema = sparse_schema(comments_schema, fieldset)
+
+        comment = db.session.get(Comments, comment_id)
+        if comment is None:
+            return jsonify({"error": "Comment not found"}), 404
+
+        # Query to get the comment and every comment below it
+        stmt = select(Comments).where(comment.thread_filter()).order_by(Comments.path)
+        stmt = project(stmt, Comments, comments_schema, fieldset)
+        comments = db.session.execute(stmt).scalars().all()
+
+        return json_response(dump(schema, comments)), 200
+
+    except FieldsetError as err:
+        return jsonify({"error": str(err)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"error": "Database error occurred"}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Delete a comment 
 @comments_bp.route('/<int:comment_id>', methods=['DELETE'])
 @jwt_required()
@@ -97,6 +198,7 @@ def delete_comment(comment_id):
     Deletes a specific comment.
 
     Requires JWT authentication. Only the comment's owner can delete it.
+    All replies to the comment are deleted with it.
 
     Args:
         comment_id (int): The ID of the comment to delete.
@@ -122,9 +224,11 @@ def delete_comment(comment_id):
         if comment.user_id != user_id:
             return jsonify({"error": "Unauthorized"}), 403
         
-        # Delete the comment from the database and commit
-        db.session.delete(comment)
+        # Delete the comment and its replies from the database and commit
+        db.session.execute(delete(Comments).where(comment.thread_filter()))
+        bump_comments_version([comment.blog_id])
         db.session.commit()
+        response_cache.invalidate(f"comments:{comment.blog_id}")
 
         return jsonify({"message": "Comment deleted successfully"}), 200
     except SQLAlchemyError as e:
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required
+
+from utils import admin_required
+from db_pool import statement_timeout
+from exporter import DEFAULT_EXPORT_BATCH_SIZE, ExportError, export_batches, gzip_chunks
+
+# Blueprint for the data export routes
+export_bp = Blueprint('export', __name__, url_prefix='/export')
+
+# Content types of the export formats
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Stream a table export (Admin/Super Admin only)
+@export_bp.route('/<string:name>', methods=['GET'])
+@jwt_required()
+@admin_required
+# Exports of large tables outlast the default statement timeout
+@statement_timeout(0)
+def export_table(name):
+    """
+    Streams every row of the blogs, comments or likes table as a file download.
+
+    Rows are read from the database and written to the response one batch at a time,
+    so memory use stays the same however large the table is.
+
+    Query parameters:
+        format (str): "ndjson" (default) or "csv".
+        gzip (str): "true" to gzip the file as it is streamed.
+
+    Args:
+        name (str): The table to export: "blogs", "comments" or "likes".
+
+    Returns:
+        - 200: The export, streamed as it is read.
+        - 400: If the table or format is unknown.
+    """
+    fmt = request.args.get("format", "ndjson")
+    compress = request.args.get("gzip", "false").lower() == "true"
+
+    try:
+        batches = export_batches(name, fmt, DEFAULT_EXPORT_BATCH_SIZE)
+    except ExportError as err:
+        return jsonify({"error": str(err)}), 400
+
+    chunks = (chunk for _, chunk in batches)
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{fmt}"
+    mimetype = EXPORT_MIMETYPES[fmt]
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
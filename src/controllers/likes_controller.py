@@ -2,17 +2,55 @@ from flask import Blueprint, request, jsonify
 
 from init import db
 from models.likes import likes_schema, Likes
-from models.user import User, user_schema
+from models.user import User, user_schema, user_schema_relationships
 from models.blog import Blogs
+from like_buffer import like_buffer
+from utils import admin_required, insert_or_ignore
+from loaders import eager_load
+from pagination import PaginationError, pagination_requested, get_page_args, paginate
 
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import ValidationError
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy import select, func
+from sqlalchemy import select, update, delete
 
 # Blueprint for likes
 likes_bp = Blueprint('likes', __name__, url_prefix='/likes')
 
+def apply_like_change(stmt, delta):
+    """
+    Executes a like INSERT or DELETE and adjusts the blog's like counter to match.
+
+    On PostgreSQL the change and the counter update are sent as one statement by
+    running the INSERT/DELETE as a data-modifying CTE. Other databases run the
+    counter update as a second statement, and only when a like row actually changed.
+
+    Args:
+        stmt (Insert | Delete): The like statement, returning the blog_id of the changed row.
+        delta (int): The amount to add to the blog's like counter (1 or -1).
+
+    Returns:
+        bool: True if a like row was inserted or deleted, False otherwise.
+    """
+    # updated_at is set to itself so a like does not count as an edit of the blog
+    counter_values = {"like_count": Blogs.like_count + delta, "updated_at": Blogs.updated_at}
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        changed = stmt.cte("changed_like")
+        counter_stmt = (
+            update(Blogs)
+            .where(Blogs.blog_id == changed.c.blog_id)
+            .values(**counter_values)
+            .returning(Blogs.blog_id)
+        )
+        return db.session.execute(counter_stmt).first() is not None
+
+    blog_id = db.session.execute(stmt).scalar()
+    if blog_id is None:
+        return False
+    db.session.execute(update(Blogs).where(Blogs.blog_id == blog_id).values(**counter_values))
+    return True
+
 # Add a like to a blog route
 @likes_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -25,8 +63,11 @@ def add_like():
     Expects:
         - JSON request body with "blog_id".
     
+    When the like buffer is enabled the like is queued and written in the next batch.
+
     Returns:
         - 201: If the like is successfully added.
+        - 202: If the like is queued in the like buffer.
         - 400: If the blog_id is missing or the blog is already liked by the user.
         - 500: If there is a database or unexpected error.
     """
@@ -39,18 +80,24 @@ def add_like():
         # Validate the presence of blog_id in the request
         if not blog_id:
             return jsonify({"error": "Blog_id is required"}), 400
+
+        # Queue the like if buffering is enabled
+        if like_buffer.enabled:
+            like_buffer.add(current_user_id, blog_id)
+            return jsonify({"message": "Like queued"}), 202
         
-        # Check if a like already exists
-        stmt = select(Likes).where(Likes.user_id == current_user_id, Likes.blog_id == blog_id)
-        existing_like = db.session.execute(stmt).scalars().first()
-        if existing_like:
-            return jsonify({"message": "Already liked"}), 400
-        
-        # Create a new like and add to database
-        new_like = Likes(user_id=current_user_id, blog_id=blog_id)
-        db.session.add(new_like)
+        # Insert the like, skipping it if the user already liked the blog
+        stmt = (
+            insert_or_ignore(Likes)
+            .values(user_id=current_user_id, blog_id=blog_id)
+            .returning(Likes.blog_id)
+        )
+        added = apply_like_change(stmt, 1)
         db.session.commit()
 
+        if not added:
+            return jsonify({"message": "Already liked"}), 400
+
         return jsonify({"message": "Like added"}), 201
     
     except ValidationError as ve:
@@ -76,8 +123,11 @@ def remove_like():
     Expects:
         - JSON request body with "blog_id".
     
+    When the like buffer is enabled the removal is queued and written in the next batch.
+
     Returns:
         - 200: If the like is successfully removed.
+        - 202: If the removal is queued in the like buffer.
         - 404: If the like is not found.
         - 500: If there is a database or unexpected error.
     """
@@ -90,17 +140,24 @@ def remove_like():
         # Validate the presence of blog_id in the request
         if not blog_id:
             return jsonify({"error": "Blog_id is required"}), 400
-        
-        # Find the like entry in the database
-        stmt = select(Likes).where(Likes.user_id == current_user_id, Likes.blog_id == blog_id)
-        like = db.session.execute(stmt).scalars().first()
-        if not like:
-            return jsonify({"message": "Like not found"}), 404
+
+        # Queue the removal if buffering is enabled
+        if like_buffer.enabled:
+            like_buffer.remove(current_user_id, blog_id)
+            return jsonify({"message": "Like removal queued"}), 202
         
         # Delete the like from the database
-        db.session.delete(like)
+        stmt = (
+            delete(Likes)
+            .where(Likes.user_id == current_user_id, Likes.blog_id == blog_id)
+            .returning(Likes.blog_id)
+        )
+        removed = apply_like_change(stmt, -1)
         db.session.commit()
 
+        if not removed:
+            return jsonify({"message": "Like not found"}), 404
+
         return jsonify({"message": "Like removed successfully"}), 200
     
     except ValidationError as ve:
@@ -133,7 +190,7 @@ def get_likes_for_blog(blog_id):
     """
     try:
         # Select users who liked the specific blog
-        stmt = select(User).join(Likes).where(Blogs.blog_id == blog_id)
+        stmt = eager_load(select(User).join(Likes).where(Likes.blog_id == blog_id), *user_schema_relationships)
         users = db.session.execute(stmt).scalars().all()
 
         if not users:
@@ -147,26 +204,28 @@ def get_likes_for_blog(blog_id):
 
 # Get total likes for a blog
 @likes_bp.route('/count/blog/<int:blog_id>', methods=['GET'])
-@jwt_required
+@jwt_required()
 def get_total_likes_for_blog(blog_id):
     """
     Retrieves the total number of likes for a specific blog.
+
+    The total is read from the blog's like counter rather than counted from the likes table.
     
     Args:
         blog_id (int): The ID of the blog.
     
     Returns:
         - 200: The total number of likes for the blog.
-        - 404: If no likes are found for the blog.
+        - 404: If the blog is not found.
         - 500: If there is a database or unexpected error.
     """
     try:
-        # Count the total number of likes for the blog
-        stmt = select(func.count(Likes.created_at)).where(Likes.blog_id == blog_id)
+        # Read the like counter of the blog
+        stmt = select(Blogs.like_count).where(Blogs.blog_id == blog_id)
         total = db.session.execute(stmt).scalar()
 
         if total is None:
-            return jsonify({"message": "No likes found for this blog"}), 404
+            return jsonify({"message": "Blog not found"}), 404
 
         return jsonify({"total_likes": int(total)}), 200
     
@@ -183,9 +242,12 @@ def get_liked_blogs_for_user():
     Retrieves all blogs that have been liked by the current user.
 
     Requires JWT authentication. The current user's ID is extracted from the token.
+    Passing a 'limit' and/or 'cursor' query parameter returns one page of blogs
+    together with the 'next_cursor' for the following page.
 
     Returns:
         - 200: List of liked blogs.
+        - 400: If the cursor or limit is invalid.
         - 404: If no blogs have been liked by the current user.
         - 500: If there is a database or unexpected error.
     """
@@ -195,6 +257,13 @@ def get_liked_blogs_for_user():
 
         # Select blogs liked by the current user
         stmt = select(Blogs).join(Likes).where(Likes.user_id == current_user)
+
+        # Return a single page if pagination was requested
+        if pagination_requested():
+            position, limit = get_page_args()
+            liked_blogs, next_cursor = paginate(stmt, Blogs.created_at, Blogs.blog_id, position, limit)
+            return jsonify({"blogs": likes_schema.dump(liked_blogs, many=True), "next_cursor": next_cursor}), 200
+
         liked_blogs = db.session.execute(stmt).scalars().all()
 
         if not liked_blogs:
@@ -202,7 +271,24 @@ def get_liked_blogs_for_user():
 
         return jsonify(likes_schema.dump(liked_blogs, many=True)), 200 
     
+    except PaginationError as err:
+        return jsonify({"error": str(err)}), 400
     except SQLAlchemyError as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
     except Exception as e:
-        return jsonify({"error": "Unexpected error", "details": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": "Unexpected error", "details": str(e)}), 500
+
+# Get the like buffer metrics (Admin/Super Admin only)
+@likes_bp.route('/buffer', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_like_buffer_metrics():
+    """
+    Retrieves the queue depth and flush statistics of the like buffer.
+
+    Requires admin privileges and a valid JWT token.
+
+    Returns:
+        - 200: The like buffer metrics.
+    """
+    return jsonify(like_buffer.metrics()), 200
@@ -6,9 +6,12 @@ from werkzeug.utils import secure_filename
 from init import db
 from models.blog import Blogs
 from models.media import Media, media_schema, medias_schema
-from models.user import User
+from utils import current_user_has_role
+from response_cache import response_cache
+from conditional import conditional
+from loaders import FieldsetError, get_fieldset, sparse_schema, project
 
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.exc import SQLAlchemyError
 
 # Blueprint for media-related routes
@@ -24,6 +27,39 @@ ALLOWED_EXTENSIONS = {
     'mp3', 'wav', 'ogg'  # Audio
 }
 
+def media_version(media_id):
+    """
+    Reads the values identifying a media record, for its ETag. Media records are not edited.
+
+    Args:
+        media_id (int): The ID of the media file.
+
+    Returns:
+        tuple: The version values and upload time, or None if the media is not found.
+    """
+    stmt = select(Media.media_id, Media.created_at).where(Media.media_id == media_id)
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    return tuple(row), row.created_at
+
+def blog_media_version(blog_id):
+    """
+    Reads the values that change whenever the media of a blog change, for their ETag.
+
+    No Last-Modified time is given, since deleting any but the latest upload does not
+    move the latest upload time.
+
+    Args:
+        blog_id (int): The ID of the blog post.
+
+    Returns:
+        tuple: The version values and no last modified time.
+    """
+    stmt = select(func.count(Media.media_id), func.max(Media.media_id)).where(Media.blog_id == blog_id)
+    count, max_id = db.session.execute(stmt).one()
+    return (blog_id, count, max_id), None
+
 def allowed_file(filename):
     """
     Check if the uploaded file has an allowed extension.
@@ -93,6 +129,7 @@ def upload_media():
             )
         db.session.add(media)
         db.session.commit()
+        response_cache.invalidate(f"media_blog:{media.blog_id}")
 
         return media_schema.dump(media), 201
     
@@ -105,6 +142,8 @@ def upload_media():
 # Get media by id route
 @media_bp.route('/<int:media_id>', methods=['GET'])
 @jwt_required()
+@conditional(media_version)
+@response_cache.cached("media", ttl=300, tags=lambda media_id: [f"media:{media_id}"])
 def get_media(media_id):
     """
     Get media information by its ID.
@@ -130,27 +169,36 @@ def get_media(media_id):
 # get the media by blog
 @media_bp.route('/blog/<int:blog_id>', methods=['GET'])
 @jwt_required()
+@conditional(blog_media_version)
+@response_cache.cached("blog_media", ttl=300, tags=lambda blog_id: [f"media_blog:{blog_id}"])
 def get_media_by_blog(blog_id):
     """
     Get all media associated with a specific blog post.
 
-    Requires JWT authentication.
+    Requires JWT authentication. A comma separated 'fields' query parameter returns
+    (and loads) only those fields.
 
     Args:
         blog_id (int): The ID of the blog post.
 
     Returns:
         - 200: If media files are found and returned.
+        - 400: If the fields are invalid.
         - 404: If no media is found for the specified blog.
         - 500: If a database or unexpected error occurs.
     """
-    stmt = select(Media).where(Media.blog_id == blog_id)
+    try:
+        fieldset = get_fieldset(medias_schema)
+    except FieldsetError as err:
+        return jsonify({"error": str(err)}), 400
+
+    stmt = project(select(Media).where(Media.blog_id == blog_id), Media, medias_schema, fieldset)
     media = db.session.execute(stmt).scalars().all()
 
     if not media:
         return jsonify({"error": "No media found for this blog post"}), 404
     
-    return medias_schema.dump(media), 200
+    return sparse_schema(medias_schema, fieldset).dump(media), 200
 
 # delete the media, only the author or admin or super admin
 @media_bp.route('/<int:media_id>', methods=['DELETE'])
@@ -167,7 +215,7 @@ def delete_media(media_id):
     Returns:
         - 200: If the media file is deleted successfully.
         - 403: If the user does not have permission to delete the media.
-        - 404: If the media or user is not found.
+        - 404: If the media is not found.
         - 500: If a database or unexpected error occurs.
     """
     try:
@@ -181,26 +229,21 @@ def delete_media(media_id):
         if not media:
             return jsonify({"error": "Media not found"}), 404
         
-        # Get the current user from db
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
-        
          # Check if the current user is the author of the media
-        is_author = media.blog.user_id == current_user.user_id
+        is_author = media.blog.user_id == current_user_id
         
-        # Check if the current user has admin or super_admin roles using has_role function
-        is_admin = current_user.has_role('Admin') or current_user.has_role('Super Admin')
+        # Check if the current user has admin or super_admin roles from the token claims
+        is_admin = current_user_has_role('Admin', 'Super Admin')
         
         # Only allow if the user is the author or has admin/super_admin role
         if not (is_author or is_admin):
             return jsonify({"error": "You do not have permission to delete this media"}), 403
             
         # Delete the media record from the database
+        blog_id = media.blog_id
         db.session.delete(media)
         db.session.commit()
+        response_cache.invalidate(f"media:{media_id}", f"media_blog:{blog_id}")
 
         # delete the file from the filesystem
         if os.path.exists(media.media_url):
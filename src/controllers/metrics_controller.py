@@ -0,0 +1,27 @@
+from flask import Blueprint, Response
+
+from metrics import metrics
+
+# Blueprint for the metrics route
+metrics_bp = Blueprint('metrics', __name__)
+
+# Prometheus text format content type
+METRICS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metrics route, scraped by Prometheus
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Exposes the request histograms in the Prometheus text format.
+
+    With METRICS_MULTIPROC_DIR set, the histograms of all worker processes are added up.
+    The route is not authenticated, so it should only be reachable from the monitoring
+    network.
+
+    Returns:
+        - 200: The metrics.
+        - 404: If metrics are disabled.
+    """
+    if not metrics.enabled:
+        return Response("Metrics are disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype=METRICS_MIMETYPE)
@@ -3,15 +3,18 @@ from sqlalchemy import select
 from flask_jwt_extended import jwt_required
 
 from init import db
-from utils import admin_required
+from utils import admin_required, bump_role_version, bump_role_version_for_role, invalidate_role_caches
 from models.roles import Role, role_schema, roles_schema
 from models.user import User
+from caching import role_cache, role_version_cache
+from response_cache import response_cache
 
 # Blueprint for roles
 roles_bp = Blueprint('roles', __name__, url_prefix='/roles')
 
 # Read all the roles
 @roles_bp.route('/', methods=['GET'])
+@response_cache.cached("roles", ttl=300, tags=lambda: ["roles"])
 def get_roles():
     """
     Retrieves all roles from the database.
@@ -71,9 +74,11 @@ def assign_role():
         if user.has_role(role.role_name):
             return jsonify({"error": "User already has this role"}), 400
         
-        # Assign the role to the user
+        # Assign the role to the user and invalidate their issued tokens
         user.roles.append(role)
+        bump_role_version([user.user_id])
         db.session.commit()
+        invalidate_role_caches(user.user_id)
 
         return jsonify({"message": "Role assigned successfully"}), 200
     
@@ -116,6 +121,7 @@ def create_role():
         new_role = Role(role_name=role_name)
         db.session.add(new_role)
         db.session.commit()
+        response_cache.invalidate("roles")
 
         role_data = role_schema.dump(new_role)
         return jsonify(role_data), 201
@@ -165,9 +171,12 @@ def update_role(role_id):
         if existing_role:
             return jsonify({"error": "Role name already exists"}), 400
 
-        # Update the role name
+        # Update the role name and invalidate the tokens of users holding it
         role.role_name = new_role_name
+        bump_role_version_for_role(role_id)
         db.session.commit()
+        invalidate_role_caches()
+        response_cache.invalidate("roles")
 
         role_data = role_schema.dump(role)
         return jsonify(role_data), 200
@@ -199,11 +208,28 @@ def delete_role(role_id):
         if not role:
             return jsonify({"error": "Role not found"}), 404
 
+        # Invalidate the tokens of users holding the role before deleting it
+        bump_role_version_for_role(role_id)
         db.session.delete(role)
         db.session.commit()
+        invalidate_role_caches()
+        response_cache.invalidate("roles")
 
         return jsonify({"message": "Role deleted successfully"}), 200
     
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+    
+# Get the role cache statistics (admin only)
+@roles_bp.route('/cache', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_role_cache_stats():
+    """
+    Retrieves the hit/miss counters of the per-process role caches.
+
+    Returns:
+        - 200: The statistics of the role name and role version caches.
+    """
+    return jsonify({"roles": role_cache.stats(), "role_versions": role_version_cache.stats()}), 200
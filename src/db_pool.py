@@ -0,0 +1,178 @@
+import json
+import time
+from functools import wraps
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from init import db
+from metrics import metrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits for a connection and how many
+    checkouts time out.
+    """
+    timeouts = {}
+
+    def _do_get(self):
+        started = time.perf_counter()
+        name = self.logging_name or "default"
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            InstrumentedQueuePool.timeouts[name] = InstrumentedQueuePool.timeouts.get(name, 0) + 1
+            raise
+        finally:
+            metrics.observe("db_pool_wait_seconds", (name,), time.perf_counter() - started)
+
+
+def _flag(environ, key, default):
+    return environ.get(key, str(default)).lower() == "true"
+
+
+def engine_options(uri, environ, pool_name="default"):
+    """
+    Builds the SQLAlchemy engine options for a database from environment variables.
+
+    Variables:
+        DB_POOL_SIZE (int): Connections kept open in the pool. Defaults to 5.
+        DB_MAX_OVERFLOW (int): Extra connections opened under load. Defaults to 10.
+        DB_POOL_TIMEOUT (int): Seconds to wait for a connection before failing. Defaults to 30.
+        DB_POOL_RECYCLE (int): Seconds after which a connection is replaced. Defaults to 1800.
+        DB_POOL_PRE_PING (bool): Test connections before use, so connections broken by a
+            failover are replaced instead of failing a request. On by default.
+        DB_PGBOUNCER (bool): Run behind PgBouncer in transaction pooling mode, with
+            server-side prepared statements turned off in the drivers that use them.
+        SQLALCHEMY_ENGINE_OPTIONS (str): A JSON object of engine options, applied last.
+
+    Args:
+        uri (str): The database URI.
+        environ (dict): The environment variables.
+        pool_name (str): Name of the pool in the metrics.
+
+    Returns:
+        dict: The engine options.
+    """
+    options = {"pool_pre_ping": _flag(environ, "DB_POOL_PRE_PING", True)}
+    url = make_url(uri) if uri else None
+
+    # In-memory SQLite keeps a single connection per thread and takes no pool sizes
+    if url is None or not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options.update({
+            "poolclass": InstrumentedQueuePool,
+            "pool_logging_name": pool_name,
+            "pool_size": int(environ.get("DB_POOL_SIZE", 5)),
+            "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": int(environ.get("DB_POOL_TIMEOUT", 30)),
+            "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        })
+
+    if url is not None and url.get_backend_name() == "postgresql" and _flag(environ, "DB_PGBOUNCER", False):
+        # psycopg2 never prepares statements on the server; psycopg 3 and asyncpg do,
+        # and the prepared statements break once PgBouncer moves the transaction to another connection
+        driver = url.get_driver_name()
+        if driver == "psycopg":
+            options["connect_args"] = {"prepare_threshold": None}
+        elif driver == "asyncpg":
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+
+    if environ.get("SQLALCHEMY_ENGINE_OPTIONS"):
+        options.update(json.loads(environ["SQLALCHEMY_ENGINE_OPTIONS"]))
+    return options
+
+
+def statement_timeout(milliseconds):
+    """
+    Decorator that sets the statement timeout of a route, instead of DB_STATEMENT_TIMEOUT_MS.
+
+    Args:
+        milliseconds (int): The timeout. 0 turns it off, e.g. for long-running exports.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            g.statement_timeout_ms = milliseconds
+            # A transaction opened before the route, e.g. by the role check, takes the new timeout too
+            if db.session().in_transaction():
+                pool_monitor.apply_statement_timeout(db.session.connection())
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PoolMonitor:
+    """
+    Applies the per-request statement timeout and reports the connection pools in /metrics.
+
+    Every transaction a request opens on PostgreSQL starts with SET LOCAL statement_timeout,
+    so a runaway query is cancelled by the server instead of holding a pooled connection.
+    SET LOCAL only lasts for the transaction, which also works behind PgBouncer. Work done
+    outside requests, such as CLI commands and the like buffer, has no timeout.
+
+    Config:
+        DB_STATEMENT_TIMEOUT_MS (int): The timeout of each statement run by a request.
+            0 turns it off. Defaults to 30000.
+    """
+    def __init__(self):
+        self.statement_timeout = 30000
+
+    def init_app(self, app):
+        """
+        Reads the timeout configuration and registers the pool metrics.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.statement_timeout = app.config.get("DB_STATEMENT_TIMEOUT_MS", 30000)
+        app.extensions["pool_monitor"] = self
+        if not event.contains(db.session, "after_begin", self._after_begin):
+            event.listen(db.session, "after_begin", self._after_begin)
+
+        def engines():
+            with app.app_context():
+                return {key or "default": engine for key, engine in db.engines.items()}
+
+        def connections():
+            values = {}
+            for name, engine in engines().items():
+                pool = engine.pool
+                if isinstance(pool, QueuePool):
+                    values[(name, "checked_out")] = pool.checkedout()
+                    values[(name, "idle")] = pool.checkedin()
+            return values
+
+        def capacity():
+            return {
+                (name,): engine.pool.size() + engine.pool._max_overflow
+                for name, engine in engines().items() if isinstance(engine.pool, QueuePool)
+            }
+
+        def timeouts():
+            return {(name,): count for name, count in InstrumentedQueuePool.timeouts.items()}
+
+        metrics.register_collector("db_pool_connections", "Pooled connections by state.", "gauge", ("pool", "state"), connections)
+        metrics.register_collector("db_pool_max_connections", "Most connections the pool may open.", "gauge", ("pool",), capacity)
+        metrics.register_collector("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection.", "counter", ("pool",), timeouts)
+
+    def _after_begin(self, session, transaction, connection):
+        self.apply_statement_timeout(connection)
+
+    def apply_statement_timeout(self, connection):
+        """
+        Sets the statement timeout of the current request on a connection's transaction.
+
+        Args:
+            connection (Connection): The connection, inside a transaction.
+        """
+        if connection.dialect.name != "postgresql" or not has_request_context():
+            return
+        milliseconds = g.get("statement_timeout_ms", self.statement_timeout)
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(milliseconds)}")
+
+
+pool_monitor = PoolMonitor()
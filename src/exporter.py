@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from init import db
+from models.blog import Blogs
+from models.comments import Comments
+from models.likes import Likes
+
+# Columns written by each export, in order. The search vector and comment paths are
+# derived data and are left out.
+EXPORTS = {
+    "blogs": (
+        Blogs.blog_id, Blogs.user_id, Blogs.title, Blogs.content, Blogs.status,
+        Blogs.like_count, Blogs.created_at, Blogs.updated_at,
+    ),
+    "comments": (
+        Comments.comment_id, Comments.blog_id, Comments.user_id, Comments.parent_comment_id,
+        Comments.content, Comments.created_at, Comments.updated_at,
+    ),
+    "likes": (Likes.user_id, Likes.blog_id, Likes.created_at),
+}
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Default number of rows fetched from the server-side cursor at a time
+DEFAULT_EXPORT_BATCH_SIZE = 5000
+
+
+class ExportError(ValueError):
+    """
+    Raised when an unknown export or format is requested.
+    """
+
+
+def _to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_batches(name, fmt="ndjson", batch_size=DEFAULT_EXPORT_BATCH_SIZE):
+    """
+    Streams a table as NDJSON or CSV, one batch of rows at a time.
+
+    Rows are read with yield_per, which uses a server-side cursor on PostgreSQL, so only one
+    batch is held in memory however large the table is. Rows are ordered by primary key.
+
+    Args:
+        name (str): The export to run, one of EXPORTS.
+        fmt (str): "ndjson" or "csv". CSV output starts with a header row.
+        batch_size (int): The number of rows to fetch and encode at a time.
+
+    Returns:
+        generator: Yields the number of rows in each batch and the encoded batch as bytes.
+
+    Raises:
+        ExportError: If the export or format is unknown. Raised straight away, before
+            anything is streamed.
+    """
+    if name not in EXPORTS:
+        raise ExportError(f"Unknown export '{name}'. Available exports: {', '.join(EXPORTS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'. Available formats: {', '.join(EXPORT_FORMATS)}")
+
+    return _export_batches(EXPORTS[name], fmt, batch_size)
+
+
+def _export_batches(columns, fmt, batch_size):
+    keys = [column.key for column in columns]
+    primary_key = [column for column in columns if column.primary_key]
+    stmt = select(*columns).order_by(*primary_key).execution_options(yield_per=batch_size)
+
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(keys)
+        yield 0, buffer.getvalue().encode("utf-8")
+
+    for rows in db.session.execute(stmt).partitions():
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([[_to_text(value) for value in row] for row in rows])
+            chunk = buffer.getvalue()
+        else:
+            chunk = "".join(
+                json.dumps(dict(zip(keys, map(_to_text, row))), ensure_ascii=False, separators=(",", ":")) + "\n"
+                for row in rows
+            )
+        yield len(rows), chunk.encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a stream of byte chunks into a single gzip stream, chunk by chunk.
+
+    Args:
+        chunks (iterable): The uncompressed byte chunks.
+
+    Yields:
+        bytes: The compressed chunks.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,463 @@
+import csv
+import gzip
+import io
+import json
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select, insert, func, text
+
+from init import db
+from models.user import User, user_schema
+from models.roles import Role, UserRole
+from models.blog import Blogs, blog_schema
+from models.category import Category, BlogCategory
+from models.comments import Comments, comment_schema, fill_comment_paths
+from password_hasher import password_hasher
+from utils import bump_comments_version
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+# Default number of rows validated and loaded per transaction
+DEFAULT_IMPORT_BATCH_SIZE = 5000
+
+# Separator of list values (roles, categories) in CSV files
+LIST_SEPARATOR = ";"
+
+# Roles given to imported users that do not list any, the same as registered users get
+DEFAULT_ROLES = ("Author", "Reader")
+
+
+class ImportFileError(ValueError):
+    """
+    Raised when an import file cannot be read.
+    """
+
+
+class ImportAborted(Exception):
+    """
+    Raised when an import stops part way through. The batches loaded before the error
+    stay committed.
+
+    Attributes:
+        totals (dict): The totals of the batches committed before the error.
+    """
+    def __init__(self, message, totals):
+        super().__init__(message)
+        self.totals = totals
+
+
+def read_records(path, fmt=None):
+    """
+    Reads the records of an NDJSON or CSV file, which may be gzipped.
+
+    Args:
+        path (str): The file to read.
+        fmt (str): "ndjson" or "csv". Worked out from the file extension if not given.
+
+    Yields:
+        tuple: The line number and the record as a dict.
+
+    Raises:
+        ImportFileError: If the format is unknown or a line is not valid JSON.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or name.rsplit(".", 1)[-1]
+    if fmt not in IMPORT_FORMATS:
+        raise ImportFileError(f"Unknown format '{fmt}'. Available formats: {', '.join(IMPORT_FORMATS)}")
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as file:
+        if fmt == "csv":
+            # The header is line 1
+            for line, record in enumerate(csv.DictReader(file), start=2):
+                yield line, {key: (value if value != "" else None) for key, value in record.items()}
+        else:
+            for line, content in enumerate(file, start=1):
+                if content.strip():
+                    try:
+                        yield line, json.loads(content)
+                    except json.JSONDecodeError as err:
+                        raise ImportFileError(f"Line {line}: {err}")
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _to_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+    return list(value)
+
+
+def _to_int(value):
+    return None if value is None else int(value)
+
+
+def _to_datetime(value, default=None):
+    if value is None:
+        return default
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def allocate_ids(column, count, taken=0):
+    """
+    Reserves primary key values for rows that are loaded without one.
+
+    Args:
+        column (Column): The integer primary key column.
+        count (int): The number of IDs needed.
+        taken (int): The highest ID given explicitly by rows not loaded yet, which the
+            reserved IDs must come after.
+
+    Returns:
+        list: The reserved IDs.
+    """
+    if count == 0:
+        return []
+    if db.session.get_bind().dialect.name == "postgresql":
+        if taken:
+            reset_sequence(column, taken)
+        stmt = text("SELECT nextval(pg_get_serial_sequence(:table, :column)) FROM generate_series(1, :count)")
+        params = {"table": column.table.name, "column": column.name, "count": count}
+        return list(db.session.execute(stmt, params).scalars())
+    # Other databases have a single writer, so the IDs after the current maximum are free
+    start = max(db.session.execute(select(func.max(column))).scalar() or 0, taken) + 1
+    return list(range(start, start + count))
+
+
+def reset_sequence(column, taken=0):
+    """
+    Moves a PostgreSQL ID sequence past the highest ID, after rows were loaded with explicit IDs.
+
+    The sequence is never moved back, so IDs it has already handed out are not reused.
+
+    Args:
+        column (Column): The integer primary key column.
+        taken (int): An explicit ID not loaded yet that the sequence must also move past.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        stmt = text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), greatest("
+            f"coalesce((SELECT max({column.name}) FROM {column.table.name}), 0), :taken, "
+            f"coalesce(pg_sequence_last_value(pg_get_serial_sequence(:table, :column)::regclass), 0)) + 1, false)"
+        )
+        db.session.execute(stmt, {"table": column.table.name, "column": column.name, "taken": taken})
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def load_rows(table, rows):
+    """
+    Loads rows into a table in bulk.
+
+    On PostgreSQL the rows are streamed with COPY, on other databases they are sent as
+    multi-row INSERT statements.
+
+    Args:
+        table (Table): The table to load.
+        rows (list): The rows as dicts, all with the same keys.
+    """
+    if not rows:
+        return
+    columns = list(rows[0])
+
+    if db.session.get_bind().dialect.name != "postgresql":
+        db.session.execute(insert(table), rows)
+        return
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_value(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+class _Lookups:
+    """
+    Resolves natural keys (role, category and user names) to IDs during an import.
+
+    Roles and categories are small and loaded once. Users and blogs are looked up per batch.
+    """
+    def __init__(self):
+        self._roles = None
+        self._categories = None
+
+    def roles(self):
+        if self._roles is None:
+            self._roles = dict(db.session.execute(select(Role.role_name, Role.role_id)).all())
+        return self._roles
+
+    def categories(self):
+        if self._categories is None:
+            self._categories = dict(db.session.execute(select(Category.category_name, Category.category_id)).all())
+        return self._categories
+
+    def user_ids(self, batch):
+        usernames = {record["username"] for _, record in batch if record.get("username")}
+        if not usernames:
+            return {}
+        stmt = select(User.username, User.user_id).where(User.username.in_(usernames))
+        return dict(db.session.execute(stmt).all())
+
+    def blog_ids(self, batch):
+        ids = set()
+        for _, record in batch:
+            try:
+                ids.add(_to_int(record.get("blog_id")))
+            except (TypeError, ValueError):
+                pass
+        ids.discard(None)
+        if not ids:
+            return set()
+        return set(db.session.execute(select(Blogs.blog_id).where(Blogs.blog_id.in_(ids))).scalars())
+
+
+def _resolve_user(record, user_ids, errors):
+    if record.get("user_id") is not None:
+        return _to_int(record["user_id"])
+    user_id = user_ids.get(record.get("username"))
+    if user_id is None:
+        errors["username"] = [f"Unknown user '{record.get('username')}'"]
+    return user_id
+
+
+def _assign_ids(rows, column):
+    missing = [row for row in rows if row[column.key] is None]
+    # IDs are allocated after the batch's explicit IDs, which are not in the table yet
+    taken = max((row[column.key] for row in rows if row[column.key] is not None), default=0)
+    for row, new_id in zip(missing, allocate_ids(column, len(missing), taken)):
+        row[column.key] = new_id
+
+
+def _prepare_users(batch, lookups, now):
+    rows, links, errors, passwords = [], [], [], []
+    for line, record in batch:
+        data = {"email": record.get("email"), "new_password": record.get("password")}
+        partial = False
+        if record.get("password_hash"):
+            # Users migrated with an existing bcrypt hash have no plaintext password
+            del data["new_password"]
+            partial = ("new_password",)
+        problems = user_schema.validate(data, partial=partial)
+        if not record.get("username"):
+            problems["username"] = ["Missing data for required field."]
+
+        role_names = _to_list(record.get("roles")) or list(DEFAULT_ROLES)
+        unknown = [name for name in role_names if name not in lookups.roles()]
+        if unknown:
+            problems["roles"] = [f"Unknown roles: {', '.join(unknown)}"]
+
+        try:
+            row = {
+                "user_id": _to_int(record.get("user_id")),
+                "username": record.get("username"),
+                "email": record.get("email"),
+                "password_hash": record.get("password_hash"),
+                "created_at": _to_datetime(record.get("created_at"), now),
+                "role_version": 0,
+            }
+        except (TypeError, ValueError) as err:
+            problems["_row"] = [str(err)]
+
+        if problems:
+            errors.append((line, problems))
+            continue
+
+        rows.append(row)
+        links.append([lookups.roles()[name] for name in role_names])
+        if row["password_hash"] is None:
+            passwords.append((row, record["password"]))
+
+    # Hash the plaintext passwords of the whole batch in the worker pool
+    hashes = password_hasher.hash_many([password for _, password in passwords])
+    for (row, _), password_hash in zip(passwords, hashes):
+        row["password_hash"] = password_hash
+
+    _assign_ids(rows, User.user_id)
+    user_roles = [{"user_id": row["user_id"], "role_id": role_id} for row, role_ids in zip(rows, links) for role_id in role_ids]
+    return rows, [(UserRole.__table__, user_roles)], errors
+
+
+def _prepare_blogs(batch, lookups, now):
+    rows, links, errors = [], [], []
+    user_ids = lookups.user_ids(batch)
+    for line, record in batch:
+        data = {key: record.get(key) for key in ("title", "content", "status")}
+        problems = blog_schema.validate(data)
+        user_id = _resolve_user(record, user_ids, problems)
+
+        category_names = _to_list(record.get("categories"))
+        unknown = [name for name in category_names if name not in lookups.categories()]
+        if unknown:
+            problems["categories"] = [f"Unknown categories: {', '.join(unknown)}"]
+
+        try:
+            row = {
+                "blog_id": _to_int(record.get("blog_id")),
+                "user_id": user_id,
+                "title": record.get("title"),
+                "content": record.get("content"),
+                "status": record.get("status"),
+                # Likes are not imported, so the counter starts at zero like the likes table
+                "like_count": 0,
+                "created_at": _to_datetime(record.get("created_at"), now),
+                "updated_at": _to_datetime(record.get("updated_at")),
+            }
+        except (TypeError, ValueError) as err:
+            problems["_row"] = [str(err)]
+
+        if problems:
+            errors.append((line, problems))
+            continue
+
+        rows.append(row)
+        links.append([lookups.categories()[name] for name in category_names])
+
+    _assign_ids(rows, Blogs.blog_id)
+    blog_categories = [{"category_id": category_id, "blog_id": row["blog_id"]} for row, category_ids in zip(rows, links) for category_id in category_ids]
+    return rows, [(BlogCategory.__table__, blog_categories)], errors
+
+
+def _prepare_comments(batch, lookups, now):
+    rows, errors = [], []
+    user_ids = lookups.user_ids(batch)
+    blog_ids = lookups.blog_ids(batch)
+    for line, record in batch:
+        problems = {}
+        try:
+            data = {"content": record.get("content"), "parent_comment_id": _to_int(record.get("parent_comment_id"))}
+            problems = comment_schema.validate(data)
+            if record.get("blog_id") is None:
+                problems["blog_id"] = ["Missing data for required field."]
+            elif _to_int(record["blog_id"]) not in blog_ids:
+                problems["blog_id"] = [f"Unknown blog {record['blog_id']}"]
+            row = {
+                "comment_id": _to_int(record.get("comment_id")),
+                "blog_id": _to_int(record.get("blog_id")),
+                "user_id": _resolve_user(record, user_ids, problems),
+                "parent_comment_id": data["parent_comment_id"],
+                "content": record.get("content"),
+                "created_at": _to_datetime(record.get("created_at"), now),
+                "updated_at": _to_datetime(record.get("updated_at")),
+                # Filled in by fill_comment_paths once the batch is loaded
+                "path": None,
+            }
+        except (TypeError, ValueError) as err:
+            problems["_row"] = [str(err)]
+
+        if problems:
+            errors.append((line, problems))
+            continue
+        rows.append(row)
+
+    _assign_ids(rows, Comments.comment_id)
+    return rows, [], errors
+
+
+def _fill_paths(comment_ids):
+    # Fills in the paths of the loaded comments and returns those still without one
+    if fill_comment_paths(comment_ids) == len(comment_ids):
+        return []
+    stmt = select(Comments.comment_id).where(Comments.comment_id.in_(comment_ids), Comments.path.is_(None))
+    return list(db.session.execute(stmt).scalars())
+
+
+# Table, primary key and row preparation of each import
+IMPORTS = {
+    "users": (User.__table__, User.user_id, _prepare_users),
+    "blogs": (Blogs.__table__, Blogs.blog_id, _prepare_blogs),
+    "comments": (Comments.__table__, Comments.comment_id, _prepare_comments),
+}
+
+
+def import_file(name, path, fmt=None, batch_size=DEFAULT_IMPORT_BATCH_SIZE, on_batch=None):
+    """
+    Validates and bulk loads the users, blogs or comments in an NDJSON or CSV file.
+
+    Records are validated with the model schemas a batch at a time, and each batch is loaded
+    and committed in its own transaction. Invalid records are skipped and reported.
+
+    Users, blogs and comments may refer to users by "username" instead of "user_id", and to
+    roles ("roles") and categories ("categories") by name. Users are imported with either a
+    plaintext "password", hashed in the password hasher's worker pool, or an existing
+    bcrypt "password_hash". Records keep their IDs if they have one.
+
+    Args:
+        name (str): "users", "blogs" or "comments".
+        path (str): The file to import.
+        fmt (str): "ndjson" or "csv". Worked out from the file extension if not given.
+        batch_size (int): The number of records per transaction.
+        on_batch (callable): Called after each batch with the running totals.
+
+    Returns:
+        dict: The number of records imported and rejected, the rejected line numbers with
+            their errors, and the elapsed time in seconds.
+
+    Raises:
+        ImportAborted: If the file cannot be read or a batch cannot be loaded, with the
+            totals of the batches committed before the error.
+    """
+    table, id_column, prepare = IMPORTS[name]
+    lookups = _Lookups()
+    # Comments whose parent is in a later batch get their path once the parent is loaded
+    pathless = []
+    totals = {"imported": 0, "rejected": 0, "errors": [], "seconds": 0.0}
+    started = time.perf_counter()
+
+    try:
+        for batch in _batches(read_records(path, fmt), batch_size):
+            now = datetime.now(timezone.utc)
+            rows, links, errors = prepare(batch, lookups, now)
+            load_rows(table, rows)
+            for link_table, link_rows in links:
+                load_rows(link_table, link_rows)
+            if name == "comments":
+                pathless = _fill_paths(pathless + [row["comment_id"] for row in rows])
+                bump_comments_version({row["blog_id"] for row in rows})
+            db.session.commit()
+
+            totals["imported"] += len(rows)
+            totals["rejected"] += len(errors)
+            totals["errors"].extend(errors)
+            totals["seconds"] = time.perf_counter() - started
+            if on_batch:
+                on_batch(totals)
+
+        reset_sequence(id_column)
+        db.session.commit()
+    except Exception as err:
+        db.session.rollback()
+        totals["seconds"] = time.perf_counter() - started
+        raise ImportAborted(str(err), totals) from err
+    totals["seconds"] = time.perf_counter() - started
+    return totals
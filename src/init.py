@@ -3,8 +3,10 @@ from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# Reads of read-only requests can be routed to replicas, see replicas.ReplicaRouter
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 bcrypt = Bcrypt()
 jwt = JWTManager()
\ No newline at end of file
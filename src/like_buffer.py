@@ -0,0 +1,211 @@
+import atexit
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import select, update, delete, bindparam, tuple_
+
+from init import db
+from models.blog import Blogs
+from models.likes import Likes
+from models.user import User
+from utils import insert_or_ignore
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for likes and unlikes.
+
+    When enabled, the like routes queue (user_id, blog_id) pairs here instead of writing them
+    straight away. Only the latest action for each pair is kept, and a background thread
+    writes the queue to the database with multi-row INSERTs and DELETEs of up to
+    WRITE_BATCH_SIZE pairs each, in one transaction, either every
+    LIKE_BUFFER_FLUSH_INTERVAL_MS milliseconds or once LIKE_BUFFER_MAX_ENTRIES pairs are queued.
+    The queue is also flushed when the process exits.
+
+    Config:
+        LIKE_BUFFER_ENABLED (bool): Turns buffering on. Off by default.
+        LIKE_BUFFER_FLUSH_INTERVAL_MS (int): Time between flushes. Defaults to 500.
+        LIKE_BUFFER_MAX_ENTRIES (int): Queue size that triggers an early flush. Defaults to 1000.
+    """
+    # Largest number of pairs written by a single statement
+    WRITE_BATCH_SIZE = 500
+
+    def __init__(self):
+        self.enabled = False
+        self.flush_interval = 0.5
+        self.max_entries = 1000
+        self._app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {
+            "flushes": 0,
+            "flush_errors": 0,
+            "likes_written": 0,
+            "likes_deleted": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    def init_app(self, app):
+        """
+        Reads the buffer configuration and starts the flush thread if buffering is enabled.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self._app = app
+        self.enabled = app.config.get("LIKE_BUFFER_ENABLED", False)
+        self.flush_interval = app.config.get("LIKE_BUFFER_FLUSH_INTERVAL_MS", 500) / 1000
+        self.max_entries = app.config.get("LIKE_BUFFER_MAX_ENTRIES", 1000)
+        app.extensions["like_buffer"] = self
+
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="like-buffer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def add(self, user_id, blog_id):
+        """
+        Queues a like of a blog by a user.
+        """
+        self._queue(user_id, blog_id, True)
+
+    def remove(self, user_id, blog_id):
+        """
+        Queues the removal of a like of a blog by a user.
+        """
+        self._queue(user_id, blog_id, False)
+
+    def _queue(self, user_id, blog_id, liked):
+        with self._lock:
+            # A later action on the same pair replaces the earlier one
+            self._pending[(int(user_id), int(blog_id))] = liked
+            depth = len(self._pending)
+
+        if depth >= self.max_entries:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """
+        Stops the flush thread and writes anything still queued.
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def flush(self):
+        """
+        Writes all queued likes and unlikes to the database.
+
+        Likes are inserted with 'ON CONFLICT DO NOTHING' and unlikes deleted in statements
+        of up to WRITE_BATCH_SIZE pairs, all in one transaction. The blog like counters are
+        adjusted by the number of rows each statement actually changed. If the write fails,
+        the batch is put back on the queue unless a newer action for the same pair has been
+        queued since.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            try:
+                with self._app.app_context():
+                    self._write(batch)
+            except Exception as e:
+                with self._lock:
+                    for pair, liked in batch.items():
+                        self._pending.setdefault(pair, liked)
+                    self._stats["flush_errors"] += 1
+                self._app.logger.error(f"Like buffer flush failed: {e}")
+                return
+
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["last_flush_ms"] = elapsed
+                self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed)
+
+    def _write(self, batch):
+        likes = [pair for pair, liked in batch.items() if liked]
+        unlikes = [pair for pair, liked in batch.items() if not liked]
+        deltas = Counter()
+        written = deleted_count = 0
+
+        try:
+            # Each statement takes at most WRITE_BATCH_SIZE pairs, so a large backlog stays
+            # within the driver's bind parameter limit
+            for start in range(0, len(likes), self.WRITE_BATCH_SIZE):
+                chunk = likes[start:start + self.WRITE_BATCH_SIZE]
+                # Skip pairs that point at users or blogs that no longer exist
+                user_ids = {user_id for user_id, _ in chunk}
+                blog_ids = {blog_id for _, blog_id in chunk}
+                valid_users = set(db.session.execute(select(User.user_id).where(User.user_id.in_(user_ids))).scalars())
+                valid_blogs = set(db.session.execute(select(Blogs.blog_id).where(Blogs.blog_id.in_(blog_ids))).scalars())
+                rows = [
+                    {"user_id": user_id, "blog_id": blog_id}
+                    for user_id, blog_id in chunk
+                    if user_id in valid_users and blog_id in valid_blogs
+                ]
+
+                if rows:
+                    stmt = insert_or_ignore(Likes).values(rows).returning(Likes.blog_id)
+                    inserted = db.session.execute(stmt).scalars().all()
+                    deltas.update(inserted)
+                    written += len(inserted)
+
+            for start in range(0, len(unlikes), self.WRITE_BATCH_SIZE):
+                chunk = unlikes[start:start + self.WRITE_BATCH_SIZE]
+                stmt = delete(Likes).where(tuple_(Likes.user_id, Likes.blog_id).in_(chunk)).returning(Likes.blog_id)
+                deleted = db.session.execute(stmt).scalars().all()
+                deltas.subtract(deleted)
+                deleted_count += len(deleted)
+
+            # Adjust the like counters by what actually changed
+            changes = [{"b_id": blog_id, "delta": delta} for blog_id, delta in deltas.items() if delta]
+            if changes:
+                blogs = Blogs.__table__
+                stmt = (
+                    update(blogs)
+                    .where(blogs.c.blog_id == bindparam("b_id"))
+                    .values(like_count=blogs.c.like_count + bindparam("delta"), updated_at=blogs.c.updated_at)
+                )
+                db.session.connection().execute(stmt, changes)
+
+            db.session.commit()
+            with self._lock:
+                self._stats["likes_written"] += written
+                self._stats["likes_deleted"] += deleted_count
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+    def metrics(self):
+        """
+        Returns the current queue depth and flush statistics.
+
+        Returns:
+            dict: The queue depth, flush counts and flush latencies in milliseconds.
+        """
+        with self._lock:
+            return {"enabled": self.enabled, "queue_depth": len(self._pending), **self._stats}
+
+
+like_buffer = LikeBuffer()
@@ -0,0 +1,131 @@
+from flask import request
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload, load_only
+
+from caching import MISSING, LRUCache
+
+
+class FieldsetError(ValueError):
+    """
+    Raised when the 'fields' query parameter names a field the listing does not have.
+    """
+
+
+# Schemas narrowed to a set of fields, as (schema, frozenset of fields): schema. Entries never
+# expire, the size limit bounds the fieldsets clients can make the process keep
+_sparse_schemas = LRUCache(maxsize=256, ttl=float("inf"))
+
+
+def eager_load(stmt, *relationships):
+    """
+    Adds eager loading options to a select statement for the given relationships.
+
+    Listing endpoints pass the relationships their schema will serialise, so the related
+    rows are fetched up front instead of with one lazy query per row. Many-to-one
+    relationships are joined into the main query, collections are loaded with a single
+    extra 'SELECT ... WHERE id IN (...)' query.
+
+    Args:
+        stmt (Select): The select statement to add the loader options to.
+        *relationships (InstrumentedAttribute): The relationship attributes to eager load,
+            e.g. Blogs.user or User.roles.
+
+    Returns:
+        Select: The select statement with the loader options applied.
+    """
+    options = []
+    for relationship in relationships:
+        if relationship.property.uselist:
+            options.append(selectinload(relationship))
+        else:
+            options.append(joinedload(relationship))
+
+    return stmt.options(*options)
+
+
+def get_fieldset(schema):
+    """
+    Reads and validates the 'fields' query parameter of the current request.
+
+    Args:
+        schema (Schema): The schema of the listing, whose fields may be requested.
+
+    Returns:
+        tuple: The requested field names in order, or None to return every field.
+
+    Raises:
+        FieldsetError: If the parameter is empty or names an unknown field.
+    """
+    if "fields" not in request.args:
+        return None
+
+    names = tuple(dict.fromkeys(name.strip() for name in request.args["fields"].split(",") if name.strip()))
+    if not names:
+        raise FieldsetError("At least one field is required")
+
+    unknown = [name for name in names if name not in schema.dump_fields]
+    if unknown:
+        raise FieldsetError(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(schema.dump_fields)}")
+
+    return names
+
+
+def sparse_schema(schema, fieldset):
+    """
+    Returns a copy of a schema that only dumps the given fields.
+
+    The most recently used copies are kept, so a fieldset is usually only built (and
+    compiled by the serializers) once. The fields are dumped in the schema's order, so the
+    same fields asked for in any order share a copy.
+
+    Args:
+        schema (Schema): The full schema.
+        fieldset (tuple): The field names from get_fieldset, which checks them against the
+            schema, or None for every field.
+
+    Returns:
+        Schema: The narrowed schema, or the full schema if fieldset is None.
+    """
+    if fieldset is None:
+        return schema
+
+    key = (schema, frozenset(fieldset))
+    narrowed = _sparse_schemas.get(key)
+    if narrowed is MISSING:
+        only = tuple(name for name in schema.dump_fields if name in fieldset)
+        narrowed = type(schema)(only=only, many=schema.many)
+        _sparse_schemas.set(key, narrowed)
+    return narrowed
+
+
+def project(stmt, model, schema, fieldset=None, always=()):
+    """
+    Narrows a select statement to the columns and relationships a listing will dump.
+
+    Only the model's columns behind the dumped fields are loaded (with load_only), and only
+    the relationships behind them are eager loaded, so large columns a client did not ask
+    for are never read from the database.
+
+    Args:
+        stmt (Select): The select statement for the model.
+        model (Model): The model being listed.
+        schema (Schema): The full schema of the listing.
+        fieldset (tuple): The field names from get_fieldset, or None for every field.
+        always (tuple): Columns to load regardless, e.g. the columns a cursor is built from.
+
+    Returns:
+        Select: The select statement with the loader options applied.
+    """
+    mapper = inspect(model)
+    columns = list(always)
+    relationships = []
+    for name in fieldset or schema.dump_fields:
+        attribute = schema.dump_fields[name].attribute or name
+        if attribute in mapper.column_attrs:
+            columns.append(getattr(model, attribute))
+        elif attribute in mapper.relationships:
+            relationships.append(getattr(model, attribute))
+
+    if columns:
+        stmt = stmt.options(load_only(*columns))
+    return eager_load(stmt, *relationships)
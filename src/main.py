@@ -3,6 +3,14 @@ import os
 from flask import Flask
 
 from init import db, ma, bcrypt, jwt
+from like_buffer import like_buffer
+from password_hasher import password_hasher
+from caching import role_cache, role_version_cache
+from response_cache import response_cache
+from sql_stats import sql_stats
+from metrics import metrics
+from db_pool import engine_options, pool_monitor
+from replicas import replica_router
 from controllers.cli_controllers import db_commands
 from controllers.auth_controller import auth_bp
 from controllers.blog_controller import blog_bp
@@ -11,6 +19,8 @@ from controllers.roles_controller import roles_bp
 from controllers.comment_controller import comments_bp
 from controllers.category_controller import category_bp
 from controllers.media_controller import media_bp
+from controllers.export_controller import export_bp
+from controllers.metrics_controller import metrics_bp
 
 
 def create_app():
@@ -19,13 +29,65 @@ def create_app():
     # Set configurations
     app.json.sort_keys = False
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URI")
+    # Connection pool sizes, health checks and PgBouncer mode, see db_pool.engine_options
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], os.environ)
+    # Read replicas, as a comma separated list of URIs, each with its own pool
+    replica_uris = [uri.strip() for uri in os.environ.get("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+    app.config["SQLALCHEMY_BINDS"] = {
+        f"replica_{number}": {"url": uri, **engine_options(uri, os.environ, pool_name=f"replica_{number}")}
+        for number, uri in enumerate(replica_uris)
+    }
+    app.config["REPLICA_SELECTION"] = os.environ.get("REPLICA_SELECTION", "round_robin")
+    app.config["REPLICA_MAX_LAG_SECONDS"] = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+    app.config["REPLICA_LAG_CHECK_SECONDS"] = float(os.environ.get("REPLICA_LAG_CHECK_SECONDS", 5))
+    app.config["REPLICA_RETRY_SECONDS"] = float(os.environ.get("REPLICA_RETRY_SECONDS", 30))
+    app.config["REPLICA_STICKY_SECONDS"] = float(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+    # Statement timeout of the queries run by each request, 0 turns it off
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
     app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY")
+    # How long each process trusts a cached user role version before re-reading it
+    app.config["ROLE_VERSION_CACHE_SECONDS"] = int(os.environ.get("ROLE_VERSION_CACHE_SECONDS", 30))
+    # Worker processes for bcrypt and how many hashes may be queued before shedding load
+    app.config["PASSWORD_POOL_SIZE"] = int(os.environ.get("PASSWORD_POOL_SIZE", os.cpu_count() or 1))
+    if os.environ.get("PASSWORD_QUEUE_LIMIT"):
+        app.config["PASSWORD_QUEUE_LIMIT"] = int(os.environ["PASSWORD_QUEUE_LIMIT"])
+    # Size and lifetime of the per-process cache of user role names
+    app.config["ROLE_CACHE_SIZE"] = int(os.environ.get("ROLE_CACHE_SIZE", 10000))
+    app.config["ROLE_CACHE_SECONDS"] = int(os.environ.get("ROLE_CACHE_SECONDS", 60))
+    # Write-behind buffering of likes (off by default)
+    app.config["LIKE_BUFFER_ENABLED"] = os.environ.get("LIKE_BUFFER_ENABLED", "false").lower() == "true"
+    app.config["LIKE_BUFFER_FLUSH_INTERVAL_MS"] = int(os.environ.get("LIKE_BUFFER_FLUSH_INTERVAL_MS", 500))
+    app.config["LIKE_BUFFER_MAX_ENTRIES"] = int(os.environ.get("LIKE_BUFFER_MAX_ENTRIES", 1000))
+    # Caching of read-mostly responses, in-process ("lru") or in a key-value store ("kv")
+    app.config["RESPONSE_CACHE_ENABLED"] = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    app.config["RESPONSE_CACHE_BACKEND"] = os.environ.get("RESPONSE_CACHE_BACKEND", "lru")
+    app.config["RESPONSE_CACHE_SIZE"] = int(os.environ.get("RESPONSE_CACHE_SIZE", 10000))
+    # Per-request SQL query counts and timings, and the budgets over which requests are flagged
+    app.config["SQL_STATS_ENABLED"] = os.environ.get("SQL_STATS_ENABLED", "true").lower() == "true"
+    app.config["SQL_QUERY_BUDGET"] = int(os.environ.get("SQL_QUERY_BUDGET", 20))
+    app.config["SQL_TIME_BUDGET_MS"] = int(os.environ.get("SQL_TIME_BUDGET_MS", 200))
+    app.config["SQL_SLOW_QUERY_MS"] = int(os.environ.get("SQL_SLOW_QUERY_MS", 100))
+    # Request histograms served at /metrics, shared between worker processes through files in a directory
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    app.config["METRICS_MULTIPROC_DIR"] = os.environ.get("METRICS_MULTIPROC_DIR")
+    app.config["METRICS_FLUSH_SECONDS"] = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
 
     # Initialise Flask extensions
     db.init_app(app)
     ma.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
+    like_buffer.init_app(app)
+    password_hasher.init_app(app)
+    response_cache.init_app(app)
+    sql_stats.init_app(app)
+    metrics.init_app(app)
+    pool_monitor.init_app(app)
+    replica_router.init_app(app)
+
+    # Configure the role caches
+    role_cache.configure(maxsize=app.config["ROLE_CACHE_SIZE"], ttl=app.config["ROLE_CACHE_SECONDS"])
+    role_version_cache.configure(maxsize=app.config["ROLE_CACHE_SIZE"], ttl=app.config["ROLE_VERSION_CACHE_SECONDS"])
     
     # Registering blueprints
     app.register_blueprint(db_commands)
@@ -36,6 +98,8 @@ def create_app():
     app.register_blueprint(comments_bp)
     app.register_blueprint(category_bp)
     app.register_blueprint(media_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(metrics_bp)
 
     return app
 
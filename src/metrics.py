@@ -0,0 +1,334 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+# Bucket upper bounds, in seconds, of the timing histograms
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Bucket upper bounds, in bytes, of the response size histogram
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Label names of the request histograms, in order
+REQUEST_LABELS = ("blueprint", "route", "method", "status")
+
+# How the values of a collector from several processes are combined. The "live" modes only
+# use the processes still running, so a gauge drops the state of workers that have exited
+AGGREGATIONS = {
+    "sum": sum,
+    "livesum": sum,
+    "livemax": max,
+    "livemin": min,
+}
+
+# Histograms, as name: (help text, buckets, label names)
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Time taken to handle the request.", TIME_BUCKETS, REQUEST_LABELS),
+    "http_request_db_seconds": ("Time spent running SQL statements for the request.", TIME_BUCKETS, REQUEST_LABELS),
+    "http_request_serialization_seconds": ("Time spent serialising the response with the compiled serializers.", TIME_BUCKETS, REQUEST_LABELS),
+    "http_response_size_bytes": ("Size of the response body, for responses of known length.", SIZE_BUCKETS, REQUEST_LABELS),
+    "db_pool_wait_seconds": ("Time spent waiting for a connection from the pool.", TIME_BUCKETS, ("pool",)),
+}
+
+
+def record_serialization(seconds):
+    """
+    Adds serialisation time to the current request's metrics.
+
+    Args:
+        seconds (float): The time taken.
+    """
+    if has_request_context():
+        g.metrics_serialization = g.get("metrics_serialization", 0.0) + seconds
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _is_running(path):
+    # The process ID is in the name of each per-process file
+    pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """
+    Request latency, database time, serialisation time and response size histograms.
+
+    Observations are labelled with the blueprint, route template, method and status of the
+    request, and exposed in the Prometheus text format by the /metrics route.
+
+    Threads record into one of SHARDS sets of series, picked by OS thread ID and each with
+    its own lock, so concurrent requests rarely wait for each other and the memory used
+    stays the same however many threads the server starts. The shards are summed when the
+    metrics are collected. Other extensions can add gauges and counters read from their own
+    state with register_collector.
+
+    With several worker processes, set METRICS_MULTIPROC_DIR to a directory shared by the
+    workers and emptied when the server starts. Every process then writes its totals to a
+    file in it every METRICS_FLUSH_SECONDS and on exit, and /metrics adds up the files of
+    all processes, whichever worker serves the scrape. Collector values are combined as
+    each collector's aggregation says, and gauges leave out the workers that have exited.
+
+    Config:
+        METRICS_ENABLED (bool): Turns the metrics on. On by default.
+        METRICS_MULTIPROC_DIR (str): Directory for the per-process files. Unset by default.
+        METRICS_FLUSH_SECONDS (float): Time between writes of the per-process file. Defaults to 5.
+    """
+    # Number of sets of series observations are spread over
+    SHARDS = 16
+
+    def __init__(self):
+        self.enabled = True
+        self.multiproc_dir = None
+        self.flush_interval = 5.0
+        self._pid = None
+        self._shards = self._new_shards()
+        self._process_lock = threading.Lock()
+        self._flush_thread = None
+        self._collectors = {}
+
+    def init_app(self, app):
+        """
+        Reads the metrics configuration and starts recording the requests of the app.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.enabled = app.config.get("METRICS_ENABLED", True)
+        self.multiproc_dir = app.config.get("METRICS_MULTIPROC_DIR")
+        self.flush_interval = app.config.get("METRICS_FLUSH_SECONDS", 5.0)
+        app.extensions["metrics"] = self
+
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+
+    def register_collector(self, name, help_text, metric_type, labels, callback, aggregation=None):
+        """
+        Adds a gauge or counter whose values are read when the metrics are collected.
+
+        Args:
+            name (str): The metric name.
+            help_text (str): The description shown in the exposition.
+            metric_type (str): "gauge" or "counter".
+            labels (tuple): The label names.
+            callback (callable): Returns the current values as a dict of label values: value.
+            aggregation (str): How the values of several processes are combined, one of
+                AGGREGATIONS. Defaults to "sum" for counters and "livesum" for gauges.
+        """
+        if aggregation is None:
+            aggregation = "sum" if metric_type == "counter" else "livesum"
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}'. Available aggregations: {', '.join(AGGREGATIONS)}")
+        self._collectors[name] = (help_text, metric_type, labels, callback, aggregation)
+
+    def _collect_values(self):
+        values = {}
+        for name, (_, _, _, callback, _) in self._collectors.items():
+            for labels, value in callback().items():
+                values[(name, tuple(labels))] = value
+        return values
+
+    def _new_shards(self):
+        return [(threading.Lock(), {}) for _ in range(self.SHARDS)]
+
+    def _shard(self):
+        if self._pid != os.getpid():
+            self._start_process()
+        return self._shards[threading.get_native_id() % self.SHARDS]
+
+    def _start_process(self):
+        with self._process_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker starts empty, its parent's series are counted by the parent
+            self._pid = os.getpid()
+            self._shards = self._new_shards()
+            if self.multiproc_dir:
+                os.makedirs(self.multiproc_dir, exist_ok=True)
+                self._flush_thread = threading.Thread(target=self._run_flush, name="metrics-flush", daemon=True)
+                self._flush_thread.start()
+                atexit.register(self.flush)
+
+    def observe(self, name, labels, value):
+        """
+        Records one observation in a histogram.
+
+        Args:
+            name (str): The histogram, one of HISTOGRAMS.
+            labels (tuple): The label values, in the order of the histogram's label names.
+            value (float): The observed value.
+        """
+        lock, series = self._shard()
+        key = (name, labels)
+        with lock:
+            entry = series.get(key)
+            if entry is None:
+                buckets = HISTOGRAMS[name][1]
+                # One count per bucket plus the +Inf bucket, then the sum and the count
+                entry = series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self):
+        """
+        Sums the series of every shard in this process.
+
+        Returns:
+            dict: The histograms as (name, labels): [bucket counts, sum, count].
+        """
+        totals = {}
+        for lock, series in self._shards:
+            with lock:
+                snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in series.items()]
+            for key, counts, total, count in snapshot:
+                merged = totals.setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return totals
+
+    def _path(self, pid):
+        return os.path.join(self.multiproc_dir, f"metrics-{pid}.json")
+
+    def flush(self):
+        """
+        Writes this process's totals to its file in METRICS_MULTIPROC_DIR.
+        """
+        if not self.multiproc_dir or self._pid != os.getpid():
+            return
+        snapshot = {
+            "histograms": [[name, list(labels), *entry] for (name, labels), entry in self.collect().items()],
+            "values": [[name, list(labels), value] for (name, labels), value in self._collect_values().items()],
+        }
+        path = self._path(self._pid)
+        # Written to a temporary file and renamed, so readers never see a partial file
+        with open(path + ".tmp", "w") as file:
+            json.dump(snapshot, file)
+        os.replace(path + ".tmp", path)
+
+    def _run_flush(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect_all(self):
+        """
+        Sums the series and combines the collector values of every process when
+        METRICS_MULTIPROC_DIR is set, or returns those of this process otherwise.
+
+        Returns:
+            tuple: The histograms as (name, labels): [bucket counts, sum, count], and the
+                collector values as (name, labels): value.
+        """
+        # This process's own totals are taken live rather than from its last flush
+        totals = self.collect()
+        values = self._collect_values()
+        if not self.multiproc_dir:
+            return totals, values
+
+        # The values of every process for each series, combined once all files are read
+        gathered = {key: [value] for key, value in values.items()}
+        own = self._path(os.getpid())
+        for path in glob.glob(os.path.join(self.multiproc_dir, "metrics-*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            live = _is_running(path)
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                if name not in HISTOGRAMS:
+                    continue
+                merged = totals.setdefault((name, tuple(labels)), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+            # Histograms and counters of exited workers still count, their gauges do not
+            for name, labels, value in snapshot["values"]:
+                if name in self._collectors and (live or not self._collectors[name][4].startswith("live")):
+                    gathered.setdefault((name, tuple(labels)), []).append(value)
+
+        values = {key: AGGREGATIONS[self._collectors[key[0]][4]](found) for key, found in gathered.items()}
+        return totals, values
+
+    def render(self):
+        """
+        Formats the metrics of all processes in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        totals, values = self.collect_all()
+        lines = []
+        for name, (help_text, buckets, label_names) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (series_name, labels), (counts, total, count) in sorted(totals.items()):
+                if series_name != name:
+                    continue
+                label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else _format_bound(bound)
+                    lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label_text}}} {total!r}")
+                lines.append(f"{name}_count{{{label_text}}} {count}")
+
+        for name, (help_text, metric_type, label_names, _, _) in self._collectors.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (series_name, labels), value in sorted(values.items()):
+                if series_name == name:
+                    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+                    lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.get("metrics_started")
+        if started is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        labels = (request.blueprint or "", route, request.method, str(response.status_code))
+
+        self.observe("http_request_duration_seconds", labels, time.perf_counter() - started)
+        sql = g.get("sql_stats")
+        if sql is not None:
+            self.observe("http_request_db_seconds", labels, sql["seconds"])
+        if "metrics_serialization" in g:
+            self.observe("http_request_serialization_seconds", labels, g.metrics_serialization)
+        # Streamed responses have no length until they are sent
+        if response.content_length is not None:
+            self.observe("http_response_size_bytes", labels, response.content_length)
+        return response
+
+
+metrics = Metrics()
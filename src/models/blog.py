@@ -2,6 +2,34 @@ from datetime import datetime, timezone
 
 from init import db, ma, bcrypt
 from marshmallow import fields, validate
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+
+# Full-text search document of a blog, with the title weighted above the content.
+# The '{row}' placeholder is the row prefix, e.g. 'NEW.' inside the trigger.
+BLOG_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({row}content, '')), 'B')"
+)
+
+# PostgreSQL objects that keep blogs.search_vector up to date on insert and update
+BLOG_SEARCH_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION blogs_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {vector};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """.format(vector=BLOG_SEARCH_VECTOR_SQL.format(row="NEW.")),
+    "DROP TRIGGER IF EXISTS blogs_search_vector_trigger ON blogs",
+    """
+    CREATE TRIGGER blogs_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON blogs
+    FOR EACH ROW EXECUTE FUNCTION blogs_search_vector_update()
+    """,
+]
 
 class Blogs(db.Model):
     """
@@ -14,6 +42,9 @@ class Blogs(db.Model):
         status (str): The status of the blog post (e.g., "draft", "published").
         created_at (datetime): The timestamp when the blog post was created.
         updated_at (datetime): The timestamp when the blog post was last updated.
+        like_count (int): The number of likes on the blog post, maintained by the like routes.
+        comments_version (int): Incremented whenever the blog's comments change, for their ETag.
+        search_vector (tsvector): The full-text search document of the blog, maintained by a trigger.
         user_id (int): The foreign key linking to the User who owns the blog post.
 
     Relationships:
@@ -29,10 +60,17 @@ class Blogs(db.Model):
     # Attributes of the table
     blog_id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # Not loaded unless asked for, since listings often only need the title and status
+    content = deferred(db.Column(db.Text, nullable=False))
     status = db.Column(db.String(50), nullable=False, default="draft")
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, onupdate=lambda: datetime.now(timezone.utc))
+    # Denormalised like counter so the like total does not need a COUNT over likes
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Version of the blog's comment list, so its ETag does not need an aggregate over comments
+    comments_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Full-text search document, only populated on PostgreSQL and not loaded unless asked for
+    search_vector = deferred(db.Column(TSVECTOR().with_variant(db.Text(), "sqlite")))
     
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
 
@@ -43,6 +81,17 @@ class Blogs(db.Model):
     categories = db.relationship('Category', secondary='blog_category', back_populates="blogs", cascade="all")
     media = db.relationship('Media', back_populates='blog', cascade="all, delete-orphan")
 
+    # Indexes matching the filters and orderings of the blog listings, plus full-text search
+    __table_args__ = (
+        db.Index("ix_blogs_status_created_at", "status", "created_at", "blog_id"),
+        db.Index("ix_blogs_user_id_created_at", "user_id", "created_at", "blog_id"),
+        db.Index("ix_blogs_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+# Create the search trigger along with the table on PostgreSQL
+for statement in BLOG_SEARCH_DDL:
+    event.listen(Blogs.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
 class BlogSchema(ma.Schema):
     """
     Schema for validating and serialising Blog objects.
@@ -85,3 +134,5 @@ class BlogSchema(ma.Schema):
 blog_schema = BlogSchema()
 # To handle a list of blog objects
 blogs_schema = BlogSchema(many=True)
+# Relationships serialised by BlogSchema, eager loaded by the blog listings
+blog_schema_relationships = (Blogs.user,)
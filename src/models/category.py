@@ -2,6 +2,7 @@ from init import db, ma
 from models.blog import BlogSchema
 
 from marshmallow import fields, Schema
+from marshmallow.validate import Length
 
 # Category table model
 class Category(db.Model):
@@ -40,6 +41,11 @@ class BlogCategory(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('categories.category_id'), primary_key=True)
     blog_id = db.Column(db.Integer, db.ForeignKey('blogs.blog_id'), primary_key=True)
 
+    # The primary key starts with category_id, so lookups by blog need their own index
+    __table_args__ = (
+        db.Index("ix_blog_category_blog_id", "blog_id"),
+    )
+
 class CategorySchema(Schema):
     """
     Schema for validating and serialising Category objects.
@@ -60,7 +66,53 @@ class CategorySchema(Schema):
         fields = ("category_id", "category_name", "blogs")
 
 
+class CategorySummarySchema(Schema):
+    """
+    Schema for serialising a category without its blogs.
+
+    Fields:
+        category_id (int): The unique ID of the category.
+        category_name (str): The name of the category.
+        blog_count (int): The number of blogs in the category.
+    """
+    category_id = fields.Int(dump_only=True)
+    category_name = fields.Str(dump_only=True)
+    blog_count = fields.Int(dump_only=True)
+
+
+class BlogCategorySchema(Schema):
+    """
+    Schema for serialising a single blog/category association.
+
+    Fields:
+        category_id (int): The ID of the category.
+        blog_id (int): The ID of the blog.
+    """
+    category_id = fields.Int(dump_only=True)
+    blog_id = fields.Int(dump_only=True)
+
+
+class BlogCategoryBulkSchema(Schema):
+    """
+    Schema for validating a bulk change of blog/category associations.
+
+    Validations:
+        - category_ids: Must contain at least one category ID.
+        - blog_ids: Must contain at least one blog ID.
+    """
+    category_ids = fields.List(fields.Int(), required=True, validate=Length(min=1))
+    blog_ids = fields.List(fields.Int(), required=True, validate=Length(min=1))
+
+
 # To handle a single category object
 category_schema = CategorySchema()
 # To handle a list of category objects
-categories_schema = CategorySchema(many=True)
\ No newline at end of file
+categories_schema = CategorySchema(many=True)
+# To handle a list of category summaries
+category_summaries_schema = CategorySummarySchema(many=True)
+# To handle blog/category associations
+blog_category_schema = BlogCategorySchema()
+blog_categories_schema = BlogCategorySchema(many=True)
+blog_category_bulk_schema = BlogCategoryBulkSchema()
+# Relationships serialised by CategorySchema, eager loaded by the category listings
+category_schema_relationships = (Category.blogs,)
\ No newline at end of file
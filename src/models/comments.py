@@ -3,8 +3,13 @@ from datetime import datetime, timezone
 from init import db, ma, bcrypt
 
 from marshmallow import fields
+from sqlalchemy import event, select, update, func, cast, literal
+from sqlalchemy.orm.attributes import set_committed_value
 from marshmallow.validate import Length
 
+# Number of digits each comment ID takes up in a materialised path
+PATH_SEGMENT_WIDTH = 10
+
 # Comment table model
 class Comments(db.Model):
     """
@@ -17,10 +22,16 @@ class Comments(db.Model):
         updated_at (datetime): The timestamp when the comment was last updated.
         user_id (int): The foreign key linking to the User who authored the comment.
         blog_id (int): The foreign key linking to the Blog the comment belongs to.
+        parent_comment_id (int): The comment this comment replies to, or None for a top-level comment.
+        path (str): The materialised path of the comment: the zero-padded IDs of its ancestors
+            followed by its own ID. The replies to a comment are exactly the comments whose
+            path starts with its path, so a whole thread is one range scan of the path index.
     
     Relationships:
         user (User): The user who authored the comment.
         blogs (Blogs): The blog post the comment is associated with.
+        parent (Comments): The comment this comment replies to.
+        replies (Comments): The direct replies to the comment.
     """
     # Name of the table
     __tablename__ = "comments"
@@ -34,10 +45,138 @@ class Comments(db.Model):
     # Foreign keys linking to User and Blog
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
     blog_id = db.Column(db.Integer, db.ForeignKey('blogs.blog_id'), nullable=False)
+    parent_comment_id = db.Column(db.Integer, db.ForeignKey("comments.comment_id", ondelete="CASCADE"))
+
+    # Set once the comment has been inserted and its ID is known
+    path = db.Column(db.String)
 
     # Relationships of the table
     user = db.relationship("User", back_populates="comments")
     blogs = db.relationship('Blogs', back_populates='comments')
+    parent = db.relationship("Comments", remote_side=[comment_id], back_populates="replies")
+    replies = db.relationship("Comments", back_populates="parent", passive_deletes=True)
+
+    # Indexes for paging through the top-level comments of a blog, reading threads in order
+    # and finding a user's comments
+    __table_args__ = (
+        db.Index("ix_comments_blog_id_parent_created_at", "blog_id", "parent_comment_id", "created_at", "comment_id"),
+        db.Index("ix_comments_blog_id_path", "blog_id", "path"),
+        db.Index("ix_comments_user_id", "user_id"),
+    )
+
+    def thread_filter(self):
+        """
+        Builds the filter matching this comment and all of its replies, at any depth.
+
+        Comments created before paths were added have none until 'flask db comment-paths' is
+        run. Their replies are found by following parent_comment_id with a recursive query.
+
+        Returns:
+            ColumnElement: A range condition on the blog ID and materialised path.
+        """
+        if self.path is None:
+            thread = select(Comments.comment_id).where(Comments.comment_id == self.comment_id).cte("thread", recursive=True)
+            thread = thread.union_all(select(Comments.comment_id).where(Comments.parent_comment_id == thread.c.comment_id))
+            return Comments.comment_id.in_(select(thread.c.comment_id))
+
+        # Paths are digits only, so every path below this one sorts before the next ID at this depth
+        upper = f"{int(self.path) + 1:0{len(self.path)}d}"
+        return (Comments.blog_id == self.blog_id) & (Comments.path >= self.path) & (Comments.path < upper)
+
+
+@event.listens_for(Comments, "after_insert")
+def set_comment_path(mapper, connection, target):
+    """
+    Fills in the materialised path of a new comment from its parent's path and its own ID.
+    """
+    comments = Comments.__table__
+    parent_path = ""
+    if target.parent_comment_id is not None:
+        stmt = select(comments.c.path).where(comments.c.comment_id == target.parent_comment_id)
+        parent_path = connection.execute(stmt).scalar_one()
+        if parent_path is None:
+            # The parent predates paths, so its path is rebuilt from its ancestors
+            parent_path = _ancestor_path(connection, target.parent_comment_id)
+
+    path = parent_path + f"{target.comment_id:0{PATH_SEGMENT_WIDTH}d}"
+    # updated_at is set to itself so filling in the path does not count as an edit
+    stmt = update(comments).where(comments.c.comment_id == target.comment_id).values(path=path, updated_at=comments.c.updated_at)
+    connection.execute(stmt)
+    # Record the path as already saved so it is not written again on the next flush
+    set_committed_value(target, "path", path)
+
+def _ancestor_path(connection, comment_id):
+    """
+    Builds the materialised path of a comment from its chain of parents.
+
+    Args:
+        connection (Connection): The connection to read with.
+        comment_id (int): The ID of the comment.
+
+    Returns:
+        str: The path of the comment.
+    """
+    comments = Comments.__table__
+    chain = (
+        select(comments.c.comment_id, comments.c.parent_comment_id, literal(0).label("depth"))
+        .where(comments.c.comment_id == comment_id)
+        .cte("chain", recursive=True)
+    )
+    chain = chain.union_all(
+        select(comments.c.comment_id, comments.c.parent_comment_id, (chain.c.depth + 1).label("depth"))
+        .where(comments.c.comment_id == chain.c.parent_comment_id)
+    )
+    ids = connection.execute(select(chain.c.comment_id).order_by(chain.c.depth.desc())).scalars()
+    return "".join(f"{ancestor_id:0{PATH_SEGMENT_WIDTH}d}" for ancestor_id in ids)
+
+def fill_comment_paths(comment_ids=None):
+    """
+    Fills in the materialised paths of comments inserted without one, e.g. by a bulk import
+    or before paths were added.
+
+    Top-level comments are filled in first, then each level of replies below them, with one
+    UPDATE per level of nesting.
+
+    Args:
+        comment_ids (list): Only fill in these comments. All comments without a path if not given.
+
+    Returns:
+        int: The number of comments updated.
+    """
+    comments = Comments.__table__
+    parents = comments.alias("parents")
+    if db.session.get_bind().dialect.name == "postgresql":
+        segment = func.lpad(cast(comments.c.comment_id, db.Text), PATH_SEGMENT_WIDTH, "0")
+    else:
+        segment = func.printf(f"%0{PATH_SEGMENT_WIDTH}d", comments.c.comment_id)
+
+    missing = comments.c.path.is_(None)
+    if comment_ids is not None:
+        missing = missing & comments.c.comment_id.in_(comment_ids)
+
+    # updated_at is set to itself so filling in the path does not count as an edit
+    stmt = (
+        update(comments)
+        .where(missing, comments.c.parent_comment_id.is_(None))
+        .values(path=segment, updated_at=comments.c.updated_at)
+    )
+    total = db.session.execute(stmt).rowcount
+
+    parent_path = (
+        select(parents.c.path)
+        .where(parents.c.comment_id == comments.c.parent_comment_id)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(comments)
+        .where(missing, parent_path.is_not(None))
+        .values(path=parent_path + segment, updated_at=comments.c.updated_at)
+    )
+    while True:
+        updated = db.session.execute(stmt).rowcount
+        if not updated:
+            return total
+        total += updated
 
 class CommentSchema(ma.Schema):
     """
@@ -53,6 +192,7 @@ class CommentSchema(ma.Schema):
         - updated_at: The timestamp when the comment was last updated (read-only).
         - user: Nested data of the user who authored the comment (read-only).
         - blog_id: The ID of the blog post the comment is associated with (load-only).
+        - parent_comment_id: The ID of the comment this comment replies to (optional).
     """
     # validation 
     content = fields.String(required=True, validate=Length(min=1, max=500))
@@ -62,12 +202,15 @@ class CommentSchema(ma.Schema):
     # Nested relationship data
     user = fields.Nested("UserSchema", only=["user_id", "username"], dump_only=True)
     blog_id = fields.Int(load_only=True)
+    parent_comment_id = fields.Int(allow_none=True)
 
     class Meta:
         # What will be included in the output
-        fields = ("comment_id", "content", "created_at", "updated_at", "user", "blog_id")
+        fields = ("comment_id", "content", "created_at", "updated_at", "user", "blog_id", "parent_comment_id")
         load_only = ["blog_id"]
 
 # Single comment schema and list of comments schema
 comment_schema = CommentSchema()
-comments_schema = CommentSchema(many=True)
\ No newline at end of file
+comments_schema = CommentSchema(many=True)
+# Relationships serialised by CommentSchema, eager loaded by the comment listings
+comment_schema_relationships = (Comments.user,)
\ No newline at end of file
@@ -27,6 +27,11 @@ class Likes(db.Model):
     user = db.relationship('User', back_populates='likes')
     blogs = db.relationship('Blogs', back_populates='likes')
 
+    # The primary key starts with user_id, so lookups by blog need their own index
+    __table_args__ = (
+        db.Index("ix_likes_blog_id_created_at", "blog_id", "created_at"),
+    )
+
 # Marshmellow schema for serialisation and validation
 class LikesSchema(ma.Schema):
     """
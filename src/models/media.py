@@ -33,6 +33,11 @@ class Media(db.Model):
     # Relationships of the table
     blog = db.relationship('Blogs', back_populates='media')
 
+    # Index for listing the media of a blog
+    __table_args__ = (
+        db.Index("ix_media_blog_id_created_at", "blog_id", "created_at"),
+    )
+
 
 class MediaSchema(ma.Schema):
     """
@@ -37,6 +37,11 @@ class UserRole(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.role_id'), primary_key=True)
 
+    # The primary key starts with user_id, so lookups by role need their own index
+    __table_args__ = (
+        db.Index("ix_user_role_role_id", "role_id"),
+    )
+
 
 class RoleSchema(ma.Schema):
     """
@@ -1,7 +1,9 @@
 from datetime import datetime, timezone
 
 from models.roles import RoleSchema
-from init import db, ma, bcrypt
+from init import db, ma
+from password_hasher import password_hasher
+from caching import MISSING, role_cache
 
 from marshmallow import fields
 from marshmallow.validate import Regexp, Length
@@ -18,6 +20,7 @@ class User(db.Model):
         email (str): The unique email address of the user.
         password_hash (str): The hashed password of the user.
         created_at (datetime): The timestamp when the user was created.
+        role_version (int): Incremented whenever the user's roles change, to invalidate issued tokens.
     
     Relationships:
         roles (Role): The roles associated with the user (many-to-many).
@@ -29,6 +32,7 @@ class User(db.Model):
         set_password(password): Hashes and sets the user's password.
         check_password(password): Checks if the provided password matches the stored hash.
         has_role(role_name): Checks if the user has a specific role.
+        role_names(): Returns the names of the user's roles, using the role cache.
     """
     # The name of the table
     __tablename__ = "users"  
@@ -39,6 +43,7 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    role_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     # Relationships of the table
     roles = db.relationship('Role', secondary='user_role', back_populates='user')
@@ -51,23 +56,27 @@ class User(db.Model):
         """
         Hashes and sets the user's password.
 
+        Hashing runs in the password hasher's worker pool.
+
         Args:
             password (str): The plaintext password to be hashed and stored.
         """
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     #To check the password
     def check_password(self, password):
         """
         Verifies the password against the stored password hash.
 
+        Verification runs in the password hasher's worker pool.
+
         Args:
             password (str): The plaintext password to be checked.
 
         Returns:
             bool: True if the password matches, False otherwise.
         """
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
     
     # To check if user has a specific role
     def has_role(self, role_name):
@@ -80,7 +89,26 @@ class User(db.Model):
         Returns:
             bool: True if the user has the role, False otherwise.
         """
-        return any(role.role_name == role_name for role in self.roles)
+        return role_name in self.role_names()
+
+    # To get the names of the user's roles
+    def role_names(self):
+        """
+        Returns the names of the user's roles.
+
+        The names are kept in the per-process role cache, so the roles only have to be
+        loaded from the database once per cache period instead of on every check.
+
+        Returns:
+            frozenset: The names of the roles assigned to the user.
+        """
+        names = role_cache.get(self.user_id) if self.user_id is not None else MISSING
+        if names is MISSING:
+            names = frozenset(role.role_name for role in self.roles)
+            # Users that are not saved yet have no ID to cache under
+            if self.user_id is not None:
+                role_cache.set(self.user_id, names)
+        return names
     
 
 class UserSchema(ma.Schema):
@@ -127,4 +155,7 @@ class UserSchema(ma.Schema):
 user_schema = UserSchema()
 
 # to handle a list of user objects
-users_schema = UserSchema(many=True)
\ No newline at end of file
+users_schema = UserSchema(many=True)
+
+# Relationships serialised by UserSchema, eager loaded by the user listings
+user_schema_relationships = (User.roles,)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import tuple_
+
+from init import db
+
+# Default and maximum number of rows returned in a single page
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+class PaginationError(ValueError):
+    """
+    Raised when the cursor or limit supplied by the client is invalid.
+    """
+
+
+# Types of the values in a (created_at, id) cursor
+DEFAULT_CURSOR_TYPES = (datetime.fromisoformat, int)
+
+
+def encode_cursor(*values):
+    """
+    Encodes the position of a row into an opaque cursor string.
+
+    Args:
+        *values: The sort key values of the last row on the page, e.g. its created_at
+            timestamp and primary key.
+
+    Returns:
+        str: A URL-safe cursor that can be passed back as the 'cursor' query parameter.
+    """
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, cursor_types=DEFAULT_CURSOR_TYPES):
+    """
+    Decodes an opaque cursor string back into the sort key values of a row.
+
+    Args:
+        cursor (str): The cursor previously returned as 'next_cursor'.
+        cursor_types (tuple): A conversion function for each value in the cursor.
+
+    Returns:
+        tuple: The sort key values of the row the cursor points at.
+
+    Raises:
+        PaginationError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if len(values) != len(cursor_types):
+            raise ValueError("Wrong number of cursor values")
+        return tuple(convert(value) for convert, value in zip(cursor_types, values))
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+
+
+def pagination_requested():
+    """
+    Checks if the client asked for a paginated response.
+
+    Returns:
+        bool: True if a 'cursor' or 'limit' query parameter was supplied.
+    """
+    return "cursor" in request.args or "limit" in request.args
+
+
+def get_page_args(cursor_types=DEFAULT_CURSOR_TYPES):
+    """
+    Reads and validates the 'cursor' and 'limit' query parameters of the current request.
+
+    Args:
+        cursor_types (tuple): A conversion function for each value in the cursor.
+
+    Returns:
+        tuple: The decoded cursor position (or None for the first page) and the page limit.
+
+    Raises:
+        PaginationError: If the limit is not a positive integer or the cursor is malformed.
+    """
+    limit = request.args.get("limit", DEFAULT_PAGE_LIMIT)
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        raise PaginationError("Limit must be an integer")
+    if limit < 1:
+        raise PaginationError("Limit must be at least 1")
+
+    cursor = request.args.get("cursor")
+    position = decode_cursor(cursor, cursor_types) if cursor else None
+
+    return position, min(limit, MAX_PAGE_LIMIT)
+
+
+def paginate(stmt, created_column, id_column, position=None, limit=DEFAULT_PAGE_LIMIT):
+    """
+    Runs a select statement as a keyset (cursor) paginated query.
+
+    Rows are ordered by (created_at, id) and only rows after the cursor position are
+    fetched, so each page costs the same regardless of how deep into the listing it is.
+
+    Args:
+        stmt (Select): The select statement, already filtered.
+        created_column (Column): The created_at column to order by.
+        id_column (Column): The primary key column used to break ties.
+        position (tuple): The decoded cursor position, or None for the first page.
+        limit (int): The maximum number of rows to return.
+
+    Returns:
+        tuple: The list of rows on the page and the cursor of the next page (None on the last page).
+    """
+    if position is not None:
+        stmt = stmt.where(tuple_(created_column, id_column) > tuple_(*position))
+
+    # Fetch one extra row to find out if there is another page
+    stmt = stmt.order_by(created_column, id_column).limit(limit + 1)
+    rows = db.session.execute(stmt).scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+
+    return rows, next_cursor
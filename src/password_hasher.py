@@ -0,0 +1,143 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when too many password hashes are already queued, so the request should be shed.
+    """
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _check_password(password_hash, password):
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a dedicated pool of worker processes.
+
+    bcrypt is deliberately slow, so running it on the request thread lets a burst of logins
+    occupy every worker. The pool runs it in separate processes (outside the GIL) and limits
+    how many hashes may be in flight or queued at once. Once that limit is reached,
+    PasswordHasherBusy is raised so the route can answer 503 instead of stalling the app.
+
+    Config:
+        PASSWORD_POOL_SIZE (int): Number of worker processes. 0 runs bcrypt inline on the
+            request thread. Defaults to the number of CPUs.
+        PASSWORD_QUEUE_LIMIT (int): Maximum number of hashes in flight or waiting. Defaults
+            to four times the pool size.
+        BCRYPT_LOG_ROUNDS (int): The bcrypt cost factor. Defaults to 12.
+    """
+    def __init__(self, pool_size=0, queue_limit=None, rounds=12):
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.configure(pool_size, queue_limit, rounds)
+
+    def init_app(self, app):
+        """
+        Reads the pool configuration from the Flask app.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        pool_size = app.config.get("PASSWORD_POOL_SIZE", os.cpu_count() or 1)
+        self.configure(pool_size, app.config.get("PASSWORD_QUEUE_LIMIT"), app.config.get("BCRYPT_LOG_ROUNDS", 12))
+        app.extensions["password_hasher"] = self
+
+    def configure(self, pool_size, queue_limit=None, rounds=12):
+        """
+        Sets the pool size, queue limit and bcrypt cost, replacing any running pool.
+        """
+        self.shutdown()
+        self.pool_size = pool_size
+        self.queue_limit = queue_limit or max(pool_size, 1) * 4
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+
+    def _get_executor(self):
+        # The pool is started on first use so importing the app does not spawn processes
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Too many password operations in progress")
+        try:
+            if self.pool_size == 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """
+        Hashes a password with bcrypt.
+
+        Args:
+            password (str): The plaintext password.
+
+        Returns:
+            str: The bcrypt hash of the password.
+
+        Raises:
+            PasswordHasherBusy: If the queue limit has been reached.
+        """
+        return self._run(_hash_password, password, self.rounds)
+
+    def hash_many(self, passwords):
+        """
+        Hashes a batch of passwords, spread over all the worker processes.
+
+        Meant for bulk jobs such as imports: it is not subject to the queue limit, so it
+        should not be called from request handlers.
+
+        Args:
+            passwords (list): The plaintext passwords.
+
+        Returns:
+            list: The bcrypt hashes, in the same order as the passwords.
+        """
+        rounds = [self.rounds] * len(passwords)
+        if self.pool_size == 0:
+            return list(map(_hash_password, passwords, rounds))
+        chunksize = max(1, len(passwords) // (self.pool_size * 4))
+        return list(self._get_executor().map(_hash_password, passwords, rounds, chunksize=chunksize))
+
+    def check(self, password_hash, password):
+        """
+        Verifies a password against a bcrypt hash.
+
+        Args:
+            password_hash (str): The stored bcrypt hash.
+            password (str): The plaintext password to check.
+
+        Returns:
+            bool: True if the password matches, False otherwise.
+
+        Raises:
+            PasswordHasherBusy: If the queue limit has been reached.
+        """
+        return self._run(_check_password, password_hash, password)
+
+    def shutdown(self):
+        """
+        Stops the worker processes, if they were started.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,247 @@
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, TimestampSigner
+from sqlalchemy import event, text
+from sqlalchemy.sql.dml import UpdateBase
+
+from metrics import metrics
+
+# HTTP methods whose requests are sent to a replica unless the route says otherwise
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+REPLICA_SELECTIONS = ("round_robin", "least_loaded")
+
+# Cookie, and header for clients without cookies, carrying the signed time of the client's last write
+LAST_WRITE_COOKIE = "db_last_write"
+LAST_WRITE_HEADER = "X-DB-Last-Write"
+
+# Replication lag of a PostgreSQL standby. A standby that has replayed everything it
+# received is not behind, however old its last replayed transaction is.
+POSTGRES_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class RoutingSession(Session):
+    """
+    Session that runs the reads of read-only requests on the replica chosen for the request.
+
+    Flushes and INSERT, UPDATE and DELETE statements always go to the primary, so a read-only
+    route that writes after all still writes to the right database.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and not isinstance(clause, UpdateBase):
+            replica = g.get("db_replica")
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(fn):
+    """
+    Marks a route as read-only, so it is sent to a replica whatever its HTTP method.
+    """
+    fn.db_read_only = True
+    return fn
+
+
+def use_primary(fn):
+    """
+    Marks a route as needing the primary, e.g. a GET that must see the latest writes.
+    """
+    fn.db_read_only = False
+    return fn
+
+
+class Replica:
+    """
+    The health and replication lag of one read replica.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lag = 0.0
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+
+    def mark_down(self, seconds):
+        self.down_until = time.monotonic() + seconds
+
+
+class ReplicaRouter:
+    """
+    Sends the database reads of read-only requests to read replicas.
+
+    Replicas are the binds named in DATABASE_REPLICA_URIS. Requests using a read method
+    (GET, HEAD, OPTIONS), or to routes marked with @read_only, read from one replica, chosen
+    per request in turn ("round_robin") or by fewest connections in use ("least_loaded").
+    Routes marked with @use_primary always use the primary. A cached response read from a
+    replica may be older than the tag versions it is cached under, so the response cache
+    keeps it for at most REPLICA_MAX_LAG_SECONDS.
+
+    Each replica's lag is checked at most every REPLICA_LAG_CHECK_SECONDS. A replica that is
+    further behind than REPLICA_MAX_LAG_SECONDS, fails its check or loses a connection is
+    skipped for REPLICA_RETRY_SECONDS; with no replica available, reads go to the primary.
+
+    After a client makes a successful write, its reads go to the primary for
+    REPLICA_STICKY_SECONDS, so it sees its own changes before the replicas catch up. The
+    time of the write is handed to the client, signed, in the db_last_write cookie and the
+    X-DB-Last-Write header, and sent back in either, so this works whichever worker
+    process serves the next request.
+
+    Config:
+        REPLICA_SELECTION (str): "round_robin" (default) or "least_loaded".
+        REPLICA_MAX_LAG_SECONDS (float): Lag above which a replica is skipped. Defaults to 5.
+        REPLICA_LAG_CHECK_SECONDS (float): Time between lag checks of a replica. Defaults to 5.
+        REPLICA_RETRY_SECONDS (float): Time a failed replica is skipped for. Defaults to 30.
+        REPLICA_STICKY_SECONDS (float): Time a client reads from the primary after a write. Defaults to 10.
+    """
+    def __init__(self):
+        self.replicas = []
+        self.selection = "round_robin"
+        self.max_lag = 5.0
+        self.lag_check_interval = 5.0
+        self.retry_after = 30.0
+        self.sticky = 10.0
+        self._signer = None
+        self._turn = itertools.count()
+
+    def init_app(self, app):
+        """
+        Reads the replica configuration and starts routing the requests of the app.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.selection = app.config.get("REPLICA_SELECTION", "round_robin")
+        self.max_lag = app.config.get("REPLICA_MAX_LAG_SECONDS", 5.0)
+        self.lag_check_interval = app.config.get("REPLICA_LAG_CHECK_SECONDS", 5.0)
+        self.retry_after = app.config.get("REPLICA_RETRY_SECONDS", 30.0)
+        self.sticky = app.config.get("REPLICA_STICKY_SECONDS", 10.0)
+        self._signer = TimestampSigner(app.config.get("JWT_SECRET_KEY") or app.secret_key or "", salt=LAST_WRITE_COOKIE)
+        self.replicas = [Replica(name) for name in app.config.get("SQLALCHEMY_BINDS", {}) if name.startswith("replica_")]
+        app.extensions["replica_router"] = self
+
+        if not self.replicas:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        db = app.extensions["sqlalchemy"]
+        with app.app_context():
+            for replica in self.replicas:
+                engine = db.engines[replica.name]
+                event.listen(engine, "handle_error", self._replica_error(replica))
+
+        metrics.register_collector(
+            "db_replica_up", "Whether a replica is used for reads.", "gauge", ("replica",),
+            lambda: {(name,): int(state["up"]) for name, state in self.status().items()},
+            # Down if any worker is skipping it
+            aggregation="livemin",
+        )
+        metrics.register_collector(
+            "db_replica_lag_seconds", "Replication lag at a replica's last check.", "gauge", ("replica",),
+            lambda: {(name,): state["lag"] for name, state in self.status().items()},
+            aggregation="livemax",
+        )
+
+    def _replica_error(self, replica):
+        def handle_error(context):
+            # A lost connection usually means the replica is down or failing over
+            if context.is_disconnect:
+                replica.mark_down(self.retry_after)
+        return handle_error
+
+    def _check_lag(self, replica):
+        engine = current_app.extensions["sqlalchemy"].engines[replica.name]
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name == "postgresql":
+                    replica.lag = float(connection.execute(text(POSTGRES_LAG_SQL)).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    replica.lag = 0.0
+        except Exception as e:
+            current_app.logger.warning(f"Replica {replica.name} failed its health check: {e}")
+            replica.mark_down(self.retry_after)
+        replica.checked_at = time.monotonic()
+
+    def _available(self, replica):
+        now = time.monotonic()
+        if replica.down_until > now:
+            return False
+        if now - replica.checked_at >= self.lag_check_interval:
+            # One request checks the replica, the others go on with the last known lag
+            if replica._lock.acquire(blocking=False):
+                try:
+                    self._check_lag(replica)
+                finally:
+                    replica._lock.release()
+        return replica.down_until <= time.monotonic() and replica.lag <= self.max_lag
+
+    def choose(self):
+        """
+        Chooses the replica for a read-only request.
+
+        Returns:
+            str: The bind name of the replica, or None if none is available.
+        """
+        available = [replica for replica in self.replicas if self._available(replica)]
+        if not available:
+            return None
+        if self.selection == "least_loaded":
+            engines = current_app.extensions["sqlalchemy"].engines
+            return min(available, key=lambda replica: engines[replica.name].pool.checkedout()).name
+        return available[next(self._turn) % len(available)].name
+
+    def _is_read_only(self):
+        view = current_app.view_functions.get(request.endpoint)
+        read_only = getattr(view, "db_read_only", None)
+        if read_only is not None:
+            return read_only
+        return request.method in READ_METHODS
+
+    def _wrote_recently(self):
+        token = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+        if not token:
+            return False
+        try:
+            self._signer.unsign(token, max_age=self.sticky)
+        except BadSignature:
+            # Also raised once the token is older than REPLICA_STICKY_SECONDS
+            return False
+        return True
+
+    def _start_request(self):
+        g.db_replica = None
+        if self._is_read_only() and not self._wrote_recently():
+            g.db_replica = self.choose()
+
+    def _finish_request(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            token = self._signer.sign("write").decode()
+            response.set_cookie(LAST_WRITE_COOKIE, token, max_age=int(self.sticky) + 1, httponly=True, samesite="Lax")
+            response.headers[LAST_WRITE_HEADER] = token
+        response.headers["X-DB-Route"] = g.get("db_replica") or "primary"
+        return response
+
+    def status(self):
+        """
+        Returns the state of each replica, as used for routing.
+
+        Returns:
+            dict: The lag in seconds and availability of each replica.
+        """
+        now = time.monotonic()
+        return {
+            replica.name: {"lag": replica.lag, "up": replica.down_until <= now}
+            for replica in self.replicas
+        }
+
+
+replica_router = ReplicaRouter()
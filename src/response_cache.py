@@ -0,0 +1,238 @@
+import json
+import threading
+from fnmatch import fnmatchcase
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import Response, current_app, g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from caching import MISSING, LRUCache
+from metrics import metrics
+
+
+class LocalKeyValueStore:
+    """
+    An in-memory stand-in for a shared key-value server such as Redis or Memcached.
+
+    It offers the small part of a Redis client's interface that KeyValueBackend uses, so a
+    real client can be passed to KeyValueBackend in its place to share the cache between
+    worker processes.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def scan_iter(self, match="*", count=None):
+        with self._lock:
+            keys = [key for key in self._data if fnmatchcase(key, match)]
+        return iter(keys)
+
+    def dbsize(self):
+        with self._lock:
+            return len(self._data)
+
+
+class KeyValueBackend:
+    """
+    Response cache backend that stores entries as JSON in a key-value store.
+
+    Args:
+        client: A Redis-style client with get, set (with 'ex' in seconds), delete and scan_iter.
+            Defaults to a LocalKeyValueStore.
+        prefix (str): Prefix added to every key so the cache can share a store with other data.
+    """
+    # Number of keys deleted per DELETE when the cache is cleared
+    CLEAR_BATCH_SIZE = 500
+
+    def __init__(self, client=None, prefix="response-cache:"):
+        self.client = client if client is not None else LocalKeyValueStore()
+        self.prefix = prefix
+
+    def get(self, key, default=MISSING):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return default
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        # Only the keys under the prefix are removed, the store may hold other data
+        batch = []
+        for key in self.client.scan_iter(match=self.prefix + "*", count=self.CLEAR_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) == self.CLEAR_BATCH_SIZE:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+
+class ResponseCache:
+    """
+    Caches the JSON responses of read-mostly routes.
+
+    Each cached route names the tags its response depends on, e.g. "blog:1". Write routes
+    invalidate those tags once their changes are committed. Invalidation does not search for
+    entries: every tag has a version token which is part of the cache key, so replacing the
+    token makes all entries built under the old one unreachable, and they expire on their own.
+
+    Any object with get, set, delete and clear methods can be the backend. The default
+    is an in-process LRUCache, which each worker process keeps to itself. KeyValueBackend
+    stores entries in a key-value store that can be shared between workers.
+
+    The hits and misses of each cached route are exported on /metrics as
+    response_cache_requests_total.
+
+    Config:
+        RESPONSE_CACHE_ENABLED (bool): Turns caching on. On by default.
+        RESPONSE_CACHE_BACKEND (str): "lru" (default) or "kv" for a KeyValueBackend.
+        RESPONSE_CACHE_SIZE (int): Maximum number of entries in the LRU backend. Defaults to 10000.
+    """
+    # How long an unused tag version is kept
+    TAG_TTL = 24 * 60 * 60
+
+    def __init__(self, backend=None):
+        self.enabled = True
+        self.backend = backend if backend is not None else LRUCache(maxsize=10000)
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def init_app(self, app):
+        """
+        Reads the cache configuration from the Flask app.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self.enabled = app.config.get("RESPONSE_CACHE_ENABLED", True)
+        if app.config.get("RESPONSE_CACHE_BACKEND", "lru") == "kv":
+            self.backend = KeyValueBackend()
+        else:
+            self.backend = LRUCache(maxsize=app.config.get("RESPONSE_CACHE_SIZE", 10000))
+        app.extensions["response_cache"] = self
+
+        metrics.register_collector(
+            "response_cache_requests_total", "Lookups of cached routes by result.", "counter", ("route", "result"),
+            self._request_counts,
+        )
+
+    def _request_counts(self):
+        counts = {(name, "hit"): count for name, count in list(self._hits.items())}
+        counts.update({(name, "miss"): count for name, count in list(self._misses.items())})
+        return counts
+
+    def _tag_version(self, tag):
+        version = self.backend.get("tag:" + tag)
+        if version is MISSING:
+            version = str(time.time_ns())
+            self.backend.set("tag:" + tag, version, ttl=self.TAG_TTL)
+        return version
+
+    def invalidate(self, *tags):
+        """
+        Makes every cached response that depends on any of the tags stale.
+
+        Args:
+            *tags (str): The tags to invalidate, e.g. "blog:1".
+        """
+        for tag in tags:
+            self.backend.set("tag:" + tag, str(time.time_ns()), ttl=self.TAG_TTL)
+
+    def clear(self):
+        """
+        Removes every cached response.
+        """
+        self.backend.clear()
+
+    def cached(self, name, ttl, tags=(), per_user=False):
+        """
+        Decorator that caches the successful (200) responses of a route.
+
+        Place it below @jwt_required() so the token is checked before the cache is read.
+        The cache key is made from the route name, its URL arguments, its query string and,
+        if per_user is set, the current user's ID. A response read from a read replica is
+        cached for at most REPLICA_MAX_LAG_SECONDS, since the replica may not have the
+        changes that the current tag versions stand for yet.
+
+        Args:
+            name (str): A name for the route, used in the cache key and the metrics.
+            ttl (int): The number of seconds a response is cached for.
+            tags (callable): Called with the route's URL arguments, returns the tags the
+                response depends on.
+            per_user (bool): Cache a separate response for each user.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+
+                scope = str(get_jwt_identity()) if per_user else "*"
+                versions = [self._tag_version(tag) for tag in (tags(**kwargs) if tags else ())]
+                key = ":".join([
+                    "response",
+                    name,
+                    json.dumps(kwargs, sort_keys=True),
+                    json.dumps(sorted(request.args.items(multi=True))),
+                    scope,
+                    *versions,
+                ])
+
+                entry = self.backend.get(key)
+                if entry is not MISSING:
+                    self._hits[name] += 1
+                    response = Response(entry["body"], status=200, mimetype=entry["mimetype"])
+                    response.headers["X-Cache"] = "HIT"
+                    return response
+
+                self._misses[name] += 1
+                response = make_response(fn(*args, **kwargs))
+                entry_ttl = self._entry_ttl(ttl)
+                if response.status_code == 200 and entry_ttl > 0:
+                    try:
+                        entry = {"body": response.get_data(as_text=True), "mimetype": response.mimetype}
+                        self.backend.set(key, entry, ttl=entry_ttl)
+                    except Exception as e:
+                        # A failing cache must not fail the request
+                        current_app.logger.warning(f"Response cache write failed: {e}")
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
+
+    def _entry_ttl(self, ttl):
+        if g.get("db_replica") is None:
+            return ttl
+        # Whole seconds, as Redis expects; a lag limit under a second means no caching
+        return min(ttl, int(current_app.extensions["replica_router"].max_lag))
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,174 @@
+import time
+
+from flask import current_app
+from marshmallow import fields
+
+from metrics import record_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Attribute holding the compiled dump function of a schema instance, as (schema, function),
+# so it is released together with the schema, e.g. a sparse fieldset schema dropped from
+# its cache. The schema is kept next to the function because marshmallow copies schema
+# instances, attributes included, and a copy may have other fields.
+COMPILED_ATTRIBUTE = "_compiled_dump"
+
+
+def _format_seconds(value, fmt):
+    # Same output as strftime('%Y-%m-%d %H:%M:%S'), which is zero padded only from year 1000
+    if value.year >= 1000:
+        return value.isoformat(" ", "seconds")[:19]
+    return value.strftime(fmt)
+
+
+def _field_expression(field, value, ref, namespace):
+    """
+    Builds the Python expression that serialises one value the way the field would.
+
+    Args:
+        field (Field): The bound marshmallow field.
+        value (str): The expression holding the raw value.
+        ref (str): The namespace name the field is stored under, used by the fallbacks.
+        namespace (dict): Globals of the generated function, extended with what it needs.
+
+    Returns:
+        str: The expression.
+    """
+    namespace[ref] = field
+    # Any value the fast path does not cover goes through the field itself
+    fallback = f"{ref}._serialize({value}, None, None)"
+
+    if type(field) is fields.Inferred:
+        return f"({value} if {value} is None or type({value}) is int or type({value}) is str else {fallback})"
+    if type(field) is fields.String:
+        return f"({value} if {value} is None or type({value}) is str else {fallback})"
+    if type(field) is fields.Integer and not field.as_string:
+        return f"(None if {value} is None else int({value}))"
+    if type(field) is fields.DateTime:
+        fmt = field.format or field.DEFAULT_FORMAT
+        if fmt == "%Y-%m-%d %H:%M:%S":
+            namespace["_format_seconds"] = _format_seconds
+            return f"(None if {value} is None else _format_seconds({value}, {fmt!r}))"
+        if fmt == "iso":
+            return f"(None if {value} is None else {value}.isoformat())"
+        return fallback
+    if type(field) is fields.Nested:
+        nested = compile_schema(field.schema)
+        namespace[ref + "_dump"] = nested
+        if field.many or field.schema.many:
+            return f"(None if {value} is None else [{ref}_dump(item) for item in {value}])"
+        return f"(None if {value} is None else {ref}_dump({value}))"
+    if type(field) is fields.List and type(field.inner) is fields.Nested:
+        nested = compile_schema(field.inner.schema)
+        namespace[ref + "_dump"] = nested
+        return f"(None if {value} is None else [{ref}_dump(item) for item in {value}])"
+    return fallback
+
+
+def compile_schema(schema):
+    """
+    Generates a function that serialises one object exactly like schema.dump does.
+
+    The function reads each attribute once and builds the output dict in a single
+    expression, so marshmallow's per-field dispatch only runs for values outside the
+    common types (strings, integers, None, datetimes and nested schemas).
+
+    Args:
+        schema (Schema): The marshmallow schema instance to compile.
+
+    Returns:
+        callable: A function taking one object and returning its serialised dict.
+    """
+    compiled_for, dump_one = getattr(schema, COMPILED_ATTRIBUTE, (None, None))
+    if compiled_for is schema:
+        return dump_one
+
+    namespace = {}
+    reads = []
+    items = []
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        attribute = field.attribute or name
+        key = field.data_key if field.data_key is not None else name
+        reads.append(f"    v{index} = obj.{attribute}")
+        items.append(f"{key!r}: {_field_expression(field, f'v{index}', f'f{index}', namespace)}")
+
+    source = "def dump_one(obj):\n" + "\n".join(reads) + "\n    return {" + ", ".join(items) + "}\n"
+    exec(compile(source, f"<serializer {type(schema).__name__}>", "exec"), namespace)
+    compiled = namespace["dump_one"]
+
+    def dump_one(obj):
+        try:
+            return compiled(obj)
+        except AttributeError:
+            # Objects missing an attribute are left to marshmallow, which omits the field
+            return schema.dump(obj, many=False)
+
+    setattr(schema, COMPILED_ATTRIBUTE, (schema, dump_one))
+    return dump_one
+
+
+def dump(schema, obj, many=None):
+    """
+    Serialises an object or list of objects with the compiled version of a schema.
+
+    Produces the same output as schema.dump(obj, many=many).
+
+    Args:
+        schema (Schema): The marshmallow schema instance.
+        obj: The object, or list of objects, to serialise.
+        many (bool): Whether obj is a list. Defaults to the schema's own setting.
+
+    Returns:
+        dict | list: The serialised data.
+    """
+    dump_one = compile_schema(schema)
+    started = time.perf_counter()
+    if schema.many if many is None else many:
+        data = [dump_one(item) for item in obj]
+    else:
+        data = dump_one(obj)
+    record_serialization(time.perf_counter() - started)
+    return data
+
+
+def json_response(data):
+    """
+    Encodes data as a JSON response, byte for byte the same as jsonify(data).
+
+    orjson is used when it is installed and the app uses compact, unsorted output. Its
+    output is only kept if it is plain ASCII, since jsonify escapes everything else;
+    otherwise, and for types orjson does not handle, the app's JSON provider is used.
+    The data must not contain floats, whose formatting differs between the encoders,
+    unless they are rounded to four decimal places; the output of dump() never does for
+    the schemas in models/.
+
+    Args:
+        data (dict | list): The data to encode.
+
+    Returns:
+        Response: The JSON response.
+    """
+    started = time.perf_counter()
+    try:
+        return _json_response(data)
+    finally:
+        record_serialization(time.perf_counter() - started)
+
+
+def _json_response(data):
+    provider = current_app.json
+    compact = provider.compact or (provider.compact is None and not current_app.debug)
+
+    if orjson is not None and compact and not provider.sort_keys and provider.ensure_ascii:
+        try:
+            body = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            body = None
+        if body is not None and body.isascii() and b"\x7f" not in body:
+            return current_app.response_class(body + b"\n", mimetype=provider.mimetype)
+
+    return provider.response(data)
@@ -0,0 +1,153 @@
+import heapq
+import json
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from init import db
+
+
+class SQLStats:
+    """
+    Records the SQL queries each request runs.
+
+    Listens to the cursor events of every engine and keeps, per request, the number of
+    queries, the total time spent in the database and the slowest statements. Each response
+    gets a Server-Timing header with the query count and database time next to the total
+    request time, and a structured (JSON) log line. Requests over the query or time budget
+    are logged as warnings, so chatty endpoints show up without a profiler.
+
+    Single statements slower than SQL_SLOW_QUERY_MS are logged as warnings as well, also
+    outside requests, e.g. from CLI commands.
+
+    Config:
+        SQL_STATS_ENABLED (bool): Turns the instrumentation on. On by default.
+        SQL_QUERY_BUDGET (int): Queries a request may run before it is flagged. Defaults to 20.
+        SQL_TIME_BUDGET_MS (int): Database time a request may use before it is flagged. Defaults to 200.
+        SQL_SLOW_QUERY_MS (int): Time above which a single statement is logged. Defaults to 100.
+    """
+    # Number of slowest statements kept per request
+    SLOWEST = 3
+
+    # Statements are cut to this length in the logs
+    MAX_STATEMENT_LENGTH = 300
+
+    def __init__(self):
+        self.enabled = True
+        self.query_budget = 20
+        self.time_budget = 0.2
+        self.slow_query = 0.1
+        self._app = None
+        self._engines = set()
+
+    def init_app(self, app):
+        """
+        Reads the configuration and hooks into the engines and requests of the app.
+
+        Args:
+            app (Flask): The Flask application.
+        """
+        self._app = app
+        self.enabled = app.config.get("SQL_STATS_ENABLED", True)
+        self.query_budget = app.config.get("SQL_QUERY_BUDGET", 20)
+        self.time_budget = app.config.get("SQL_TIME_BUDGET_MS", 200) / 1000
+        self.slow_query = app.config.get("SQL_SLOW_QUERY_MS", 100) / 1000
+        app.extensions["sql_stats"] = self
+
+        if not self.enabled:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            # Every bind has its own engine
+            for engine in db.engines.values():
+                self.instrument(engine)
+
+    def instrument(self, engine):
+        """
+        Adds the query listeners to an engine, once.
+
+        Args:
+            engine (Engine): The SQLAlchemy engine.
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's execution context, which a failed statement simply drops
+        if context is not None:
+            context.sql_stats_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "sql_stats_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        if elapsed >= self.slow_query:
+            self._app.logger.warning(json.dumps({
+                "event": "slow_query",
+                "ms": round(elapsed * 1000, 1),
+                "statement": statement[:self.MAX_STATEMENT_LENGTH],
+            }))
+
+        if not has_request_context() or "sql_stats" not in g:
+            return
+        stats = g.sql_stats
+        stats["queries"] += 1
+        stats["seconds"] += elapsed
+        # A min-heap of the slowest statements, the counter breaks ties between equal times
+        entry = (elapsed, stats["queries"], statement)
+        if len(stats["slowest"]) < self.SLOWEST:
+            heapq.heappush(stats["slowest"], entry)
+        else:
+            heapq.heappushpop(stats["slowest"], entry)
+
+    def _start_request(self):
+        g.sql_stats = {"queries": 0, "seconds": 0.0, "slowest": [], "started": time.perf_counter()}
+
+    def _finish_request(self, response):
+        stats = g.get("sql_stats")
+        if stats is None:
+            return response
+
+        duration = time.perf_counter() - stats["started"]
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["queries"]} queries", app;dur={duration * 1000:.1f}',
+        )
+
+        over_budget = []
+        if stats["queries"] > self.query_budget:
+            over_budget.append("queries")
+        if stats["seconds"] > self.time_budget:
+            over_budget.append("db_time")
+
+        record = {
+            "event": "request_sql",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "queries": stats["queries"],
+            "db_ms": round(stats["seconds"] * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            "slowest": [
+                {"ms": round(elapsed * 1000, 1), "statement": statement[:self.MAX_STATEMENT_LENGTH]}
+                for elapsed, _, statement in sorted(stats["slowest"], reverse=True)
+            ],
+        }
+        if over_budget:
+            record["over_budget"] = over_budget
+            self._app.logger.warning(json.dumps(record))
+        else:
+            self._app.logger.info(json.dumps(record))
+        return response
+
+
+sql_stats = SQLStats()
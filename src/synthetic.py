@@ -0,0 +1,277 @@
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import select
+
+from init import db
+from models.user import User
+from models.roles import Role, UserRole
+from models.blog import Blogs
+from models.category import Category, BlogCategory
+from models.comments import Comments, PATH_SEGMENT_WIDTH
+from models.likes import Likes
+from models.media import Media
+from importer import allocate_ids, load_rows
+from password_hasher import password_hasher
+
+DISTRIBUTIONS = ("zipf", "uniform")
+
+# Password of every generated user
+SCALE_PASSWORD = "password123"
+
+# Roles given to every generated user
+SCALE_ROLES = ("Author", "Reader")
+
+# Generated activity falls in the 'days' before this fixed date, so a seed always gives
+# the same rows
+SCALE_END = datetime(2025, 1, 1)
+
+# Share of published blogs, the rest are drafts
+PUBLISHED_SHARE = 0.8
+
+# Share of comments that reply to an earlier comment on the same blog
+REPLY_SHARE = 0.3
+
+MEDIA_TYPES = ("image", "image", "image", "video", "audio")
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog travel food code python data garden coffee "
+    "morning city river mountain music guide review tips story week project design build "
+    "simple better learning notes thoughts update first year home health money market"
+).split()
+
+
+def zipf_weights(n, exponent):
+    """
+    Returns the cumulative weights of ranks 1 to n under a Zipf (power-law) distribution.
+
+    Args:
+        n (int): The number of ranks.
+        exponent (float): The skew. 0 is uniform, around 1 matches most popularity data.
+
+    Returns:
+        list: The cumulative weights, ending with their total.
+    """
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def _share(weights, index):
+    # The share of the total taken by one rank, from the cumulative weights
+    previous = weights[index - 1] if index else 0
+    return (weights[index] - previous) / weights[-1]
+
+
+def _round(rng, value):
+    # Rounds up with a probability equal to the fraction, so totals come out right on average
+    whole = int(value)
+    return whole + (rng.random() < value - whole)
+
+
+def _pick(rng, weights):
+    # The index of a rank drawn from the cumulative weights
+    return bisect_left(weights, rng.random() * weights[-1])
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+class ScaleDataset:
+    """
+    Generates a large, skewed dataset for load testing and index tuning.
+
+    Blog popularity follows a Zipf distribution, so a few blogs get most of the likes and
+    comments while most get very few, as in production. Authors and commenters are also
+    drawn with a Zipf skew over the users. Everything is drawn from one random generator,
+    so the same seed and arguments always produce the same rows.
+
+    Rows are added after any existing data and loaded in bulk, with COPY on PostgreSQL,
+    one batch of blogs (and their likes, comments, categories and media) per transaction.
+
+    Args:
+        users (int): The number of users to create.
+        blogs (int): The number of blogs to create.
+        likes (int): The total number of likes, spread over the blogs. A blog cannot have
+            more likes than there are generated users.
+        comments (int): The total number of comments, spread over the blogs.
+        likes_dist (str): "zipf" or "uniform" spread of the likes over the blogs.
+        comments_dist (str): "zipf" or "uniform" spread of the comments over the blogs.
+        exponent (float): The skew of the Zipf distributions.
+        categories_per_blog (int): The most categories a blog is linked to.
+        media_per_blog (float): The average number of media rows per blog.
+        days (int): The number of days the activity is spread over.
+        seed (int): The random seed.
+        prefix (str): Prefix of the generated usernames and emails, which must be unused.
+    """
+    def __init__(self, users, blogs, likes=0, comments=0, likes_dist="zipf", comments_dist="zipf",
+                 exponent=1.1, categories_per_blog=3, media_per_blog=0.5, days=365, seed=0, prefix="scale"):
+        if users < 1 or blogs < 0 or likes < 0 or comments < 0:
+            raise ValueError("Users must be at least 1 and the other counts at least 0")
+        if likes_dist not in DISTRIBUTIONS or comments_dist not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution. Available distributions: {', '.join(DISTRIBUTIONS)}")
+
+        self.users = users
+        self.blogs = blogs
+        self.likes = likes
+        self.comments = comments
+        self.likes_dist = likes_dist
+        self.comments_dist = comments_dist
+        self.exponent = exponent
+        self.categories_per_blog = categories_per_blog
+        self.media_per_blog = media_per_blog
+        self.days = days
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+
+    def _per_blog(self, total, dist, weights, rank):
+        if dist == "uniform":
+            return _round(self.rng, total / self.blogs)
+        return _round(self.rng, total * _share(weights, rank))
+
+    def _load_users(self):
+        roles = dict(db.session.execute(select(Role.role_name, Role.role_id)).all())
+        missing = [name for name in SCALE_ROLES if name not in roles]
+        if missing:
+            raise ValueError(f"Missing roles: {', '.join(missing)}. Run 'flask db seed' first")
+
+        # Every user gets the same password, hashing millions of them would take hours
+        password_hash = password_hasher.hash(SCALE_PASSWORD)
+        start = SCALE_END - timedelta(days=self.days)
+        user_ids = allocate_ids(User.user_id, self.users)
+
+        rows = [
+            {
+                "user_id": user_id,
+                "username": f"{self.prefix}{number}",
+                "email": f"{self.prefix}{number}@example.com",
+                "password_hash": password_hash,
+                "created_at": start + timedelta(seconds=number),
+                "role_version": 0,
+            }
+            for number, user_id in enumerate(user_ids)
+        ]
+        load_rows(User.__table__, rows)
+        load_rows(UserRole.__table__, [
+            {"user_id": user_id, "role_id": roles[name]} for user_id in user_ids for name in SCALE_ROLES
+        ])
+        db.session.commit()
+        return user_ids
+
+    def generate(self, batch_size=1000, on_batch=None):
+        """
+        Generates and loads the dataset.
+
+        Args:
+            batch_size (int): The number of blogs loaded per transaction, with their likes,
+                comments, categories and media.
+            on_batch (callable): Called after each batch with the running totals.
+
+        Returns:
+            dict: The number of rows created in each table and the elapsed time in seconds.
+        """
+        rng = self.rng
+        started = time.perf_counter()
+        totals = {"users": 0, "blogs": 0, "likes": 0, "comments": 0, "blog_category": 0, "media": 0, "seconds": 0.0}
+
+        categories = list(db.session.execute(select(Category.category_id).order_by(Category.category_id)).scalars())
+        user_ids = self._load_users()
+        totals["users"] = len(user_ids)
+
+        user_weights = zipf_weights(len(user_ids), self.exponent)
+        category_weights = zipf_weights(len(categories), self.exponent) if categories else []
+        blog_weights = zipf_weights(self.blogs, self.exponent) if self.blogs else []
+        # Popularity ranks are shuffled so popular blogs are not simply the oldest ones
+        ranks = list(range(self.blogs))
+        rng.shuffle(ranks)
+
+        window = self.days * 24 * 60 * 60
+        start = SCALE_END - timedelta(days=self.days)
+
+        for offset in range(0, self.blogs, batch_size):
+            count = min(batch_size, self.blogs - offset)
+            blog_ids = allocate_ids(Blogs.blog_id, count)
+            blogs, likes, comments, blog_categories, media = [], [], [], [], []
+
+            for blog_id, rank in zip(blog_ids, ranks[offset:offset + count]):
+                created_at = start + timedelta(seconds=rng.random() * window)
+                remaining = (SCALE_END - created_at).total_seconds()
+
+                like_users = rng.sample(user_ids, min(len(user_ids), self._per_blog(self.likes, self.likes_dist, blog_weights, rank)))
+                for user_id in like_users:
+                    likes.append({"user_id": user_id, "blog_id": blog_id, "created_at": created_at + timedelta(seconds=rng.random() * remaining)})
+
+                blogs.append({
+                    "blog_id": blog_id,
+                    "user_id": user_ids[_pick(rng, user_weights)],
+                    "title": _text(rng, rng.randint(3, 8)).capitalize(),
+                    "content": _text(rng, rng.randint(50, 600)),
+                    "status": "published" if rng.random() < PUBLISHED_SHARE else "draft",
+                    "like_count": len(like_users),
+                    "created_at": created_at,
+                    "updated_at": None,
+                })
+
+                if categories:
+                    linked = {categories[_pick(rng, category_weights)] for _ in range(rng.randint(1, self.categories_per_blog))}
+                    blog_categories.extend({"category_id": category_id, "blog_id": blog_id} for category_id in sorted(linked))
+
+                for number in range(_round(rng, self.media_per_blog)):
+                    media_type = rng.choice(MEDIA_TYPES)
+                    media.append({
+                        "media_url": f"https://media.example.com/blogs/{blog_id}/{number}.{media_type}",
+                        "media_type": media_type,
+                        "created_at": created_at,
+                        "blog_id": blog_id,
+                    })
+
+                # Comment times are sorted so replies always come after their parent
+                times = sorted(rng.random() * remaining for _ in range(self._per_blog(self.comments, self.comments_dist, blog_weights, rank)))
+                comments.append((blog_id, created_at, times))
+
+            load_rows(Blogs.__table__, blogs)
+            load_rows(BlogCategory.__table__, blog_categories)
+            load_rows(Media.__table__, media)
+            load_rows(Likes.__table__, likes)
+            comment_rows = self._comment_rows(comments, user_ids, user_weights)
+            load_rows(Comments.__table__, comment_rows)
+            db.session.commit()
+
+            totals["blogs"] += len(blogs)
+            totals["likes"] += len(likes)
+            totals["comments"] += len(comment_rows)
+            totals["blog_category"] += len(blog_categories)
+            totals["media"] += len(media)
+            totals["seconds"] = time.perf_counter() - started
+            if on_batch:
+                on_batch(totals)
+
+        totals["seconds"] = time.perf_counter() - started
+        return totals
+
+    def _comment_rows(self, comments, user_ids, user_weights):
+        rng = self.rng
+        comment_ids = iter(allocate_ids(Comments.comment_id, sum(len(times) for _, _, times in comments)))
+        rows = []
+        for blog_id, created_at, times in comments:
+            thread = []
+            for seconds in times:
+                comment_id = next(comment_ids)
+                parent = rng.choice(thread) if thread and rng.random() < REPLY_SHARE else None
+                # Paths are known up front, so they are written directly instead of by fill_comment_paths
+                path = (parent["path"] if parent else "") + str(comment_id).zfill(PATH_SEGMENT_WIDTH)
+                row = {
+                    "comment_id": comment_id,
+                    "blog_id": blog_id,
+                    "user_id": user_ids[_pick(rng, user_weights)],
+                    "parent_comment_id": parent["comment_id"] if parent else None,
+                    "content": _text(rng, rng.randint(5, 60)),
+                    "created_at": created_at + timedelta(seconds=seconds),
+                    "updated_at": None,
+                    "path": path,
+                }
+                thread.append(row)
+                rows.append(row)
+        return rows
@@ -0,0 +1,72 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# The app imports its modules relative to the src directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from init import db
+from main import create_app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    An app on a fresh SQLite database file, created and seeded with 'flask db seed'.
+
+    Response caching is off so every request reaches the database.
+    """
+    monkeypatch.setenv("DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("JWT_SECRET_KEY", "test-secret-key-of-at-least-32-bytes")
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SQL_STATS_ENABLED", "false")
+    monkeypatch.setenv("PASSWORD_POOL_SIZE", "1")
+
+    app = create_app()
+    runner = app.test_cli_runner()
+    runner.invoke(args=["db", "create"])
+    runner.invoke(args=["db", "seed"])
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    """
+    Authorization headers of the seeded user John (Super Admin).
+    """
+    response = client.post("/auth/login", json={"email": "john@email.com", "password": "abc123"})
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+@pytest.fixture
+def count_queries(app):
+    """
+    Counts the SQL statements run inside a 'with count_queries() as queries:' block.
+    """
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+    return counter
@@ -0,0 +1,74 @@
+from sqlalchemy import update
+
+from init import db
+from models.comments import Comments, fill_comment_paths
+
+
+def add_comment(client, auth_headers, blog_id, content, parent=None):
+    response = client.post(f"/comments/blogs/{blog_id}", json={"content": content, "parent_comment_id": parent}, headers=auth_headers)
+    assert response.status_code == 201
+    return response.json["comment_id"]
+
+
+def make_threads(client, auth_headers):
+    """
+    Adds two threads to blog 1, with a reply to the first added after the second was started,
+    and a comment on blog 2.
+    """
+    first = add_comment(client, auth_headers, 1, "first")
+    reply = add_comment(client, auth_headers, 1, "reply", first)
+    add_comment(client, auth_headers, 1, "reply to reply", reply)
+    second = add_comment(client, auth_headers, 1, "second")
+    add_comment(client, auth_headers, 1, "late reply", first)
+    add_comment(client, auth_headers, 1, "reply to second", second)
+    add_comment(client, auth_headers, 2, "other blog")
+    return first, second
+
+
+def contents(response):
+    assert response.status_code == 200
+    return [comment["content"] for comment in response.json]
+
+
+def test_blog_comments_list_replies_under_their_parent(client, auth_headers):
+    make_threads(client, auth_headers)
+
+    response = client.get("/comments/blogs/1", headers=auth_headers)
+
+    assert contents(response) == ["first", "reply", "reply to reply", "late reply", "second", "reply to second"]
+
+
+def test_thread_is_the_comment_and_its_replies_only(client, auth_headers):
+    first, second = make_threads(client, auth_headers)
+
+    assert contents(client.get(f"/comments/{first}/thread", headers=auth_headers)) == ["first", "reply", "reply to reply", "late reply"]
+    assert contents(client.get(f"/comments/{second}/thread", headers=auth_headers)) == ["second", "reply to second"]
+
+
+def test_threads_without_paths_are_followed_by_parent(app, client, auth_headers):
+    first, _ = make_threads(client, auth_headers)
+    # As if the comments were created before paths were added
+    with app.app_context():
+        db.session.execute(update(Comments).values(path=None))
+        db.session.commit()
+
+    assert contents(client.get(f"/comments/{first}/thread", headers=auth_headers)) == ["first", "reply", "reply to reply", "late reply"]
+
+    # A reply to a comment without a path is given its full path
+    newest = add_comment(client, auth_headers, 1, "newest reply", first)
+    with app.app_context():
+        assert fill_comment_paths() == 7
+        db.session.commit()
+        first_path = db.session.get(Comments, first).path
+        assert db.session.get(Comments, newest).path.startswith(first_path)
+
+    assert contents(client.get(f"/comments/{first}/thread", headers=auth_headers))[-1] == "newest reply"
+
+
+def test_deleting_a_comment_deletes_its_thread(client, auth_headers):
+    first, _ = make_threads(client, auth_headers)
+
+    assert client.delete(f"/comments/{first}", headers=auth_headers).status_code == 200
+
+    assert contents(client.get("/comments/blogs/1", headers=auth_headers)) == ["second", "reply to second"]
+    assert contents(client.get("/comments/blogs/2", headers=auth_headers)) == ["other blog"]
@@ -0,0 +1,68 @@
+import pytest
+
+# Later than any change made by the tests, so only a wrong Last-Modified could make it match
+FUTURE = "Fri, 01 Jan 2100 00:00:00 GMT"
+
+CONDITIONAL_LISTINGS = ("/comments/blogs/1", "/comments/blogs/1?limit=2", "/blogs/1")
+
+
+def add_comment(client, auth_headers, content, parent=None):
+    response = client.post("/comments/blogs/1", json={"content": content, "parent_comment_id": parent}, headers=auth_headers)
+    assert response.status_code == 201
+    return response.json["comment_id"]
+
+
+def revalidate(client, auth_headers, url, etag):
+    return client.get(url, headers={**auth_headers, "If-None-Match": etag}).status_code
+
+
+@pytest.fixture
+def comments(client, auth_headers):
+    first = add_comment(client, auth_headers, "first")
+    reply = add_comment(client, auth_headers, "reply", first)
+    add_comment(client, auth_headers, "newest")
+    return first, reply
+
+
+@pytest.mark.parametrize("url", CONDITIONAL_LISTINGS)
+def test_unchanged_response_is_not_modified(client, auth_headers, comments, url):
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    assert revalidate(client, auth_headers, url, response.headers["ETag"]) == 304
+
+
+def test_deleting_an_older_comment_changes_the_comments(client, auth_headers, comments):
+    _, reply = comments
+    etag = client.get("/comments/blogs/1", headers=auth_headers).headers["ETag"]
+
+    assert client.delete(f"/comments/{reply}", headers=auth_headers).status_code == 200
+
+    assert revalidate(client, auth_headers, "/comments/blogs/1", etag) == 200
+
+
+@pytest.mark.parametrize("url", CONDITIONAL_LISTINGS)
+def test_renaming_changes_the_response(client, auth_headers, comments, url):
+    etag = client.get(url, headers=auth_headers).headers["ETag"]
+
+    assert client.put("/auth/users", json={"username": "johnny"}, headers=auth_headers).status_code == 200
+
+    response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert "johnny" in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("url", CONDITIONAL_LISTINGS)
+def test_if_modified_since_is_not_trusted_where_changes_keep_timestamps(client, auth_headers, comments, url):
+    # Deletes and renames change these responses without moving a timestamp
+    response = client.get(url, headers=auth_headers)
+    assert "Last-Modified" not in response.headers
+
+    _, reply = comments
+    client.delete(f"/comments/{reply}", headers=auth_headers)
+    client.put("/auth/users", json={"username": "johnny"}, headers=auth_headers)
+
+    response = client.get(url, headers={**auth_headers, "If-Modified-Since": FUTURE})
+    assert response.status_code == 200
+    assert "johnny" in response.get_data(as_text=True)
@@ -0,0 +1,49 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func, select
+
+from init import db
+from models.user import User
+from models.blog import Blogs
+from models.likes import Likes
+from utils import role_claims
+
+USERS = 8
+BLOG_IDS = (1, 3)
+
+
+def make_tokens(app):
+    with app.app_context():
+        users = [User(username=f"liker{number}", email=f"liker{number}@email.com", password_hash="unused") for number in range(USERS)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [create_access_token(identity=user.user_id, additional_claims=role_claims(user)) for user in users]
+
+
+def test_parallel_likes_keep_like_count_in_step(app, client):
+    tokens = make_tokens(app)
+
+    def toggle(worker):
+        # Two workers per user, so the same like is added and removed concurrently
+        token = tokens[worker % USERS]
+        randomiser = random.Random(worker)
+        statuses = []
+        worker_client = app.test_client()
+        for _ in range(25):
+            method = randomiser.choice((worker_client.post, worker_client.delete))
+            response = method("/likes/", json={"blog_id": randomiser.choice(BLOG_IDS)}, headers={"Authorization": f"Bearer {token}"})
+            statuses.append(response.status_code)
+        return statuses
+
+    with ThreadPoolExecutor(max_workers=USERS * 2) as executor:
+        statuses = [status for result in executor.map(toggle, range(USERS * 2)) for status in result]
+
+    assert 201 in statuses and 200 in statuses
+
+    with app.app_context():
+        for blog_id in BLOG_IDS:
+            like_count = db.session.execute(select(Blogs.like_count).where(Blogs.blog_id == blog_id)).scalar()
+            likes = db.session.execute(select(func.count()).where(Likes.blog_id == blog_id)).scalar()
+            assert like_count == likes
@@ -0,0 +1,55 @@
+import pytest
+
+from init import db
+from models.user import User
+from models.roles import Role
+from models.blog import Blogs
+from models.comments import Comments
+from models.likes import Likes
+
+# Listings whose query count must not depend on the number of rows they return
+LISTINGS = (
+    "/blogs/status/published",
+    "/blogs/user/1",
+    "/comments/blogs/1",
+    "/likes/users/blog/1",
+    "/auth/users",
+)
+
+
+def add_rows(app, count):
+    """
+    Adds users with a role, a published blog, a comment and a like on blog 1 each,
+    and a blog by user 1 per user, so every listing grows with count.
+    """
+    with app.app_context():
+        reader = db.session.query(Role).filter_by(role_name="Reader").one()
+        start = db.session.query(User).count()
+        for number in range(start, start + count):
+            user = User(username=f"user{number}", email=f"user{number}@email.com", password_hash="unused")
+            user.roles.append(reader)
+            db.session.add(user)
+            db.session.add(Blogs(title=f"Blog {number}", content="Content", status="published", user=user))
+            db.session.add(Blogs(title=f"John's blog {number}", content="Content", status="published", user_id=1))
+            db.session.add(Comments(content=f"Comment {number}", blog_id=1, user=user))
+            db.session.add(Likes(blog_id=1, user=user))
+        db.session.commit()
+
+
+@pytest.mark.parametrize("url", LISTINGS)
+def test_listing_query_count_is_constant(app, client, auth_headers, count_queries, url):
+    add_rows(app, 2)
+    # The first request also reads the user's role version, which is then cached
+    client.get(url, headers=auth_headers)
+    with count_queries() as few:
+        response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    small = len(response.json)
+
+    add_rows(app, 20)
+    with count_queries() as many:
+        response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json) > small
+
+    assert len(many) == len(few), many
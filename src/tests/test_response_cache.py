@@ -0,0 +1,64 @@
+import pytest
+
+from response_cache import response_cache
+
+
+@pytest.fixture
+def app(app):
+    # The shared fixture turns caching off, these tests need it on
+    response_cache.enabled = True
+    yield app
+    response_cache.enabled = False
+
+
+def get(client, auth_headers, url):
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize("url", ["/blogs/1", "/comments/blogs/1", "/roles/"])
+def test_second_request_is_a_hit(client, auth_headers, url):
+    assert get(client, auth_headers, url).headers["X-Cache"] == "MISS"
+    assert get(client, auth_headers, url).headers["X-Cache"] == "HIT"
+
+
+def test_updating_a_blog_invalidates_it(client, auth_headers):
+    get(client, auth_headers, "/blogs/1")
+    get(client, auth_headers, "/blogs/2")
+
+    response = client.put("/blogs/1", json={"title": "Updated title"}, headers=auth_headers)
+    assert response.status_code == 200
+
+    response = get(client, auth_headers, "/blogs/1")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["title"] == "Updated title"
+    # Other blogs stay cached
+    assert get(client, auth_headers, "/blogs/2").headers["X-Cache"] == "HIT"
+
+
+def test_adding_a_comment_invalidates_the_blog_comments(client, auth_headers):
+    get(client, auth_headers, "/comments/blogs/1")
+
+    response = client.post("/comments/blogs/1", json={"content": "New comment"}, headers=auth_headers)
+    assert response.status_code == 201
+
+    response = get(client, auth_headers, "/comments/blogs/1")
+    assert response.headers["X-Cache"] == "MISS"
+    assert [comment["content"] for comment in response.json] == ["New comment"]
+
+
+def test_renaming_a_user_invalidates_their_blogs_and_comments(client, auth_headers):
+    client.post("/comments/blogs/1", json={"content": "A comment"}, headers=auth_headers)
+    get(client, auth_headers, "/blogs/1")
+    get(client, auth_headers, "/comments/blogs/1")
+
+    response = client.put("/auth/users", json={"username": "johnny"}, headers=auth_headers)
+    assert response.status_code == 200
+
+    blog = get(client, auth_headers, "/blogs/1")
+    assert blog.headers["X-Cache"] == "MISS"
+    assert blog.json["user"]["username"] == "johnny"
+    comments = get(client, auth_headers, "/comments/blogs/1")
+    assert comments.headers["X-Cache"] == "MISS"
+    assert comments.json[0]["user"]["username"] == "johnny"
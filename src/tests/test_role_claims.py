@@ -0,0 +1,29 @@
+from flask_jwt_extended import decode_token
+from sqlalchemy import delete
+
+from init import db
+from models.user import User
+from models.roles import UserRole
+from utils import bump_role_version
+
+
+def test_login_after_revocation_elsewhere_issues_current_roles(app, client, auth_headers):
+    # This process has John's roles cached
+    assert client.get("/roles/cache", headers=auth_headers).status_code == 200
+
+    # Another worker revokes his roles, so this process's role cache is not cleared
+    with app.app_context():
+        db.session.execute(delete(UserRole).where(UserRole.user_id == 1))
+        bump_role_version([1])
+        db.session.commit()
+
+    response = client.post("/auth/login", json={"email": "john@email.com", "password": "abc123"})
+    token = response.json["access_token"]
+
+    with app.app_context():
+        claims = decode_token(token)
+        assert claims["roles"] == []
+        assert claims["role_version"] == db.session.get(User, 1).role_version
+
+    response = client.get("/roles/cache", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
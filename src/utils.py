@@ -1,44 +1,168 @@
 from functools import wraps
 
-from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import get_jwt
 from flask import jsonify
-from sqlalchemy import select
+from sqlalchemy import select, update
 
-from init import db
+from init import db, jwt
+from caching import MISSING, role_cache, role_version_cache
 from models.user import User
+from models.roles import UserRole
+from models.blog import Blogs
+
+def role_claims(user):
+    """
+    Builds the additional JWT claims that carry the user's roles.
+
+    Args:
+        user (User): The user the token is issued to.
+
+    Returns:
+        dict: The user's role names and the role version they were read at.
+    """
+    # Read the roles from the database rather than the role cache, which may still hold
+    # roles that another worker has revoked, and refresh both caches with what was read
+    names = frozenset(role.role_name for role in user.roles)
+    if user.user_id is not None:
+        role_cache.set(user.user_id, names)
+        role_version_cache.set(user.user_id, user.role_version)
+    return {"roles": sorted(names), "role_version": user.role_version}
+
+def current_user_has_role(*role_names):
+    """
+    Checks the roles in the current JWT without querying the database.
+
+    Args:
+        *role_names (str): The role names to look for.
+
+    Returns:
+        bool: True if the token carries at least one of the roles, False otherwise.
+    """
+    token_roles = get_jwt().get("roles", [])
+    return any(role_name in token_roles for role_name in role_names)
+
+def bump_role_version(user_ids):
+    """
+    Increments the role version of users so tokens issued with their old roles are rejected.
+
+    The cached roles are not touched here. Call invalidate_role_caches once the transaction
+    has been committed, otherwise a concurrent request can cache the old version again.
+
+    Args:
+        user_ids (list | Select): The IDs of the users whose roles changed, or a select of them.
+    """
+    stmt = update(User).where(User.user_id.in_(user_ids)).values(role_version=User.role_version + 1)
+    db.session.execute(stmt)
+
+def invalidate_role_caches(user_id=None):
+    """
+    Drops the cached role names and role version of a user, or of every user.
+
+    Args:
+        user_id (int): The ID of the user whose roles changed or who was deleted.
+            If omitted, the caches are cleared for all users.
+    """
+    if user_id is None:
+        role_cache.clear()
+        role_version_cache.clear()
+    else:
+        role_cache.delete(user_id)
+        role_version_cache.delete(user_id)
+
+def bump_comments_version(blog_ids):
+    """
+    Increments the comments version of blogs so the ETags of their comment lists change.
+
+    Call it in the same transaction as any change to what the comment lists show: comments
+    added or deleted, or a commenter renamed.
+
+    Args:
+        blog_ids (list | set | Select): The IDs of the blogs whose comments changed, or a select of them.
+    """
+    blogs = Blogs.__table__
+    stmt = (
+        update(blogs)
+        .where(blogs.c.blog_id.in_(blog_ids))
+        .values(comments_version=blogs.c.comments_version + 1, updated_at=blogs.c.updated_at)
+    )
+    db.session.execute(stmt)
+
+def bump_role_version_for_role(role_id):
+    """
+    Increments the role version of every user that holds a role.
+
+    Args:
+        role_id (int): The ID of the role that was changed or removed.
+    """
+    bump_role_version(select(UserRole.user_id).where(UserRole.role_id == role_id))
+
+@jwt.token_in_blocklist_loader
+def check_role_version(jwt_header, jwt_payload):
+    """
+    Rejects tokens whose roles are out of date.
+
+    Each token carries the role version of its user at the time it was issued. If the
+    user's roles have changed since (or the user has been deleted), the token is treated
+    as revoked and the user has to log in again. Versions are cached per process for
+    ROLE_VERSION_CACHE_SECONDS, which bounds how long another worker can honour stale roles.
+
+    Returns:
+        bool: True if the token must be rejected, False otherwise.
+    """
+    token_version = jwt_payload.get("role_version")
+    if token_version is None:
+        return True
+
+    user_id = jwt_payload["sub"]
+    current_version = role_version_cache.get(user_id)
+    if current_version is MISSING:
+        stmt = select(User.role_version).where(User.user_id == user_id)
+        current_version = db.session.execute(stmt).scalar_one_or_none()
+        role_version_cache.set(user_id, current_version)
+
+    return current_version != token_version
 
 def admin_required(f):
     """
     Decorator to ensure that a user has 'Admin' or 'Super Admin' role.
     
     This decorator checks if the current user, based on the JWT token, has the required 
-    admin privileges. It first retrieves the user's identity from the token, then fetches 
-    the user from the database. If the user does not have 'Admin' or 'Super Admin' roles, 
-    access to the route is denied.
+    admin privileges. The roles are read from the token claims, so no database query is 
+    needed. If the user does not have 'Admin' or 'Super Admin' roles, access to the route 
+    is denied.
     
     Returns:
         - If the user is authenticated and has the correct role(s), the wrapped route 
           function is executed.
-        - If the user is not authenticated or lacks the required role, an appropriate 
-          error response is returned.
+        - If the user lacks the required role, an appropriate error response is returned.
     """
     @wraps(f)
     def wrapper(*args, **kwargs):
-        # Get the current user from token
-        current_user_id = get_jwt_identity()
-        # Get the current user from db
-        stmt = select(User).where(User.user_id == current_user_id)
-        current_user = db.session.execute(stmt).scalar_one_or_none()
-
-        # If the user is not found in the database, return a 404 error
-        if not current_user:
-            return jsonify({"error": "User not found"}), 404
-        
         # Make sure user is Admin or Super Admin
-        if not current_user.has_role("Admin") and not current_user.has_role("Super Admin"):
+        if not current_user_has_role("Admin", "Super Admin"):
             return jsonify({"error": "Admin access required"}), 403
         
         # If the user is authorised, proceed with executing the wrapped route function
         return f(*args, **kwargs)
     
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+def insert_or_ignore(model):
+    """
+    Builds an INSERT statement that skips rows which would violate a unique or primary key constraint.
+
+    The dialect specific insert construct is chosen from the bind of the current session, so the
+    statement renders as 'INSERT ... ON CONFLICT DO NOTHING' on both PostgreSQL and SQLite.
+
+    Args:
+        model (db.Model): The model to insert into.
+
+    Returns:
+        Insert: The insert statement with the ON CONFLICT DO NOTHING clause applied.
+    """
+    if db.session.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+
+    return insert(model).on_conflict_do_nothing()